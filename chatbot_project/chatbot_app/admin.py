@@ -1,5 +1,7 @@
-from django.contrib import admin
-from .models import ChatSession, ChatMessage, UserPreference, ChatbotConfig
+from django.contrib import admin, messages
+from django.db.models import Count
+from .models import ChatSession, ChatMessage, UserPreference, ChatbotConfig, EmbeddingGeneration, IngestionJob
+from .generations import GenerationError, activate_generation
 
 @admin.register(ChatSession)
 class ChatSessionAdmin(admin.ModelAdmin):
@@ -8,9 +10,13 @@ class ChatSessionAdmin(admin.ModelAdmin):
     search_fields = ['session_id', 'user__username']
     readonly_fields = ['created_at', 'updated_at']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(message_total=Count('messages'))
+    
     def message_count(self, obj):
-        return obj.messages.count()
+        return obj.message_total
     message_count.short_description = 'Messages'
+    message_count.admin_order_field = 'message_total'
 
 @admin.register(ChatMessage)
 class ChatMessageAdmin(admin.ModelAdmin):
@@ -25,7 +31,7 @@ class ChatMessageAdmin(admin.ModelAdmin):
 
 @admin.register(UserPreference)
 class UserPreferenceAdmin(admin.ModelAdmin):
-    list_display = ['user', 'preferred_language', 'theme', 'chat_history_enabled', 'notifications_enabled']
+    list_display = ['user', 'preferred_language', 'theme', 'chat_history_enabled', 'notifications_enabled', 'llm_tokens_per_hour']
     list_filter = ['preferred_language', 'theme', 'chat_history_enabled', 'notifications_enabled']
     search_fields = ['user__username']
 
@@ -34,4 +40,31 @@ class ChatbotConfigAdmin(admin.ModelAdmin):
     list_display = ['name', 'model_name', 'temperature', 'max_tokens', 'is_active', 'created_at']
     list_filter = ['is_active', 'model_name', 'created_at']
     search_fields = ['name', 'model_name']
-    readonly_fields = ['created_at', 'updated_at']
\ No newline at end of file
+    readonly_fields = ['created_at', 'updated_at']
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'created_by', 'processed_documents', 'total_documents',
+                    'total_chunks', 'documents_per_second', 'chunks_per_second', 'created_at']
+    list_filter = ['status', 'created_at']
+    readonly_fields = ['started_at', 'finished_at']
+
+@admin.register(EmbeddingGeneration)
+class EmbeddingGenerationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'embedding_model', 'status', 'is_active', 'vector_dimension', 'quantization', 'chunk_size',
+                    'document_count', 'chunk_count', 'built_at', 'activated_at']
+    list_filter = ['status', 'embedding_model', 'quantization']
+    readonly_fields = ['status', 'is_active', 'previous', 'document_count', 'chunk_count', 'error',
+                       'built_at', 'activated_at']
+    actions = ['activate']
+    
+    @admin.action(description='Activate selected generation')
+    def activate(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, 'Select exactly one generation to activate', messages.ERROR)
+            return
+        try:
+            generation = activate_generation(queryset.get().id)
+            self.message_user(request, f'Activated {generation}')
+        except GenerationError as e:
+            self.message_user(request, str(e), messages.ERROR)
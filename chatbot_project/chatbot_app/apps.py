@@ -1,5 +1,7 @@
-
 # chatbot_app/apps.py - FIXED VERSION
+import os
+import sys
+
 from django.apps import AppConfig
 
 class ChatbotAppConfig(AppConfig):
@@ -13,4 +15,21 @@ class ChatbotAppConfig(AppConfig):
         #     import chatbot_app.signals
         # except ImportError:
         #     pass
-        pass
\ No newline at end of file
+        from django.conf import settings
+
+        # Registers the SQLite connection pragmas and the user and quota cache invalidation
+        from . import authentication, db, throttling  # noqa: F401
+
+        # runserver's autoreloader parent process should not schedule jobs or warm models
+        if 'runserver' in sys.argv and os.environ.get('RUN_MAIN') != 'true':
+            return
+
+        # In-process fallback scheduler when Celery beat is not in use
+        if getattr(settings, 'SCHEDULER_AUTOSTART', False) and not getattr(settings, 'USE_CELERY', False):
+            from .scheduler import start_background_scheduler
+            start_background_scheduler()
+
+        # Load the active chat model into Ollama before the first chat needs it
+        from .ollama import ollama_settings, start_prewarm
+        if ollama_settings()['prewarm']:
+            start_prewarm()
@@ -0,0 +1,176 @@
+# chatbot_app/archive.py
+import gzip
+import json
+import logging
+import os
+from datetime import date
+from itertools import groupby
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.utils.dateparse import parse_datetime
+
+from .models import ChatArchiveSegment, ChatMessage, ChatSession
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FIELDS = ('id', 'message_type', 'content', 'timestamp', 'metadata')
+
+
+def _archive_settings():
+    archive = getattr(settings, 'CHAT_ARCHIVE', {})
+    return {
+        'directory': archive.get('DIRECTORY', 'chat_archive'),
+        'batch_size': archive.get('BATCH_SIZE', 1000),
+    }
+
+
+def _absolute_path(relative_path):
+    return os.path.join(settings.MEDIA_ROOT, relative_path)
+
+
+def _segment_path(session_id, month):
+    directory = _archive_settings()['directory']
+    return os.path.join(directory, f'{month:%Y}', f'{month:%m}', f'session-{session_id}.jsonl.gz')
+
+
+def _month_of(timestamp):
+    return date(timestamp.year, timestamp.month, 1)
+
+
+def _archive_line(row):
+    # DjangoJSONEncoder cuts timestamps to milliseconds; isoformat() keeps the
+    # microseconds, so archived rows order and page like the hot rows they were
+    return json.dumps(dict(row, timestamp=row['timestamp'].isoformat()), cls=DjangoJSONEncoder) + '\n'
+
+
+def archive_session_messages(session_id, cutoff):
+    """
+    Move the messages of one session older than ``cutoff`` into its monthly
+    archive files and delete them from the hot table.
+
+    Files are appended to as extra gzip members, so re-archiving a month that
+    already has a segment is cheap. Returns the number of archived messages.
+    """
+    batch_size = _archive_settings()['batch_size']
+    archived = 0
+    while True:
+        rows = list(
+            ChatMessage.objects.filter(session_id=session_id, timestamp__lt=cutoff)
+            .order_by('timestamp', 'id')
+            .values(*ARCHIVE_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return archived
+
+        for month, month_rows in groupby(rows, key=lambda row: _month_of(row['timestamp'])):
+            month_rows = list(month_rows)
+            relative_path = _segment_path(session_id, month)
+            absolute_path = _absolute_path(relative_path)
+            os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
+            with open(absolute_path, 'ab') as raw_file:
+                with gzip.GzipFile(fileobj=raw_file, mode='ab') as archive_file:
+                    for row in month_rows:
+                        archive_file.write(_archive_line(row).encode('utf-8'))
+                raw_file.flush()
+                os.fsync(raw_file.fileno())
+
+            # Only drop the hot rows once the file and its segment are recorded
+            with transaction.atomic():
+                segment, created = ChatArchiveSegment.objects.select_for_update().get_or_create(
+                    session_id=session_id,
+                    month=month,
+                    defaults={
+                        'file_path': relative_path,
+                        'message_count': len(month_rows),
+                        'first_timestamp': month_rows[0]['timestamp'],
+                        'last_timestamp': month_rows[-1]['timestamp'],
+                    }
+                )
+                if not created:
+                    segment.message_count += len(month_rows)
+                    segment.first_timestamp = min(segment.first_timestamp, month_rows[0]['timestamp'])
+                    segment.last_timestamp = max(segment.last_timestamp, month_rows[-1]['timestamp'])
+                    segment.save()
+                ChatMessage.objects.filter(id__in=[row['id'] for row in month_rows]).delete()
+                ChatSession.objects.filter(id=session_id).update(
+                    archived_message_count=F('archived_message_count') + len(month_rows)
+                )
+            archived += len(month_rows)
+
+
+def archive_messages_before(cutoff):
+    """Archive every message older than ``cutoff``; returns (messages, sessions)"""
+    # Read up front: iterating a cursor over the table being deleted from
+    # is unsafe on SQLite
+    session_ids = list(
+        ChatMessage.objects.filter(timestamp__lt=cutoff)
+        .order_by().values_list('session_id', flat=True).distinct()
+    )
+    messages = sessions = 0
+    for session_id in session_ids:
+        count = archive_session_messages(session_id, cutoff)
+        if count:
+            messages += count
+            sessions += 1
+    return messages, sessions
+
+
+def _read_segment(segment):
+    with gzip.open(_absolute_path(segment.file_path), 'rt', encoding='utf-8') as archive_file:
+        rows = [json.loads(line) for line in archive_file if line.strip()]
+    # An interrupted archive run may have appended rows that stayed in the
+    # hot table and were archived again later, so keep one copy of each id
+    unique_rows = {}
+    for row in rows:
+        row['timestamp'] = parse_datetime(row['timestamp'])
+        unique_rows[row['id']] = row
+    return sorted(unique_rows.values(), key=lambda row: (row['timestamp'], row['id']))
+
+
+def iter_archived_messages(session, since=None):
+    """
+    Yield archived messages of ``session`` as dicts in (timestamp, id) order.
+
+    Segments whose messages all precede ``since`` are skipped without being
+    read, so paging forward through a long history only opens the files it
+    needs.
+    """
+    if not session.archived_message_count:
+        return
+    segments = session.archive_segments.order_by('month')
+    if since is not None:
+        segments = segments.filter(last_timestamp__gte=since)
+    for segment in segments:
+        try:
+            rows = _read_segment(segment)
+        except (OSError, ValueError) as e:
+            logger.error("Error reading chat archive %s: %s", segment.file_path, e)
+            continue
+        if not rows:
+            continue
+        # A run that wrote the file but failed before deleting the hot rows
+        # leaves them in both places until the next run; the hot copy wins
+        hot_ids = set(ChatMessage.objects.filter(
+            session=session, timestamp__range=(rows[0]['timestamp'], rows[-1]['timestamp'])
+        ).values_list('id', flat=True))
+        yield from (row for row in rows if row['id'] not in hot_ids)
+
+
+def expire_segments(segments):
+    """Delete archive segments and their files; returns the number of messages dropped"""
+    dropped = 0
+    for segment in segments.iterator():
+        with transaction.atomic():
+            ChatSession.objects.filter(id=segment.session_id).update(
+                archived_message_count=F('archived_message_count') - segment.message_count
+            )
+            segment.delete()
+        try:
+            os.remove(_absolute_path(segment.file_path))
+        except FileNotFoundError:
+            pass
+        dropped += segment.message_count
+    return dropped
@@ -0,0 +1,249 @@
+# chatbot_app/authentication.py
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.exceptions import Throttled
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+USER_CACHE_PREFIX = 'chatbot:auth:user:'
+REVOKED_TOKEN_PREFIX = 'chatbot:auth:revoked:'
+REVOKED_BEFORE_PREFIX = 'chatbot:auth:revoked-before:'
+# The user fields authentication needs; any other field is loaded from the
+# database on first access
+USER_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_superuser')
+# Signed into every token for the 'claims' mode, next to the user id claim
+CLAIM_FIELDS = ('username', 'is_active', 'is_staff', 'is_superuser')
+# Claims a token must not outlive a change of
+PRIVILEGE_FIELDS = ('is_staff', 'is_superuser')
+# Issue time with sub-second precision. 'iat' has whole seconds, so it can't
+# tell a token issued just after a revocation from one issued just before.
+ISSUED_AT_CLAIM = 'issued_at'
+
+_password_slots = None
+_password_slots_lock = threading.Lock()
+
+
+def auth_settings():
+    auth = getattr(settings, 'AUTH_SETTINGS', {})
+    return {
+        'mode': auth.get('JWT_USER_MODE', 'cached'),
+        'user_cache_timeout': auth.get('USER_CACHE_TIMEOUT', 60),
+        'password_check_concurrency': auth.get('PASSWORD_CHECK_CONCURRENCY', 4),
+        'password_check_wait': auth.get('PASSWORD_CHECK_WAIT', 2),
+    }
+
+
+def _user_cache_key(user_id):
+    return f'{USER_CACHE_PREFIX}{user_id}'
+
+
+def _revocation_keys(token):
+    return (
+        f'{REVOKED_TOKEN_PREFIX}{token.get(api_settings.JTI_CLAIM)}',
+        f'{REVOKED_BEFORE_PREFIX}{token.get(api_settings.USER_ID_CLAIM)}',
+    )
+
+
+def _is_revoked(token, found):
+    token_key, before_key = _revocation_keys(token)
+    if found.get(token_key):
+        return True
+    revoked_before = found.get(before_key)
+    return revoked_before is not None and token.get(ISSUED_AT_CLAIM, token.get('iat', 0)) < revoked_before
+
+
+def is_revoked(token):
+    return _is_revoked(token, cache.get_many(_revocation_keys(token)))
+
+
+def revoke_token(token):
+    """Reject one access or refresh token until it expires, e.g. on logout"""
+    remaining = int(token['exp'] - time.time())
+    if remaining > 0:
+        cache.set(_revocation_keys(token)[0], True, remaining)
+
+
+def revoke_user_tokens(user_id):
+    """Reject every token issued to a user so far, e.g. on deactivation or a password change"""
+    lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+    cache.set(f'{REVOKED_BEFORE_PREFIX}{user_id}', time.time(), int(lifetime.total_seconds()))
+    cache.delete(_user_cache_key(user_id))
+
+
+def _fetch_user_fields(user_id):
+    fields = get_user_model().objects.filter(
+        **{api_settings.USER_ID_FIELD: user_id}
+    ).values(*USER_FIELDS).first()
+    if fields is not None:
+        cache.set(_user_cache_key(user_id), fields, auth_settings()['user_cache_timeout'])
+    return fields
+
+
+def user_from_fields(fields):
+    """
+    A user instance built without a query. Fields outside USER_FIELDS are
+    deferred, so reading one costs a query and save() only writes what was
+    loaded.
+    """
+    return get_user_model().from_db('default', list(fields), list(fields.values()))
+
+
+def add_user_claims(token, user):
+    for field in CLAIM_FIELDS:
+        token[field] = getattr(user, field)
+    token[ISSUED_AT_CLAIM] = time.time()
+    return token
+
+
+def tokens_for_user(user):
+    """A refresh token, and through ``.access_token`` an access token, carrying the user claims"""
+    return add_user_claims(RefreshToken.for_user(user), user)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that doesn't query the user table on every request.
+
+    AUTH_SETTINGS['JWT_USER_MODE'] picks where the user comes from:
+    'database' loads it per request like simplejwt does, 'cached' keeps it
+    in the cache for USER_CACHE_TIMEOUT seconds, and 'claims' trusts the
+    signed claims in the token itself. Every mode rejects revoked tokens,
+    checked in the same cache round trip as the user lookup.
+    """
+
+    def get_user(self, validated_token):
+        mode = auth_settings()['mode']
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        keys = list(_revocation_keys(validated_token))
+        if mode == 'cached':
+            keys.append(_user_cache_key(user_id))
+        found = cache.get_many(keys)
+        if _is_revoked(validated_token, found):
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+
+        if mode == 'database':
+            return super().get_user(validated_token)
+        if mode == 'claims' and all(field in validated_token for field in CLAIM_FIELDS):
+            fields = {'id': user_id}
+            fields.update((field, validated_token[field]) for field in CLAIM_FIELDS)
+        else:
+            # Tokens issued before claims were added fall back to the cache
+            fields = found.get(_user_cache_key(user_id)) or _fetch_user_fields(user_id)
+            if fields is None:
+                raise AuthenticationFailed('User not found', code='user_not_found')
+
+        if not fields['is_active']:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return user_from_fields(fields)
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """The token endpoint's serializer, adding the user claims and bounding password checks"""
+
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+    def validate(self, attrs):
+        with password_check_slot():
+            return super().validate(attrs)
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh that rejects revoked refresh tokens and re-reads the user
+    claims, so changes to the user reach new access tokens. With
+    BLACKLIST_AFTER_ROTATION a rotated refresh token is revoked.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if is_revoked(refresh):
+            raise TokenError('Token has been revoked')
+        fields = _fetch_user_fields(refresh[api_settings.USER_ID_CLAIM])
+        if fields is None or not fields['is_active']:
+            raise TokenError('User not found or inactive')
+        for field in CLAIM_FIELDS:
+            refresh[field] = fields[field]
+
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                revoke_token(refresh)
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh[ISSUED_AT_CLAIM] = time.time()
+            data['refresh'] = str(refresh)
+        return data
+
+
+def _password_check_slots(concurrency):
+    global _password_slots
+    with _password_slots_lock:
+        if _password_slots is None:
+            _password_slots = threading.BoundedSemaphore(concurrency)
+        return _password_slots
+
+
+@contextmanager
+def password_check_slot():
+    """
+    Run a password hash or check, at most PASSWORD_CHECK_CONCURRENCY at a
+    time per process. Hashers are slow on purpose, so a burst of logins
+    would otherwise take every worker thread; callers that can't get a slot
+    within PASSWORD_CHECK_WAIT seconds get a 429 instead.
+    """
+    config = auth_settings()
+    slots = _password_check_slots(config['password_check_concurrency'])
+    if not slots.acquire(timeout=config['password_check_wait']):
+        raise Throttled(wait=config['password_check_wait'], detail='Too many logins in progress, try again shortly.')
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+def _saves_privileges(update_fields):
+    return update_fields is None or any(field in update_fields for field in PRIVILEGE_FIELDS)
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    # Remember the stored privileges, so user_saved can tell they changed
+    instance._saved_privileges = None
+    if not instance._state.adding and _saves_privileges(update_fields):
+        instance._saved_privileges = sender.objects.filter(pk=instance.pk).values_list(*PRIVILEGE_FIELDS).first()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        return
+    saved = getattr(instance, '_saved_privileges', None)
+    # Claims-mode tokens carry is_staff and is_superuser, so a change of either revokes them
+    privileges_changed = saved is not None and saved != tuple(getattr(instance, field) for field in PRIVILEGE_FIELDS)
+    # set_password() leaves _password set until the save has finished
+    if not instance.is_active or privileges_changed or getattr(instance, '_password', None) is not None:
+        revoke_user_tokens(instance.pk)
+    else:
+        cache.delete(_user_cache_key(instance.pk))
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_deleted(sender, instance, **kwargs):
+    revoke_user_tokens(instance.pk)
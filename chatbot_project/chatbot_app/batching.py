@@ -0,0 +1,83 @@
+# chatbot_app/batching.py
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from many threads and processes them together.
+
+    A worker thread waits for the first item, then keeps collecting for up to
+    ``max_wait_ms`` or until ``max_batch_size`` items are queued, and calls
+    ``process_batch(items)`` once for all of them. ``process_batch`` returns
+    one result per item, in order; each caller gets its own from a Future.
+    """
+
+    def __init__(self, process_batch, max_batch_size=32, max_wait_ms=5, idle_timeout=60,
+                 name='micro-batcher'):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        # The worker exits after this many idle seconds and is restarted on the
+        # next submit, so a batcher that is no longer used can be collected
+        self.idle_timeout = idle_timeout
+        self.name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._pid = None
+
+    def submit(self, item):
+        """Queue ``item`` and return a Future for its result"""
+        future = Future()
+        with self._lock:
+            # Worker threads do not survive a fork, so pre-forking servers
+            # start a new one in each child process
+            if self._worker is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+            self._queue.put((item, future))
+        return future
+
+    def _collect(self):
+        """Wait for the next batch, or return None once the worker should exit"""
+        try:
+            first = self._queue.get(timeout=self.idle_timeout)
+        except queue.Empty:
+            with self._lock:
+                if self._queue.empty():
+                    self._worker = None
+                    return None
+            first = self._queue.get()
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            items = [item for item, _ in batch]
+            try:
+                results = self.process_batch(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,297 @@
+# chatbot_app/benchmarking.py
+import hashlib
+import json
+import resource
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from django.db import connection
+
+# Words the synthetic corpus and its queries are made of
+VOCABULARY_SIZE = 5000
+WORDS_PER_CHUNK = 40
+
+
+def max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb():
+    """Resident set size right now, or None where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * resource.getpagesize() / (1024 * 1024)
+
+
+class FakeOllamaServer:
+    """
+    A local stand-in for the Ollama HTTP API.
+
+    ``/api/generate`` answers after ``latency_ms`` plus ``tokens`` tokens at
+    ``tokens_per_second``, streamed as NDJSON when the request asks for it,
+    so chat benchmarks measure this app rather than a model. A request for
+    a model that isn't loaded also waits ``cold_start_ms``, reported as the
+    model load time; models stay loaded for the request's ``keep_alive``
+    (default 5 minutes). A request without a prompt only loads the model.
+    Answers return a ``context`` that, sent back, spares re-evaluating it.
+    """
+
+    def __init__(self, latency_ms=50, tokens_per_second=200, tokens=40, cold_start_ms=0):
+        self.latency = latency_ms / 1000
+        self.tokens_per_second = tokens_per_second
+        self.tokens = tokens
+        self.cold_start = cold_start_ms / 1000
+        self.requests = 0
+        self.loaded_until = {}
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-ollama', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, payload, status=200):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == '/api/tags':
+                    self._send_json({'models': [{'name': 'llama2'}]})
+                else:
+                    self._send_json({'error': 'not found'}, status=404)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                request = json.loads(self.rfile.read(length) or b'{}')
+                if self.path != '/api/generate':
+                    self._send_json({'error': 'not found'}, status=404)
+                    return
+                server.requests += 1
+                started = time.perf_counter()
+                model = request.get('model', 'llama2')
+                load = server.cold_start if server.loaded_until.get(model, 0) <= time.monotonic() else 0.0005
+                time.sleep(load)
+                server.loaded_until[model] = time.monotonic() + float(request.get('keep_alive', 300))
+                if not request.get('prompt'):
+                    self._send_json({'model': model, 'done': True, 'response': '', 'load_duration': int(load * 1e9)})
+                    return
+
+                time.sleep(server.latency)
+                token_time = 1 / server.tokens_per_second if server.tokens_per_second else 0
+                # Word counts stand in for tokens; the system prompt is only
+                # evaluated when there is no context to continue from
+                prompt_tokens = len(str(request.get('prompt', '')).split())
+                if not request.get('context'):
+                    prompt_tokens += len(str(request.get('system', '')).split())
+                context = list(request.get('context') or []) + list(range(prompt_tokens + server.tokens))
+                stats = {
+                    'model': model,
+                    'done': True,
+                    'context': context,
+                    'load_duration': int(load * 1e9),
+                    'prompt_eval_count': prompt_tokens,
+                    'prompt_eval_duration': int(server.latency * 1e9),
+                    'eval_count': server.tokens,
+                    'eval_duration': int(server.tokens * token_time * 1e9),
+                }
+
+                if request.get('stream', True):
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/x-ndjson')
+                    self.end_headers()
+                    for i in range(server.tokens):
+                        time.sleep(token_time)
+                        chunk = {'model': stats['model'], 'response': f'token{i} ', 'done': False}
+                        self.wfile.write(json.dumps(chunk).encode('utf-8') + b'\n')
+                        self.wfile.flush()
+                    stats['total_duration'] = int((time.perf_counter() - started) * 1e9)
+                    self.wfile.write(json.dumps(dict(stats, response='')).encode('utf-8') + b'\n')
+                    return
+
+                time.sleep(server.tokens * token_time)
+                stats['total_duration'] = int((time.perf_counter() - started) * 1e9)
+                response = ' '.join(f'token{i}' for i in range(server.tokens))
+                self._send_json(dict(stats, response=response))
+
+        return Handler
+
+
+class HashEncoder:
+    """
+    Deterministic stand-in encoder: a text's vector is the normalized sum of
+    fixed random vectors of its words, so texts sharing words are close.
+    Fast enough to embed a million chunks, and needs no model download.
+    """
+    backend = 'benchmark'
+
+    def __init__(self, dimension=384, seed=0):
+        self.dimension = dimension
+        self.seed = seed
+        self._word_vectors = {}
+        self._lock = threading.Lock()
+
+    def _word_vector(self, word):
+        vector = self._word_vectors.get(word)
+        if vector is None:
+            word_seed = int.from_bytes(hashlib.sha256(f'{self.seed}:{word}'.encode('utf-8')).digest()[:8], 'little')
+            vector = np.random.default_rng(word_seed).standard_normal(self.dimension).astype(np.float32)
+            with self._lock:
+                self._word_vectors[word] = vector
+        return vector
+
+    def encode(self, texts, batch_size=32):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[i] += self._word_vector(word)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class SyntheticCorpus:
+    """
+    Reproducible corpus of one-chunk documents. Each document draws its
+    words from a topic, a slice of the vocabulary, so queries built from a
+    document's words have a few clearly relevant neighbours.
+    """
+
+    def __init__(self, size, seed=0, topics=200):
+        self.size = size
+        self.seed = seed
+        self.topics = topics
+        self.vocabulary = [f'w{i}' for i in range(VOCABULARY_SIZE)]
+
+    def _words(self, rng, topic, count):
+        topic_size = VOCABULARY_SIZE // self.topics
+        start = topic * topic_size
+        # Mostly topic words, plus some from anywhere in the vocabulary
+        topical = rng.integers(start, start + topic_size, size=count - count // 4)
+        noise = rng.integers(0, VOCABULARY_SIZE, size=count // 4)
+        return [self.vocabulary[i] for i in np.concatenate([topical, noise])]
+
+    def document(self, i):
+        rng = np.random.default_rng((self.seed, 0, i))
+        topic = i % self.topics
+        return f'Synthetic document {i}', ' '.join(self._words(rng, topic, WORDS_PER_CHUNK))
+
+    def documents(self, start=0, stop=None):
+        for i in range(start, self.size if stop is None else stop):
+            yield self.document(i)
+
+    def queries(self, count):
+        rng = np.random.default_rng((self.seed, 1))
+        return [
+            ' '.join(self._words(rng, int(rng.integers(0, self.topics)), 8))
+            for _ in range(count)
+        ]
+
+
+def run_scenario(operation, iterations, concurrency=1, warmup=0):
+    """
+    Call ``operation(i)`` ``iterations`` times from ``concurrency`` threads
+    and return latency percentiles, throughput, errors and memory as a dict.
+    Every call gets its own ``i``, the unmeasured warmup calls the first ones.
+    """
+    for i in range(warmup):
+        operation(i)
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(warmup, warmup + iterations))
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                started = time.perf_counter()
+                try:
+                    operation(i)
+                except Exception as e:
+                    with lock:
+                        errors.append(f'{type(e).__name__}: {e}')
+                    continue
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    latencies.append(elapsed)
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connection.close()
+
+    rss_before = current_rss_mb()
+    started = time.perf_counter()
+    if concurrency <= 1:
+        worker()
+    else:
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    wall = time.perf_counter() - started
+    return summarize(latencies, wall, errors, concurrency, rss_before)
+
+
+def summarize(latencies, wall, errors=(), concurrency=1, rss_before=None):
+    rss_after = current_rss_mb()
+    result = {
+        'iterations': len(latencies),
+        'concurrency': concurrency,
+        'errors': len(errors),
+        'throughput_per_s': round(len(latencies) / wall, 2) if wall else None,
+        'wall_s': round(wall, 3),
+        'rss_mb': round(rss_after, 1) if rss_after is not None else None,
+        'rss_delta_mb': round(rss_after - rss_before, 1) if None not in (rss_after, rss_before) else None,
+        'max_rss_mb': round(max_rss_mb(), 1),
+    }
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        result.update({
+            'p50_ms': round(float(p50), 3),
+            'p95_ms': round(float(p95), 3),
+            'p99_ms': round(float(p99), 3),
+            'mean_ms': round(float(np.mean(latencies)), 3),
+        })
+    if errors:
+        result['first_error'] = errors[0]
+    return result
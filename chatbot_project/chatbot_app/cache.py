@@ -0,0 +1,287 @@
+# chatbot_app/cache.py
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django_redis.cache import RedisCache
+
+from .metrics import NEAR_CACHE
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'chatbot:cache:invalidate'
+# Published in place of a key when every local entry has to go
+CLEAR_ALL = '*'
+# Seconds between reconnect attempts of the invalidation subscriber, doubling up to the maximum
+RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 30
+
+_MISSING = object()
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+class LocalTier:
+    """
+    The in-process half of the near cache: an LRU of pickled values shared
+    by the cache objects of every thread, and the thread that keeps it
+    coherent by listening for invalidations published by other processes.
+    """
+
+    def __init__(self, channel, max_entries, timeout):
+        self.channel = channel
+        self.max_entries = max_entries
+        self.timeout = timeout
+        # Lets a process skip the invalidations it published itself
+        self.sender = uuid.uuid4().hex
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, so a value read from Redis before one
+        # is never stored locally after it
+        self.generation = 0
+        self.listening = threading.Event()
+        self._pid = None
+        self._listener = None
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, pickled = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def fill(self, key, value, generation):
+        if not self.listening.is_set():
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires_at = time.monotonic() + self.timeout
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (expires_at, pickled)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, keys):
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def ensure_listening(self, redis_client):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            # A forked worker inherits the entries but not the listener thread
+            self._entries.clear()
+            self.generation += 1
+            self.listening = threading.Event()
+            self._pid = pid
+            self._listener = threading.Thread(
+                target=self._listen, args=(redis_client,), name='near-cache-invalidation', daemon=True
+            )
+            self._listener.start()
+
+    def _listen(self, redis_client):
+        delay = RECONNECT_DELAY
+        while True:
+            pubsub = None
+            try:
+                pubsub = redis_client.pubsub()
+                pubsub.subscribe(self.channel)
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    if message['type'] == 'subscribe':
+                        # Nothing published from here on can be missed
+                        self.listening.set()
+                        delay = RECONNECT_DELAY
+                    elif message['type'] == 'message':
+                        self._handle(message['data'])
+            except Exception as e:
+                logger.warning("Near cache invalidation listener disconnected: %s", e)
+            finally:
+                # Invalidations may be lost until we are subscribed again
+                self.listening.clear()
+                self.clear()
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def _handle(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        sender, _, keys = data.partition(' ')
+        if sender == self.sender:
+            return
+        if keys == CLEAR_ALL:
+            self.clear()
+        else:
+            self.discard(keys.split('\n'))
+
+
+def local_tier(server, channel, max_entries, timeout):
+    key = (str(server), channel)
+    with _tiers_lock:
+        tier = _tiers.get(key)
+        if tier is None:
+            tier = _tiers[key] = LocalTier(channel, max_entries, timeout)
+        return tier
+
+
+class NearCache(RedisCache):
+    """
+    django-redis cache with a small per-process LRU in front of it.
+
+    Reads are answered from process memory for up to NEAR_CACHE_TIMEOUT
+    seconds. Every write and delete is published on a Redis channel so the
+    other processes drop their copy; values are only kept locally while the
+    process is subscribed, and the local tier is flushed whenever the
+    subscription drops. Counters, locks and anything else that needs the
+    current value on every read should go through ``client=`` or a plain
+    RedisCache.
+    """
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        options = params.get('OPTIONS', {})
+        self._tier = local_tier(
+            server,
+            options.get('NEAR_CACHE_CHANNEL', INVALIDATION_CHANNEL),
+            options.get('NEAR_CACHE_MAX_ENTRIES', 1000),
+            options.get('NEAR_CACHE_TIMEOUT', 5),
+        )
+
+    def _local_key(self, key, version):
+        return str(self.make_key(key, version=version))
+
+    def _publish(self, payload):
+        try:
+            self.client.get_client(write=True).publish(self._tier.channel, f'{self._tier.sender} {payload}')
+        except Exception as e:
+            # Other processes fall back on NEAR_CACHE_TIMEOUT
+            logger.warning("Could not publish near cache invalidation: %s", e)
+
+    def _invalidate(self, keys, version=None):
+        local_keys = [self._local_key(key, version) for key in keys]
+        if not local_keys:
+            return
+        self._tier.discard(local_keys)
+        self._publish('\n'.join(local_keys))
+
+    def get(self, key, default=None, version=None, client=None):
+        if client is not None:
+            return super().get(key, default, version, client)
+        local_key = self._local_key(key, version)
+        value = self._tier.get(local_key)
+        if value is not _MISSING:
+            NEAR_CACHE.inc(result='local')
+            return value
+
+        self._tier.ensure_listening(self.client.get_client(write=True))
+        generation = self._tier.generation
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            NEAR_CACHE.inc(result='miss')
+            return default
+        NEAR_CACHE.inc(result='remote')
+        self._tier.fill(local_key, value, generation)
+        return value
+
+    def get_many(self, keys, version=None, client=None):
+        if client is not None:
+            return super().get_many(keys, version, client)
+        found = {}
+        remote_keys = []
+        for key in keys:
+            value = self._tier.get(self._local_key(key, version))
+            if value is _MISSING:
+                remote_keys.append(key)
+            else:
+                found[key] = value
+        NEAR_CACHE.inc(len(found), result='local')
+        if not remote_keys:
+            return found
+
+        self._tier.ensure_listening(self.client.get_client(write=True))
+        generation = self._tier.generation
+        remote = super().get_many(remote_keys, version) or {}
+        NEAR_CACHE.inc(len(remote), result='remote')
+        NEAR_CACHE.inc(len(remote_keys) - len(remote), result='miss')
+        for key, value in remote.items():
+            self._tier.fill(self._local_key(key, version), value, generation)
+        found.update(remote)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None, nx=False, xx=False):
+        result = super().set(key, value, timeout, version, client, nx, xx)
+        self._invalidate([key], version)
+        return result
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        result = super().add(key, value, timeout, version, client)
+        if result:
+            self._invalidate([key], version)
+        return result
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        result = super().set_many(data, timeout, version, client)
+        self._invalidate(list(data), version)
+        return result
+
+    def delete(self, key, version=None, prefix=None, client=None):
+        result = super().delete(key, version, prefix, client)
+        self._invalidate([key], version)
+        return result
+
+    def delete_many(self, keys, version=None, client=None):
+        keys = list(keys)
+        result = super().delete_many(keys, version, client)
+        self._invalidate(keys, version)
+        return result
+
+    def incr(self, key, delta=1, version=None, client=None, ignore_key_check=False):
+        result = super().incr(key, delta, version, client, ignore_key_check)
+        self._invalidate([key], version)
+        return result
+
+    def decr(self, key, delta=1, version=None, client=None):
+        result = super().decr(key, delta, version, client)
+        self._invalidate([key], version)
+        return result
+
+    def delete_pattern(self, *args, **kwargs):
+        result = super().delete_pattern(*args, **kwargs)
+        self._tier.clear()
+        self._publish(CLEAR_ALL)
+        return result
+
+    def clear(self):
+        result = super().clear()
+        self._tier.clear()
+        self._publish(CLEAR_ALL)
+        return result
@@ -1,7 +1,7 @@
 # chatbot_project/celery.py - FIXED VERSION
 import os
 from celery import Celery
-from django.conf import settings
+from celery.schedules import crontab
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chatbot_project.settings')
@@ -15,22 +15,17 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
 
-# MOVE THE SCHEDULE CONFIGURATION INSIDE A FUNCTION OR REMOVE FOR NOW
-# Comment out the beat_schedule until Django is properly set up
+app.conf.timezone = 'UTC'
 
-# Schedule periodic tasks - COMMENTED OUT TO FIX STARTUP ISSUE
-"""
-from celery.schedules import crontab
-app.conf.beat_schedule = {
-    'cleanup-old-chat-history': {
-        'task': 'chatbot_app.tasks.cleanup_old_chat_history',
-        'schedule': crontab(hour=2, minute=0),  # Run daily at 2 AM
-    },
-    'cleanup-expired-tokens': {
-        'task': 'chatbot_app.tasks.cleanup_expired_tokens',
-        'schedule': crontab(hour=3, minute=0),  # Run daily at 3 AM
-    },
-}
-"""
-
-app.conf.timezone = 'UTC'
\ No newline at end of file
+
+@app.on_after_configure.connect
+def setup_periodic_tasks(sender, **kwargs):
+    """Schedule the maintenance jobs from settings.MAINTENANCE_SCHEDULE
+
+    Runs once Celery has loaded the Django settings, which is why the schedule
+    is no longer assigned at import time.
+    """
+    from django.conf import settings
+
+    for name, job in getattr(settings, 'MAINTENANCE_SCHEDULE', {}).items():
+        sender.add_periodic_task(crontab(**job['schedule']), sender.signature(job['task']), name=name)
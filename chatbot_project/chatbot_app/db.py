@@ -0,0 +1,66 @@
+# chatbot_app/db.py
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+REPLICA_ALIAS = 'replica'
+
+# Applied to every new SQLite connection; they only last as long as it does
+SQLITE_PRAGMAS = (
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-20000',  # KiB
+    'PRAGMA mmap_size=134217728',
+)
+# With SQLITE_WAL. WAL lets readers run alongside the one writer, and NORMAL
+# sync is still safe in WAL mode while skipping an fsync per commit. The
+# journal mode is stored in the database file itself, and WAL leaves -wal
+# and -shm files next to it, hence opt-in.
+SQLITE_WAL_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+)
+
+
+def sqlite_pragmas():
+    if getattr(settings, 'SQLITE_WAL', False):
+        return SQLITE_WAL_PRAGMAS + SQLITE_PRAGMAS
+    return SQLITE_PRAGMAS
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma in sqlite_pragmas():
+            cursor.execute(pragma)
+
+
+def read_database():
+    """
+    Alias for read-only views that can tolerate replication lag: the read
+    replica when one is configured, otherwise the primary
+    """
+    return REPLICA_ALIAS if REPLICA_ALIAS in settings.DATABASES else 'default'
+
+
+class PrimaryReplicaRouter:
+    """
+    Everything goes to the primary unless a queryset asks for the replica
+    with ``.using(read_database())``. Writes always go to the primary, even
+    for objects that were loaded from the replica.
+    """
+
+    def db_for_read(self, model, **hints):
+        # None keeps the database of a related instance, if there is one
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,127 @@
+# chatbot_app/encoders.py
+import json
+import os
+
+import numpy as np
+from django.conf import settings
+
+ONNX_METADATA_FILE = 'encoder.json'
+ONNX_TOKENIZER_FILE = 'tokenizer.json'
+
+
+class EncoderError(Exception):
+    """Raised when the configured encoder backend cannot be loaded"""
+
+
+def _encoder_settings():
+    encoder = getattr(settings, 'RAG_SETTINGS', {}).get('ENCODER', {})
+    return {
+        'backend': encoder.get('BACKEND', 'sentence-transformers'),
+        'onnx_dir': encoder.get('ONNX_MODEL_DIR'),
+        'onnx_file': encoder.get('ONNX_FILE', 'model.onnx'),
+        'threads': encoder.get('THREADS', 1),
+    }
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class SentenceTransformerEncoder:
+    """The reference backend; imports torch through sentence-transformers"""
+    backend = 'sentence-transformers'
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts, batch_size=32):
+        vectors = self.model.encode(list(texts), batch_size=batch_size)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+class ONNXEncoder:
+    """
+    Encoder running an exported transformer with ONNX Runtime and a fast
+    tokenizer, without torch.
+
+    It reproduces the sentence-transformers pipeline of MiniLM-style models
+    (mean pooling over the attention mask, then L2 normalization), so its
+    vectors can be searched against embeddings stored by the reference
+    backend. The model directory is produced by ``export_onnx_encoder``.
+    """
+    backend = 'onnx'
+
+    def __init__(self, model_name, model_dir, model_file='model.onnx', threads=1):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise EncoderError('The ONNX encoder requires the onnxruntime and tokenizers packages')
+
+        metadata_path = os.path.join(model_dir, ONNX_METADATA_FILE)
+        try:
+            with open(metadata_path) as metadata_file:
+                self.metadata = json.load(metadata_file)
+        except (OSError, ValueError) as e:
+            raise EncoderError(f'Cannot read {metadata_path}: {e}')
+        # Vectors of another model would silently mismatch the stored ones
+        if self.metadata.get('embedding_model') != model_name:
+            raise EncoderError(
+                f"{model_dir} was exported from {self.metadata.get('embedding_model')}, not {model_name}"
+            )
+
+        self.model_name = model_name
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, ONNX_TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.metadata.get('max_seq_length', 256))
+        self.tokenizer.enable_padding()
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=['CPUExecutionProvider']
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def encode(self, texts, batch_size=32):
+        texts = list(texts)
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            batches.append(self._encode_batch(texts[start:start + batch_size]))
+        if not batches:
+            return np.zeros((0, self.metadata.get('dimension', 0)), dtype=np.float32)
+        return np.concatenate(batches)
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        inputs = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'token_type_ids' in self.input_names:
+            inputs['token_type_ids'] = np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, inputs)[0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return _normalize(pooled).astype(np.float32)
+
+
+def get_encoder(model_name, backend=None):
+    """Load the encoder backend configured in RAG_SETTINGS['ENCODER'] for ``model_name``"""
+    encoder_settings = _encoder_settings()
+    backend = backend or encoder_settings['backend']
+    if backend == 'onnx':
+        if not encoder_settings['onnx_dir']:
+            raise EncoderError("RAG_SETTINGS['ENCODER']['ONNX_MODEL_DIR'] is not set")
+        return ONNXEncoder(
+            model_name,
+            encoder_settings['onnx_dir'],
+            model_file=encoder_settings['onnx_file'],
+            threads=encoder_settings['threads'],
+        )
+    if backend == 'sentence-transformers':
+        return SentenceTransformerEncoder(model_name)
+    raise EncoderError(f'Unknown encoder backend: {backend}')
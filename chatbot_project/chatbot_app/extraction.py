@@ -0,0 +1,182 @@
+# chatbot_app/extraction.py
+import hashlib
+import os
+import re
+from html.parser import HTMLParser
+
+from django.conf import settings
+
+DOCUMENT_TYPES = {
+    '.txt': 'text',
+    '.text': 'text',
+    '.md': 'markdown',
+    '.markdown': 'markdown',
+    '.html': 'html',
+    '.htm': 'html',
+    '.pdf': 'pdf',
+}
+
+CONTENT_TYPES = {
+    'text/plain': 'text',
+    'text/markdown': 'markdown',
+    'text/html': 'html',
+    'application/pdf': 'pdf',
+}
+
+
+class ExtractionError(Exception):
+    """Raised when text cannot be extracted from an uploaded file"""
+
+
+def _upload_settings():
+    uploads = getattr(settings, 'DOCUMENT_UPLOADS', {})
+    return {
+        'max_chars': uploads.get('MAX_CONTENT_CHARS', 5_000_000),
+        'read_chunk': uploads.get('READ_CHUNK_BYTES', 64 * 1024),
+    }
+
+
+def detect_document_type(filename, content_type=None):
+    """Guess the document type from the file extension, then the content type"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension in DOCUMENT_TYPES:
+        return DOCUMENT_TYPES[extension]
+    if content_type:
+        return CONTENT_TYPES.get(content_type.split(';')[0].strip().lower())
+    return None
+
+
+def upload_sha256(uploaded_file):
+    """SHA-256 of an uploaded file, computed chunk by chunk"""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks(_upload_settings()['read_chunk']):
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _iter_plain_text(path, read_chunk):
+    with open(path, encoding='utf-8', errors='replace') as source:
+        while True:
+            piece = source.read(read_chunk)
+            if not piece:
+                return
+            yield piece
+
+
+MARKDOWN_PATTERNS = [
+    (re.compile(r'^\s{0,3}(#{1,6}|>+|[-*+]|\d+\.)\s+'), ''),  # Headings, quotes, list markers
+    (re.compile(r'^\s*(```|~~~).*$'), ''),  # Code fences
+    (re.compile(r'!\[([^\]]*)\]\([^)]*\)'), r'\1'),  # Images
+    (re.compile(r'\[([^\]]*)\]\([^)]*\)'), r'\1'),  # Links
+    (re.compile(r'(\*\*|__|\*|`)'), ''),  # Emphasis and inline code
+]
+
+
+def _iter_markdown(path, read_chunk):
+    with open(path, encoding='utf-8', errors='replace') as source:
+        for line in source:
+            for pattern, replacement in MARKDOWN_PATTERNS:
+                line = pattern.sub(replacement, line)
+            yield line
+
+
+class _HTMLTextParser(HTMLParser):
+    """Collects visible text, skipping script and style contents"""
+    SKIPPED_TAGS = {'script', 'style', 'noscript', 'template'}
+    BLOCK_TAGS = {'p', 'div', 'br', 'li', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'section', 'article'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.pieces = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self.pieces.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.pieces.append(data)
+
+    def drain(self):
+        pieces, self.pieces = self.pieces, []
+        return ''.join(pieces)
+
+
+def _iter_html(path, read_chunk):
+    parser = _HTMLTextParser()
+    for piece in _iter_plain_text(path, read_chunk):
+        parser.feed(piece)
+        text = parser.drain()
+        if text:
+            yield text
+    parser.close()
+    text = parser.drain()
+    if text:
+        yield text
+
+
+def _iter_pdf(path, read_chunk):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ExtractionError('PDF extraction requires the pypdf package')
+
+    with open(path, 'rb') as source:
+        # PdfReader reads objects from the file on demand, page by page
+        reader = PdfReader(source)
+        for page in reader.pages:
+            text = page.extract_text() or ''
+            if text:
+                yield text + '\n'
+
+
+EXTRACTORS = {
+    'text': _iter_plain_text,
+    'markdown': _iter_markdown,
+    'html': _iter_html,
+    'pdf': _iter_pdf,
+}
+
+
+def iter_text(path, document_type):
+    """Yield the text of a file piece by piece without reading it whole"""
+    extractor = EXTRACTORS.get(document_type)
+    if extractor is None:
+        raise ExtractionError(f'Unsupported document type: {document_type}')
+    return extractor(path, _upload_settings()['read_chunk'])
+
+
+def extract_text(path, document_type, max_chars=None):
+    """Extract up to MAX_CONTENT_CHARS of text, stopping the stream once the limit is hit"""
+    if max_chars is None:
+        max_chars = _upload_settings()['max_chars']
+
+    pieces = []
+    total = 0
+    try:
+        for piece in iter_text(path, document_type):
+            pieces.append(piece[:max_chars - total])
+            total += len(pieces[-1])
+            if total >= max_chars:
+                break
+    except ExtractionError:
+        raise
+    except Exception as e:
+        raise ExtractionError(f'Could not extract text: {e}')
+
+    # Collapse the whitespace runs left behind by markup
+    text = ''.join(pieces)
+    text = re.sub(r'[ \t]+', ' ', text)
+    return re.sub(r'\n\s*\n+', '\n\n', text).strip()
@@ -0,0 +1,161 @@
+# chatbot_app/generations.py
+import os
+import random
+import shutil
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import EmbeddingGeneration
+
+ACTIVE_GENERATION_CACHE_KEY = 'chatbot:rag:active_generation'
+# How long a process may keep serving a generation after another one is activated
+ACTIVE_GENERATION_CACHE_TIMEOUT = 30
+INDEX_VERSION_CACHE_PREFIX = 'chatbot:rag:index_version:'
+
+
+class GenerationError(Exception):
+    """Raised when an embedding generation cannot be activated or removed"""
+
+
+def _rag_settings():
+    return getattr(settings, 'RAG_SETTINGS', {})
+
+
+def create_generation(embedding_model=None, vector_dimension=None, chunk_size=None,
+                      chunk_overlap=None, quantization=None, **fields):
+    """Create a generation, filling unspecified values from RAG_SETTINGS"""
+    rag_settings = _rag_settings()
+    return EmbeddingGeneration.objects.create(
+        embedding_model=embedding_model or rag_settings.get(
+            'EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2'
+        ),
+        vector_dimension=vector_dimension or rag_settings.get('VECTOR_DIMENSION', 384),
+        chunk_size=chunk_size or rag_settings.get('CHUNK_SIZE', 1000),
+        chunk_overlap=chunk_overlap if chunk_overlap is not None else rag_settings.get('CHUNK_OVERLAP', 100),
+        quantization=quantization or rag_settings.get('QUANTIZATION', 'none'),
+        **fields
+    )
+
+
+def get_active_generation():
+    """Return the serving generation, creating one from RAG_SETTINGS on first use"""
+    generation = EmbeddingGeneration.objects.filter(is_active=True).first()
+    if generation is not None:
+        return generation
+    try:
+        with transaction.atomic():
+            return create_generation(status='active', is_active=True, activated_at=timezone.now())
+    except IntegrityError:
+        # Another process bootstrapped it first
+        return EmbeddingGeneration.objects.get(is_active=True)
+
+
+def active_generation_id():
+    """Id of the serving generation, cached so it can be checked on every request"""
+    generation_id = cache.get(ACTIVE_GENERATION_CACHE_KEY)
+    if generation_id is None:
+        generation_id = get_active_generation().id
+        cache.set(ACTIVE_GENERATION_CACHE_KEY, generation_id, ACTIVE_GENERATION_CACHE_TIMEOUT)
+    return generation_id
+
+
+def _index_version_key(generation_id):
+    return f'{INDEX_VERSION_CACHE_PREFIX}{generation_id}'
+
+
+def index_version(generation_id):
+    """
+    Version of a generation's stored embeddings and snapshot. Processes
+    whose in-memory index is of another version reload it.
+
+    A lost counter restarts at random, so an old version can't match it again.
+    """
+    key = _index_version_key(generation_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, random.randrange(1 << 48), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_index_version(generation_id):
+    """Announce a change to a generation's index to every process; returns the new version"""
+    key = _index_version_key(generation_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        index_version(generation_id)
+        return cache.incr(key)
+
+
+def activate_generation(generation_id):
+    """
+    Atomically make a built generation the serving one.
+
+    The previous generation is retired, not deleted, so it can be switched
+    back to with ``rollback_generation``.
+    """
+    with transaction.atomic():
+        generations = EmbeddingGeneration.objects.select_for_update()
+        try:
+            generation = generations.get(id=generation_id)
+        except EmbeddingGeneration.DoesNotExist:
+            raise GenerationError(f'Embedding generation {generation_id} does not exist')
+        if generation.is_active:
+            return generation
+        if generation.status not in ('ready', 'retired'):
+            raise GenerationError(
+                f'Embedding generation {generation_id} is {generation.status}, only ready '
+                f'or retired generations can be activated'
+            )
+
+        current = generations.filter(is_active=True).first()
+        if current is not None:
+            current.is_active = False
+            current.status = 'retired'
+            current.save(update_fields=['is_active', 'status'])
+
+        generation.is_active = True
+        generation.status = 'active'
+        generation.previous = current
+        generation.activated_at = timezone.now()
+        generation.save(update_fields=['is_active', 'status', 'previous', 'activated_at'])
+
+        # Point every process at the new generation once the switch is committed
+        transaction.on_commit(
+            lambda: cache.set(ACTIVE_GENERATION_CACHE_KEY, generation.id, ACTIVE_GENERATION_CACHE_TIMEOUT)
+        )
+    return generation
+
+
+def rollback_generation():
+    """Switch back to the generation that was serving before the current one"""
+    current = EmbeddingGeneration.objects.filter(is_active=True).first()
+    if current is None or current.previous_id is None:
+        raise GenerationError('There is no previous embedding generation to roll back to')
+    return activate_generation(current.previous_id)
+
+
+def snapshot_directory(generation):
+    """Directory holding the FAISS snapshot of a generation, or None when snapshots are off"""
+    base_dir = _rag_settings().get('INDEX_SNAPSHOT_DIR')
+    if not base_dir:
+        return None
+    return os.path.join(base_dir, f'generation-{generation.id}')
+
+
+def purge_generation(generation_id):
+    """Delete an inactive generation with its embeddings and snapshot"""
+    try:
+        generation = EmbeddingGeneration.objects.get(id=generation_id)
+    except EmbeddingGeneration.DoesNotExist:
+        raise GenerationError(f'Embedding generation {generation_id} does not exist')
+    if generation.is_active:
+        raise GenerationError('The active embedding generation cannot be purged')
+    directory = snapshot_directory(generation)
+    generation.delete()
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
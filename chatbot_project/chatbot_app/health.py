@@ -0,0 +1,146 @@
+# chatbot_app/health.py
+import logging
+import os
+import sys
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import EmbeddingGeneration, IngestionJob
+
+logger = logging.getLogger(__name__)
+
+HEALTH_CACHE_KEY = 'chatbot:health'
+# Held for one interval by whichever process refreshes, so a fleet of
+# workers checks Ollama and the database once per interval, not once each
+HEALTH_REFRESH_LOCK_KEY = 'chatbot:health:refreshing'
+
+_refresher_pid = None
+_refresher_lock = threading.Lock()
+
+
+def health_settings():
+    health = getattr(settings, 'HEALTH_CHECK', {})
+    return {
+        'interval': health.get('INTERVAL', 15),
+        'ollama_timeout': health.get('OLLAMA_TIMEOUT', 2),
+    }
+
+
+def _milliseconds(started):
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+def check_database():
+    started = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return {'status': 'ok', 'latency_ms': _milliseconds(started)}
+
+
+def check_ollama():
+    base_url = getattr(settings, 'OLLAMA_BASE_URL', 'http://localhost:11434')
+    started = time.perf_counter()
+    try:
+        response = requests.get(f'{base_url}/api/tags', timeout=health_settings()['ollama_timeout'])
+        response.raise_for_status()
+        models = [model.get('name') for model in response.json().get('models', [])]
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return {'available': False, 'latency_ms': _milliseconds(started), 'error': str(e)}
+    return {'available': True, 'latency_ms': _milliseconds(started), 'models': models}
+
+
+def check_rag():
+    generation = EmbeddingGeneration.objects.filter(is_active=True).first()
+    if generation is None:
+        return {'generation': None}
+    rag = {
+        'generation': generation.id,
+        'embedding_model': generation.embedding_model,
+        'quantization': generation.quantization,
+        'documents': generation.document_count,
+        'chunks': generation.chunk_count,
+    }
+    # Vectors loaded in this process, without loading the pipeline just to look
+    rag_pipeline = sys.modules.get('chatbot_app.rag_pipeline')
+    pipeline = getattr(rag_pipeline, '_shared_pipeline', None)
+    if pipeline is not None and pipeline.faiss_index is not None:
+        rag['index_vectors'] = pipeline.faiss_index.ntotal
+    return rag
+
+
+def check_queue():
+    """Ingestion jobs waiting and running; the status filter only touches unfinished jobs"""
+    counts = dict.fromkeys(['pending', 'running'], 0)
+    rows = IngestionJob.objects.filter(status__in=counts).values('status').order_by().annotate(total=Count('id'))
+    for row in rows:
+        counts[row['status']] = row['total']
+    return counts
+
+
+def collect_health():
+    """Run every deep check once; a failing check is reported, not raised"""
+    result = {'checked_at': timezone.now().isoformat()}
+    for name, check in (('database', check_database), ('ollama', check_ollama),
+                        ('rag', check_rag), ('queue', check_queue)):
+        try:
+            result[name] = check()
+        except Exception as e:
+            logger.warning("Health check %s failed: %s", name, e)
+            result[name] = {'status': 'error', 'error': str(e)}
+    if result['database'].get('status') != 'ok':
+        result['status'] = 'unhealthy'
+    elif not result['ollama'].get('available'):
+        # Chat still answers, with fallback responses
+        result['status'] = 'degraded'
+    else:
+        result['status'] = 'healthy'
+    return result
+
+
+def refresh_health():
+    result = collect_health()
+    # Kept for a few intervals so a stalled refresher shows up as a stale checked_at
+    cache.set(HEALTH_CACHE_KEY, result, health_settings()['interval'] * 4)
+    return result
+
+
+def _refresh_loop():
+    interval = health_settings()['interval']
+    while True:
+        try:
+            if cache.add(HEALTH_REFRESH_LOCK_KEY, os.getpid(), interval):
+                refresh_health()
+        except Exception:
+            logger.exception('Error refreshing health checks')
+        finally:
+            close_old_connections()
+        time.sleep(interval)
+
+
+def start_health_refresher():
+    """Start the background refresher once per process, again after a fork"""
+    global _refresher_pid
+    pid = os.getpid()
+    if _refresher_pid == pid:
+        return
+    with _refresher_lock:
+        if _refresher_pid != pid:
+            _refresher_pid = pid
+            threading.Thread(target=_refresh_loop, name='health-refresher', daemon=True).start()
+
+
+def cached_health():
+    """The latest deep health results, computing them now only if there are none yet"""
+    start_health_refresher()
+    result = cache.get(HEALTH_CACHE_KEY)
+    if result is None:
+        result = refresh_health()
+    return result
@@ -0,0 +1,211 @@
+# chatbot_app/index_metadata.py
+import json
+from datetime import datetime
+
+import faiss
+import numpy as np
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+FILTER_KEYS = ('document_type', 'user_id', 'tenant', 'updated_after', 'updated_before')
+ARRAY_NAMES = ('embedding_ids', 'document_ids', 'document_types', 'owner_ids', 'tenants', 'updated_at', 'mapped')
+
+
+def _parse_datetime(value):
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = parse_datetime(str(value))
+        if parsed is None:
+            raise ValueError(f'Invalid date: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def normalize_filters(filters):
+    """
+    Validate retrieval filters and bring them into a canonical form.
+
+    ``document_type`` is a type or list of types, ``user_id`` limits results
+    to documents without an owner or owned by that user, ``tenant`` to one
+    tenant, and ``updated_after``/``updated_before`` to a date range.
+    """
+    if not filters:
+        return {}
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown retrieval filters: {', '.join(sorted(unknown))}")
+
+    normalized = {}
+    if filters.get('document_type'):
+        types = filters['document_type']
+        if isinstance(types, str):
+            types = [types]
+        normalized['document_type'] = tuple(sorted(set(types)))
+    if filters.get('user_id') is not None:
+        normalized['user_id'] = int(filters['user_id'])
+    if filters.get('tenant'):
+        normalized['tenant'] = str(filters['tenant'])
+    for key in ('updated_after', 'updated_before'):
+        if filters.get(key):
+            normalized[key] = _parse_datetime(filters[key])
+    return normalized
+
+
+def filter_key(filters):
+    """Hashable form of normalized filters, for grouping queries that share them"""
+    return tuple(sorted(filters.items()))
+
+
+def document_filter_q(filters, prefix=''):
+    """The same filters as a Q object on Document, or on a relation to it via ``prefix``"""
+    q = Q()
+    if 'document_type' in filters:
+        q &= Q(**{f'{prefix}document_type__in': filters['document_type']})
+    if 'user_id' in filters:
+        q &= Q(**{f'{prefix}owner__isnull': True}) | Q(**{f'{prefix}owner_id': filters['user_id']})
+    if 'tenant' in filters:
+        q &= Q(**{f'{prefix}tenant': filters['tenant']})
+    if 'updated_after' in filters:
+        q &= Q(**{f'{prefix}updated_at__gte': filters['updated_after']})
+    if 'updated_before' in filters:
+        q &= Q(**{f'{prefix}updated_at__lt': filters['updated_before']})
+    return q
+
+
+class PositionMetadata:
+    """
+    The embedding id and document attributes of every position of a FAISS
+    index, stored as numpy arrays so a filter becomes a bitmap the index
+    checks during the search.
+
+    Strings (document types, tenants) are stored as small integer codes and
+    owners as user ids, 0 meaning no owner.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.embedding_ids = np.zeros(0, dtype=np.int64)
+        self.document_ids = np.zeros(0, dtype=np.int64)
+        self.document_types = np.zeros(0, dtype=np.int32)
+        self.owner_ids = np.zeros(0, dtype=np.int64)
+        self.tenants = np.zeros(0, dtype=np.int32)
+        self.updated_at = np.zeros(0, dtype=np.float64)
+        self.mapped = np.zeros(0, dtype=bool)
+        self.type_codes = {}
+        self.tenant_codes = {}
+        self._unfiltered = None
+
+    def _code(self, codes, value):
+        return codes.setdefault(value or '', len(codes))
+
+    def _grow(self, size):
+        capacity = len(self.embedding_ids)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 1024)
+        for name in ARRAY_NAMES:
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            setattr(self, name, grown)
+
+    def append(self, rows):
+        """
+        Add positions in index order; ``rows`` are (embedding id, document id,
+        document type, owner id, tenant, updated_at) tuples
+        """
+        rows = list(rows)
+        start, end = self.size, self.size + len(rows)
+        self._grow(end)
+        for position, (embedding_id, document_id, document_type, owner_id, tenant, updated_at) in enumerate(rows, start):
+            self.embedding_ids[position] = embedding_id
+            self.document_ids[position] = document_id
+            self.document_types[position] = self._code(self.type_codes, document_type)
+            self.owner_ids[position] = owner_id or 0
+            self.tenants[position] = self._code(self.tenant_codes, tenant)
+            self.updated_at[position] = updated_at.timestamp()
+            self.mapped[position] = True
+        self.size = end
+        self._unfiltered = None
+
+    def embedding_id(self, position):
+        """Embedding id at ``position``, or None if it was replaced or is out of range"""
+        if 0 <= position < self.size and self.mapped[position]:
+            return int(self.embedding_ids[position])
+        return None
+
+    def update_documents(self, documents):
+        """Refresh the attributes of already indexed documents"""
+        for document in documents:
+            positions = self.document_ids[:self.size] == document.id
+            self.document_types[:self.size][positions] = self._code(self.type_codes, document.document_type)
+            self.owner_ids[:self.size][positions] = document.owner_id or 0
+            self.tenants[:self.size][positions] = self._code(self.tenant_codes, document.tenant)
+            self.updated_at[:self.size][positions] = document.updated_at.timestamp()
+
+    def unmap_documents(self, document_ids):
+        """Exclude the positions of ``document_ids`` from every search"""
+        positions = np.isin(self.document_ids[:self.size], list(document_ids))
+        self.mapped[:self.size][positions] = False
+        self._unfiltered = None
+
+    def mask(self, filters):
+        size = self.size
+        mask = self.mapped[:size].copy()
+        if 'document_type' in filters:
+            codes = [self.type_codes[t] for t in filters['document_type'] if t in self.type_codes]
+            mask &= np.isin(self.document_types[:size], codes)
+        if 'user_id' in filters:
+            owners = self.owner_ids[:size]
+            mask &= (owners == 0) | (owners == filters['user_id'])
+        if 'tenant' in filters:
+            mask &= self.tenants[:size] == self.tenant_codes.get(filters['tenant'], -1)
+        if 'updated_after' in filters:
+            mask &= self.updated_at[:size] >= filters['updated_after'].timestamp()
+        if 'updated_before' in filters:
+            mask &= self.updated_at[:size] < filters['updated_before'].timestamp()
+        return mask
+
+    def search_parameters(self, filters):
+        """
+        FAISS SearchParameters restricting a search to positions matching
+        ``filters``, or None when every position may be returned
+        """
+        if not filters:
+            if self._unfiltered is None:
+                # Only positions replaced by a newer version need excluding
+                self._unfiltered = (
+                    False if self.mapped[:self.size].all() else self._bitmap_parameters(self.mapped[:self.size])
+                )
+            return self._unfiltered or None
+        return self._bitmap_parameters(self.mask(filters))
+
+    def _bitmap_parameters(self, mask):
+        bitmap = np.packbits(mask, bitorder='little')
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap)))
+        # The selector reads the bitmap in place, so it has to outlive the search
+        params.referenced_objects = [bitmap, params.sel]
+        return params
+
+    def save(self, path):
+        with open(path, 'wb') as metadata_file:
+            np.savez(
+                metadata_file,
+                codes=np.array(json.dumps({'types': self.type_codes, 'tenants': self.tenant_codes})),
+                **{name: getattr(self, name)[:self.size] for name in ARRAY_NAMES}
+            )
+
+    @classmethod
+    def load(cls, path):
+        metadata = cls()
+        with np.load(path) as arrays:
+            codes = json.loads(str(arrays['codes']))
+            metadata.type_codes = codes['types']
+            metadata.tenant_codes = codes['tenants']
+            for name in ARRAY_NAMES:
+                setattr(metadata, name, arrays[name].copy())
+        metadata.size = len(metadata.embedding_ids)
+        return metadata
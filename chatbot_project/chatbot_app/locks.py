@@ -0,0 +1,43 @@
+# chatbot_app/locks.py
+import functools
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+LOCK_KEY_PREFIX = 'chatbot:lock:'
+
+
+@contextmanager
+def job_lock(name, timeout=3600):
+    """
+    Try to take the named lock; yields True if this caller holds it.
+
+    Relies on ``cache.add`` being atomic, so the lock is only shared between
+    nodes when CACHES points at a shared backend such as Redis. ``timeout``
+    bounds how long a crashed holder can keep the lock.
+    """
+    key = f'{LOCK_KEY_PREFIX}{name}'
+    token = uuid.uuid4().hex
+    acquired = cache.add(key, token, timeout)
+    try:
+        yield acquired
+    finally:
+        # Never release a lock that expired and was taken by someone else
+        if acquired and cache.get(key) == token:
+            cache.delete(key)
+
+
+def single_instance(name=None, timeout=3600):
+    """Decorator that skips a job while another worker or node is running it"""
+    def decorator(func):
+        lock_name = name or f'{func.__module__}.{func.__name__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with job_lock(lock_name, timeout) as acquired:
+                if not acquired:
+                    return f"Skipped {lock_name}: already running elsewhere"
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,138 @@
+# chatbot_app/management/commands/benchmark_quantization.py
+import json
+import time
+
+import faiss
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot_app.generations import get_active_generation
+from chatbot_app.models import DocumentEmbedding
+from chatbot_app.quantization import (
+    add_to_index, dequantize_int8, index_bytes, new_index, quantize_int8, search_index, stored_vector
+)
+
+MODES = ['none', 'int8', 'binary']
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare float32, int8 and binary vector search: storage and index bytes per '
+        'vector, projected memory, query latency and recall against exact search'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vectors', type=int, default=100000, help='Corpus size (default: 100000)')
+        parser.add_argument('--dimension', type=int, default=384, help='Vector dimension of the synthetic corpus')
+        parser.add_argument('--queries', type=int, default=200, help='Number of queries (default: 200)')
+        parser.add_argument('--top-k', type=int, default=10, help='Neighbours compared for recall (default: 10)')
+        parser.add_argument('--rescore-factor', type=int, default=10,
+                            help='Binary mode candidates per result to rescore (default: 10)')
+        parser.add_argument('--project', type=int, default=10_000_000,
+                            help='Corpus size to project memory for (default: 10M)')
+        parser.add_argument('--from-db', action='store_true',
+                            help='Use the stored embeddings of the active generation instead of synthetic vectors')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        if options['from_db']:
+            corpus = self.stored_corpus(options['vectors'])
+        else:
+            corpus = self.synthetic_corpus(rng, options['vectors'], options['dimension'])
+        if len(corpus) < options['top_k']:
+            raise CommandError('Not enough vectors to benchmark')
+
+        # Queries are perturbed corpus vectors, like paraphrases of indexed text
+        picks = rng.choice(len(corpus), size=options['queries'])
+        queries = corpus[picks] + rng.normal(0, 0.05, (len(picks), corpus.shape[1])).astype(np.float32)
+        faiss.normalize_L2(queries)
+
+        top_k = options['top_k']
+        exact = faiss.IndexFlatIP(corpus.shape[1])
+        exact.add(corpus)
+        _, truth = exact.search(queries, top_k)
+
+        self.stdout.write(
+            f'{len(corpus)} vectors x {corpus.shape[1]} dims, {len(queries)} queries, '
+            f'recall@{top_k}, memory projected to {options["project"]:,} vectors'
+        )
+        self.stdout.write(self.storage_report(corpus))
+        results = [self.run_mode(mode, corpus, queries, truth, options) for mode in MODES]
+        header = f'{"mode":<8}{"bytes/vec":>10}{"projected":>12}{"build s":>9}{"p50 ms":>9}{"p95 ms":>9}{"recall":>8}'
+        self.stdout.write(header)
+        for result in results:
+            self.stdout.write(
+                f'{result["mode"]:<8}{result["bytes_per_vector"]:>10.1f}'
+                f'{result["projected_gb"]:>10.2f}GB{result["build_seconds"]:>9.2f}'
+                f'{result["p50_ms"]:>9.3f}{result["p95_ms"]:>9.3f}{result["recall"]:>8.3f}'
+            )
+        if options['verbosity'] > 1:
+            self.stdout.write(json.dumps(results, indent=2))
+
+    def synthetic_corpus(self, rng, count, dimension):
+        """Clustered unit vectors, closer to real embeddings than uniform noise"""
+        centers = rng.normal(size=(max(count // 100, 1), dimension)).astype(np.float32)
+        corpus = centers[rng.integers(len(centers), size=count)]
+        corpus = corpus + rng.normal(0, 0.6, (count, dimension)).astype(np.float32)
+        faiss.normalize_L2(corpus)
+        return corpus
+
+    def stored_corpus(self, limit):
+        generation = get_active_generation()
+        rows = DocumentEmbedding.objects.filter(generation=generation).values_list(
+            'embedding_data', 'vector_data'
+        )[:limit]
+        vectors = [stored_vector(embedding_data, vector_data) for embedding_data, vector_data in rows.iterator()]
+        if not vectors:
+            raise CommandError(f'Generation {generation.id} has no stored embeddings')
+        corpus = np.array(vectors, dtype=np.float32)
+        faiss.normalize_L2(corpus)
+        return corpus
+
+    def storage_report(self, corpus):
+        sample = corpus[:1000]
+        json_bytes = np.mean([len(json.dumps(vector.tolist())) for vector in sample])
+        int8_bytes = len(quantize_int8(sample[0]))
+        return (
+            f'Database bytes per vector: JSON {json_bytes:.0f}, '
+            f'float32 {corpus.shape[1] * 4}, int8 {int8_bytes}'
+        )
+
+    def run_mode(self, mode, corpus, queries, truth, options):
+        top_k = options['top_k']
+        started = time.perf_counter()
+        index = new_index(mode, corpus.shape[1])
+        add_to_index(index, mode, corpus)
+        build_seconds = time.perf_counter() - started
+
+        if mode == 'binary':
+            # Stand-in for the stored int8 vectors the pipeline rescores from
+            rescore_vectors = np.array([dequantize_int8(quantize_int8(vector)) for vector in corpus])
+
+        latencies = []
+        found = 0
+        for query, expected in zip(queries, truth):
+            query = query.reshape(1, -1)
+            started = time.perf_counter()
+            if mode == 'binary':
+                _, candidates = search_index(index, mode, query, top_k * options['rescore_factor'])
+                candidates = candidates[0][candidates[0] >= 0]
+                scores = rescore_vectors[candidates] @ query[0]
+                ids = candidates[np.argsort(-scores)[:top_k]]
+            else:
+                _, ids = search_index(index, mode, query, top_k)
+                ids = ids[0]
+            latencies.append((time.perf_counter() - started) * 1000)
+            found += len(set(ids.tolist()) & set(expected.tolist()))
+
+        bytes_per_vector = index_bytes(index, mode) / len(corpus)
+        return {
+            'mode': mode,
+            'bytes_per_vector': bytes_per_vector,
+            'projected_gb': bytes_per_vector * options['project'] / 1024 ** 3,
+            'build_seconds': build_seconds,
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'recall': found / (len(queries) * top_k),
+        }
@@ -0,0 +1,132 @@
+# chatbot_app/management/commands/check_encoder_parity.py
+import resource
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot_app.encoders import EncoderError, ONNXEncoder, SentenceTransformerEncoder
+from chatbot_app.generations import get_active_generation
+from chatbot_app.models import DocumentEmbedding
+from chatbot_app.quantization import stored_vector
+
+SAMPLE_TEXTS = [
+    'How do I reset my password?',
+    'Can I save my conversation history?',
+    'The chatbot uses retrieval-augmented generation to ground its answers in documents.',
+    'JWT authentication keeps user sessions secure; tokens expire after one hour.',
+    'Was kostet das Abonnement pro Monat?',
+    'hi',
+    'To get started: create an account, verify your email address, log in and start chatting. '
+    'Your chat history is saved automatically when you are logged in and can be exported later.',
+]
+
+
+def _max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Check that the ONNX encoder produces vectors compatible with the reference '
+        'sentence-transformers encoder, or with the stored embeddings (--from-db, no '
+        'torch needed), and compare query-encode latency and memory'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            help='ONNX file inside ONNX_MODEL_DIR to check (default: ENCODER ONNX_FILE)',
+        )
+        parser.add_argument(
+            '--from-db', type=int, metavar='N', default=0,
+            help='Compare against N stored embeddings of the active generation instead of '
+                 're-encoding sample texts with sentence-transformers',
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.99,
+            help='Minimum cosine similarity per text (default: 0.99; about 0.97 suits int8 models)',
+        )
+        parser.add_argument('--repeat', type=int, default=50, help='Single-query encodes timed per backend')
+
+    def handle(self, *args, **options):
+        encoder_settings = getattr(settings, 'RAG_SETTINGS', {}).get('ENCODER', {})
+        generation = get_active_generation()
+        model_name = generation.embedding_model
+
+        rss_before = _max_rss_mb()
+        try:
+            onnx_encoder = ONNXEncoder(
+                model_name,
+                encoder_settings.get('ONNX_MODEL_DIR'),
+                model_file=options['file'] or encoder_settings.get('ONNX_FILE', 'model.onnx'),
+                threads=encoder_settings.get('THREADS', 1),
+            )
+        except EncoderError as e:
+            raise CommandError(str(e))
+        onnx_rss = _max_rss_mb() - rss_before
+
+        if options['from_db']:
+            texts, reference = self.stored_reference(generation, options['from_db'])
+            reference_encoder = None
+        else:
+            texts = SAMPLE_TEXTS
+            rss_before = _max_rss_mb()
+            reference_encoder = SentenceTransformerEncoder(model_name)
+            reference_rss = _max_rss_mb() - rss_before
+            reference = reference_encoder.encode(texts)
+
+        candidate = onnx_encoder.encode(texts)
+        similarities = self.cosine(reference, candidate)
+        self.stdout.write(
+            f'{model_name}: {len(texts)} texts, cosine min {similarities.min():.5f}, '
+            f'mean {similarities.mean():.5f}'
+        )
+
+        self.stdout.write(
+            f'onnx: query encode p50 {self.query_latency(onnx_encoder, options["repeat"]):.2f} ms, '
+            f'+{onnx_rss:.0f} MB peak RSS'
+        )
+        if reference_encoder is not None:
+            self.stdout.write(
+                f'sentence-transformers: query encode p50 '
+                f'{self.query_latency(reference_encoder, options["repeat"]):.2f} ms, '
+                f'+{reference_rss:.0f} MB peak RSS'
+            )
+
+        if similarities.min() < options['threshold']:
+            worst = texts[int(similarities.argmin())]
+            raise CommandError(
+                f'Encoder parity check failed: cosine {similarities.min():.5f} below '
+                f'{options["threshold"]} for {worst[:60]!r}'
+            )
+        self.stdout.write(self.style.SUCCESS('Encoder parity check passed'))
+
+    def stored_reference(self, generation, limit):
+        rows = DocumentEmbedding.objects.filter(generation=generation).exclude(chunk_text='').values_list(
+            'chunk_text', 'embedding_data', 'vector_data'
+        )[:limit]
+        texts, vectors = [], []
+        for chunk_text, embedding_data, vector_data in rows:
+            texts.append(chunk_text)
+            vectors.append(stored_vector(embedding_data, vector_data))
+        if not texts:
+            raise CommandError(f'Generation {generation.id} has no stored chunk embeddings')
+        return texts, np.array(vectors, dtype=np.float32)
+
+    def cosine(self, reference, candidate):
+        reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+        candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+        return (reference * candidate).sum(axis=1)
+
+    def query_latency(self, encoder, repeat):
+        encoder.encode([SAMPLE_TEXTS[0]])  # Warm up
+        timings = []
+        for i in range(repeat):
+            query = SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]
+            started = time.perf_counter()
+            encoder.encode([query])
+            timings.append((time.perf_counter() - started) * 1000)
+        return float(np.percentile(timings, 50))
@@ -0,0 +1,181 @@
+# chatbot_app/management/commands/check_query_plans.py
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from chatbot_app.models import ChatMessage, ChatSession
+
+
+# Maximum number of queries each endpoint may issue, independent of data size
+QUERY_BUDGETS = {
+    'chat-history': 3,
+    'chat-history (next page)': 3,
+    'sessions list': 2,
+    'sessions list (next page)': 2,
+    'session detail': 3,
+    'session messages': 3,
+    'session messages (next page)': 3,
+}
+
+CHAT_TABLES = (ChatSession._meta.db_table, ChatMessage._meta.db_table)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the chat API endpoints against throwaway fixture data, assert their '
+        'query counts and check EXPLAIN output for full scans of the chat tables'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sessions', type=int, default=60,
+            help='Number of fixture sessions to create (default: 60)',
+        )
+        parser.add_argument(
+            '--messages', type=int, default=20,
+            help='Number of fixture messages per session (default: 20)',
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f'Unsupported database vendor: {connection.vendor}')
+
+        failures = []
+        try:
+            with transaction.atomic():
+                failures = self.run_checks(options['sessions'], options['messages'])
+                # Never keep the fixture data around
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+        if failures:
+            for failure in failures:
+                self.stdout.write(self.style.ERROR(failure))
+            raise CommandError(f'{len(failures)} query plan check(s) failed')
+        self.stdout.write(self.style.SUCCESS('All query plan checks passed'))
+
+    def run_checks(self, session_count, messages_per_session):
+        user = self.create_fixtures(session_count, messages_per_session)
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        session = ChatSession.objects.filter(user=user).order_by('-updated_at', '-id').first()
+
+        failures = []
+        checks = [
+            ('chat-history', '/api/chat-history/', {}),
+            ('sessions list', '/api/sessions/', {}),
+            ('session detail', f'/api/sessions/{session.pk}/', {}),
+            ('session messages', f'/api/sessions/{session.pk}/messages/', {'page_size': 5}),
+        ]
+        while checks:
+            name, url, params = checks.pop(0)
+            with self.capture_queries() as queries:
+                response = client.get(url, params)
+            if response.status_code != 200:
+                failures.append(f'{name}: HTTP {response.status_code}')
+                continue
+
+            failures.extend(self.check_queries(name, queries))
+
+            # Follow the first cursor once so the seek predicate is covered too
+            next_cursor = response.json().get('next_cursor')
+            if next_cursor and not name.endswith('(next page)'):
+                checks.append((f'{name} (next page)', url, dict(params, cursor=next_cursor)))
+
+        # Retention scan used by cleanup_old_chat_history
+        cutoff = timezone.now() - timedelta(days=30)
+        retention = ChatMessage.objects.filter(
+            timestamp__lt=cutoff
+        ).order_by('timestamp', 'id').values('id')[:100]
+        sql, params = retention.query.sql_with_params()
+        failures.extend(self.check_plan('retention scan', sql, params))
+        return failures
+
+    def create_fixtures(self, session_count, messages_per_session):
+        user = User.objects.create_user(username=f'query-plan-check-{timezone.now().timestamp()}')
+        other = User.objects.create_user(username=f'query-plan-other-{timezone.now().timestamp()}')
+        now = timezone.now()
+        sessions = ChatSession.objects.bulk_create([
+            ChatSession(
+                user=user if i % 2 else other,
+                session_id=f'query-plan-{now.timestamp()}-{i}',
+                is_active=i % 5 != 0,
+                created_at=now - timedelta(hours=i),
+            )
+            for i in range(session_count)
+        ])
+        ChatMessage.objects.bulk_create([
+            ChatMessage(
+                session=session,
+                message_type='user' if j % 2 else 'bot',
+                content=f'fixture message {j}',
+                timestamp=now - timedelta(days=j),
+            )
+            for session in sessions
+            for j in range(messages_per_session)
+        ])
+        return user
+
+    @contextmanager
+    def capture_queries(self):
+        queries = []
+
+        def wrapper(execute, sql, params, many, context):
+            queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(wrapper):
+            yield queries
+
+    def check_queries(self, name, queries):
+        failures = []
+        budget = QUERY_BUDGETS[name]
+        self.stdout.write(f'{name}: {len(queries)} queries (budget {budget})')
+        if len(queries) > budget:
+            failures.append(f'{name}: {len(queries)} queries exceeds budget of {budget}')
+        for sql, params in queries:
+            if sql.lstrip().upper().startswith('SELECT'):
+                failures.extend(self.check_plan(name, sql, params))
+        return failures
+
+    def check_plan(self, name, sql, params):
+        plan = self.explain(sql, params)
+        failures = []
+        for line in plan:
+            if self.verbosity > 1:
+                self.stdout.write(f'    {line}')
+            if self.is_full_scan(line):
+                failures.append(f'{name}: full table scan `{line}` in\n    {sql}')
+        return failures
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                return [row[-1] for row in cursor.fetchall()]
+            # Fixture tables are tiny, so make the planner show whether an
+            # index is usable at all rather than what is cheapest right now
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def is_full_scan(self, line):
+        for table in CHAT_TABLES:
+            if connection.vendor == 'sqlite':
+                # "SCAN table" without an index is a full scan; "SEARCH" is a seek
+                if line.startswith(f'SCAN {table}') and 'INDEX' not in line:
+                    return True
+            elif f'Seq Scan on {table}' in line:
+                return True
+        return False
@@ -0,0 +1,103 @@
+# chatbot_app/management/commands/embedding_generations.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from chatbot_app.generations import (
+    GenerationError, activate_generation, create_generation, purge_generation, rollback_generation
+)
+from chatbot_app.models import EmbeddingGeneration
+from chatbot_app.tasks import build_embedding_generation
+
+
+class Command(BaseCommand):
+    help = (
+        'Manage embedding generations: build a new embedding model or chunking '
+        'next to the serving one, switch to it atomically and roll back'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action',
+            choices=['list', 'create', 'build', 'activate', 'rollback', 'purge'],
+            help='list generations, create and build a new one, rebuild one, activate one, '
+                 'roll back to the previous one, or purge an inactive one',
+        )
+        parser.add_argument('--id', type=int, help='Generation to build, activate or purge')
+        parser.add_argument('--model', help='Embedding model of a new generation')
+        parser.add_argument('--dimension', type=int, help='Vector dimension of a new generation')
+        parser.add_argument('--chunk-size', type=int, help='Chunk size of a new generation')
+        parser.add_argument('--chunk-overlap', type=int, help='Chunk overlap of a new generation')
+        parser.add_argument(
+            '--quantization',
+            choices=[mode for mode, _ in EmbeddingGeneration.QUANTIZATION_CHOICES],
+            help='Vector quantization of a new generation',
+        )
+        parser.add_argument(
+            '--activate',
+            action='store_true',
+            help='Activate the generation as soon as it is built',
+        )
+
+    def handle(self, *args, **options):
+        action = options['action']
+        try:
+            if action == 'list':
+                self.list_generations()
+            elif action == 'create':
+                generation = create_generation(
+                    embedding_model=options['model'],
+                    vector_dimension=options['dimension'],
+                    chunk_size=options['chunk_size'],
+                    chunk_overlap=options['chunk_overlap'],
+                    quantization=options['quantization'],
+                )
+                self.stdout.write(f'Created {generation}')
+                self.build(generation.id, options['activate'])
+            elif action == 'build':
+                self.build(self.require_id(options), options['activate'])
+            elif action == 'activate':
+                generation = activate_generation(self.require_id(options))
+                self.stdout.write(self.style.SUCCESS(f'Activated {generation}'))
+            elif action == 'rollback':
+                generation = rollback_generation()
+                self.stdout.write(self.style.SUCCESS(f'Rolled back to {generation}'))
+            elif action == 'purge':
+                generation_id = self.require_id(options)
+                purge_generation(generation_id)
+                self.stdout.write(self.style.SUCCESS(f'Purged generation {generation_id}'))
+        except GenerationError as e:
+            raise CommandError(str(e))
+
+    def require_id(self, options):
+        if options['id'] is None:
+            raise CommandError(f"--id is required for '{options['action']}'")
+        return options['id']
+
+    def build(self, generation_id, activate):
+        if getattr(settings, 'USE_CELERY', False) and not activate:
+            build_embedding_generation.delay(generation_id)
+            self.stdout.write(f'Queued build of generation {generation_id}')
+            return
+
+        self.stdout.write(str(build_embedding_generation(generation_id)))
+        if activate:
+            generation = EmbeddingGeneration.objects.get(id=generation_id)
+            if generation.status != 'ready':
+                raise CommandError(f'Generation {generation_id} is {generation.status}, not activating')
+            activate_generation(generation_id)
+            self.stdout.write(self.style.SUCCESS(f'Activated {generation}'))
+
+    def list_generations(self):
+        generations = EmbeddingGeneration.objects.annotate(
+            stored_documents=Count('embeddings__document', distinct=True),
+            stored_chunks=Count('embeddings'),
+        )
+        for generation in generations:
+            marker = '*' if generation.is_active else ' '
+            self.stdout.write(
+                f'{marker} {generation.id:>4}  {generation.status:<9} {generation.embedding_model}  '
+                f'dim={generation.vector_dimension} {generation.quantization} '
+                f'chunk={generation.chunk_size}/{generation.chunk_overlap}  '
+                f'{generation.stored_documents} docs, {generation.stored_chunks} chunks'
+            )
@@ -0,0 +1,97 @@
+# chatbot_app/management/commands/export_onnx_encoder.py
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot_app.encoders import ONNX_METADATA_FILE, ONNX_TOKENIZER_FILE
+
+
+class Command(BaseCommand):
+    help = (
+        'Export an embedding model to ONNX with its fast tokenizer for the onnx encoder '
+        'backend, optionally with an int8 dynamically quantized copy. Needs torch and '
+        'transformers, so run it on a build machine rather than on every worker'
+    )
+
+    def add_arguments(self, parser):
+        rag_settings = getattr(settings, 'RAG_SETTINGS', {})
+        parser.add_argument(
+            '--model',
+            default=rag_settings.get('EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2'),
+            help='Embedding model to export (default: RAG_SETTINGS EMBEDDING_MODEL)',
+        )
+        parser.add_argument(
+            '--output',
+            default=rag_settings.get('ENCODER', {}).get('ONNX_MODEL_DIR'),
+            help='Directory to write the model to (default: ENCODER ONNX_MODEL_DIR)',
+        )
+        parser.add_argument('--max-seq-length', type=int, default=256)
+        parser.add_argument('--opset', type=int, default=14)
+        parser.add_argument(
+            '--quantize',
+            action='store_true',
+            help='Also write model_quantized.onnx with int8 weights',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            import torch
+            from transformers import AutoModel, AutoTokenizer
+        except ImportError:
+            raise CommandError('Exporting requires the torch and transformers packages')
+        if not options['output']:
+            raise CommandError('No output directory given')
+
+        output = options['output']
+        os.makedirs(output, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(options['model'])
+        if not tokenizer.is_fast:
+            raise CommandError(f"{options['model']} has no fast tokenizer")
+        model = AutoModel.from_pretrained(options['model'])
+        model.eval()
+
+        sample = tokenizer(['An example sentence to trace the model'], return_tensors='pt')
+        input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+        dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+        dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+        model_path = os.path.join(output, 'model.onnx')
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                tuple(sample[name] for name in input_names),
+                model_path,
+                input_names=input_names,
+                output_names=['last_hidden_state'],
+                dynamic_axes=dynamic_axes,
+                opset_version=options['opset'],
+            )
+        self.stdout.write(f'Wrote {model_path}')
+
+        # The fast tokenizer's tokenizer.json is all the tokenizers package needs
+        tokenizer.backend_tokenizer.save(os.path.join(output, ONNX_TOKENIZER_FILE))
+
+        files = ['model.onnx']
+        if options['quantize']:
+            try:
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+            except ImportError:
+                raise CommandError('Quantizing requires the onnxruntime package')
+            quantized_path = os.path.join(output, 'model_quantized.onnx')
+            quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+            files.append('model_quantized.onnx')
+            self.stdout.write(f'Wrote {quantized_path}')
+
+        with open(os.path.join(output, ONNX_METADATA_FILE), 'w') as metadata_file:
+            json.dump({
+                'embedding_model': options['model'],
+                'dimension': model.config.hidden_size,
+                'max_seq_length': options['max_seq_length'],
+                'files': files,
+            }, metadata_file, indent=2)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {options['model']}; run check_encoder_parity before switching "
+            f"RAG_ENCODER_BACKEND to onnx"
+        ))
@@ -0,0 +1,128 @@
+# chatbot_app/management/commands/profile_summary.py
+import json
+import os
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from chatbot_app.profiling import FILE_HOUR_FORMAT, FOLDED_PREFIX, REQUESTS_PREFIX, profiling_settings
+
+
+class Command(BaseCommand):
+    help = (
+        'Summarize sampled request profiles: per-route latency and SQL cost, and the '
+        'functions with the most samples, over the last --hours'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=1, help='Window to summarize (default: 1)')
+        parser.add_argument('--top', type=int, default=20, help='Functions to list (default: 20)')
+        parser.add_argument('--route', help='Only stacks and requests of this route, e.g. /api/chat/')
+        parser.add_argument('--dir', help='Profile directory (default: REQUEST_PROFILING OUTPUT_DIR)')
+        parser.add_argument('--folded-output', help='Also write the merged folded stacks here, for flamegraph.pl')
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or profiling_settings()['output_dir']
+        if not directory or not os.path.isdir(directory):
+            raise CommandError(f'No profile directory at {directory}')
+
+        since = timezone.now() - timedelta(hours=options['hours'])
+        first_hour = since.strftime(FILE_HOUR_FORMAT)
+        files = sorted(os.listdir(directory))
+
+        requests = self.read_requests(directory, files, first_hour, since, options['route'])
+        stacks = self.read_stacks(directory, files, first_hour, options['route'])
+        if not requests and not stacks:
+            self.stdout.write(f'No profiles since {since:%Y-%m-%d %H:%M}')
+            return
+
+        self.report_routes(requests)
+        self.report_functions(stacks, options['top'])
+
+        if options['folded_output']:
+            with open(options['folded_output'], 'w') as folded_file:
+                for stack, count in stacks.most_common():
+                    folded_file.write(f'{stack} {count}\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['folded_output']}"))
+
+    def in_window(self, name, prefix, suffix, first_hour):
+        return name.startswith(prefix) and name.endswith(suffix) and name[len(prefix):-len(suffix)] >= first_hour
+
+    def read_requests(self, directory, files, first_hour, since, route):
+        requests = []
+        for name in files:
+            if not self.in_window(name, REQUESTS_PREFIX, '.jsonl', first_hour):
+                continue
+            with open(os.path.join(directory, name)) as requests_file:
+                for line in requests_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # A line cut short by a crash
+                    if parse_datetime(record['timestamp']) < since:
+                        continue
+                    if route and record['route'] != route:
+                        continue
+                    requests.append(record)
+        return requests
+
+    def read_stacks(self, directory, files, first_hour, route):
+        # Folded files have no timestamps, so the window is hour-granular here
+        stacks = Counter()
+        for name in files:
+            if not self.in_window(name, FOLDED_PREFIX, '.folded', first_hour):
+                continue
+            with open(os.path.join(directory, name)) as folded_file:
+                for line in folded_file:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    if not stack or not count.isdigit():
+                        continue
+                    if route and stack.split(';', 1)[0].split(' ', 1)[-1] != route:
+                        continue
+                    stacks[stack] += int(count)
+        return stacks
+
+    def report_routes(self, requests):
+        by_route = defaultdict(list)
+        for record in requests:
+            by_route[f"{record['method']} {record['route']}"].append(record)
+
+        self.stdout.write(f'{len(requests)} sampled requests')
+        self.stdout.write(
+            f"{'route':<40} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'sql/req':>8} {'sql ms/req':>11}"
+        )
+        for route, records in sorted(by_route.items(), key=lambda item: -len(item[1])):
+            durations = [record['duration_ms'] for record in records]
+            p50, p95 = np.percentile(durations, [50, 95])
+            self.stdout.write(
+                f'{route:<40} {len(records):>6} {p50:>9.1f} {p95:>9.1f} '
+                f"{np.mean([r['sql_count'] for r in records]):>8.1f} "
+                f"{np.mean([r['sql_ms'] for r in records]):>11.1f}"
+            )
+
+    def report_functions(self, stacks, top):
+        total = sum(stacks.values())
+        if not total:
+            return
+        own = Counter()
+        cumulative = Counter()
+        for stack, count in stacks.items():
+            # Skip the "METHOD route" root added by the middleware
+            frames = stack.split(';')[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            # Count a function once per stack even when it recurses
+            for frame in set(frames):
+                cumulative[frame] += count
+
+        self.stdout.write(f'\n{total} samples; hottest functions by own time')
+        for frame, count in own.most_common(top):
+            self.stdout.write(f'{100 * count / total:6.1f}%  {frame}')
+        self.stdout.write('\nHottest functions including callees')
+        for frame, count in cumulative.most_common(top):
+            self.stdout.write(f'{100 * count / total:6.1f}%  {frame}')
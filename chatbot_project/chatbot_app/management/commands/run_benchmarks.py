@@ -0,0 +1,306 @@
+# chatbot_app/management/commands/run_benchmarks.py
+import json
+import platform
+from datetime import timedelta
+from unittest import mock
+
+import faiss
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from chatbot_app.authentication import tokens_for_user
+from chatbot_app.benchmarking import FakeOllamaServer, HashEncoder, SyntheticCorpus, current_rss_mb, run_scenario
+from chatbot_app.encoders import get_encoder
+from chatbot_app.generations import create_generation, purge_generation
+from chatbot_app.models import ChatMessage, ChatSession, Document, DocumentEmbedding
+from chatbot_app.rag_pipeline import RAGPipeline
+
+CORPUS_SIZES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+SCENARIOS = ['index_build', 'retrieve', 'retrieve_cached', 'chat_history', 'chat', 'ingest']
+# Documents and embeddings written per bulk_create while loading the corpus
+LOAD_BATCH_SIZE = 2000
+# Distinct questions in the hot set of the retrieve_cached scenario
+HOT_QUERIES = 20
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark retrieval, index build, ingestion and the chat endpoints against a '
+        'synthetic corpus and a local Ollama stand-in, and report p50/p95/p99 latency, '
+        'throughput and RSS as JSON. Writes throwaway data that is removed afterwards, '
+        'so prefer a scratch database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', choices=CORPUS_SIZES, default='1k', help='Synthetic corpus size in chunks')
+        parser.add_argument('--chunks', type=int, help='Exact corpus size, overriding --corpus')
+        parser.add_argument(
+            '--scenarios', default=','.join(SCENARIOS),
+            help=f'Comma separated scenarios to run (default: all of {", ".join(SCENARIOS)})',
+        )
+        parser.add_argument('--iterations', type=int, default=200, help='Measured calls per scenario')
+        parser.add_argument('--concurrency', type=int, default=1, help='Threads calling each scenario')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured calls before each scenario')
+        parser.add_argument('--build-repeat', type=int, default=3, help='Index builds measured')
+        parser.add_argument('--quantization', choices=['none', 'int8', 'binary'], default='none')
+        parser.add_argument('--dimension', type=int, default=384, help='Vector dimension of the hash encoder')
+        parser.add_argument(
+            '--encoder', choices=['hash', 'configured'], default='hash',
+            help='hash: deterministic offline stand-in (default); configured: the RAG_SETTINGS encoder',
+        )
+        parser.add_argument('--ollama-latency-ms', type=float, default=50, help='Fake Ollama time before the first token')
+        parser.add_argument('--ollama-tokens-per-second', type=float, default=200)
+        parser.add_argument('--ollama-tokens', type=int, default=40, help='Tokens per fake Ollama answer')
+        parser.add_argument('--chat-rag', action='store_true', help='Retrieve context from the corpus in the chat scenario')
+        parser.add_argument('--history-sessions', type=int, default=50)
+        parser.add_argument('--history-messages', type=int, default=20)
+        parser.add_argument('--ingest-batch', type=int, default=20, help='Documents per ingestion call')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        self.options = options
+        self.verbose = bool(options['output'])
+        self.run_id = f"benchmark-{timezone.now().strftime('%Y%m%d%H%M%S%f')}"
+        size = options['chunks'] or CORPUS_SIZES[options['corpus']]
+        self.corpus = SyntheticCorpus(size, seed=options['seed'])
+        self.queries = self.corpus.queries(max(options['iterations'], 1) + options['warmup'])
+
+        report = {
+            'run': {
+                'id': self.run_id,
+                'started_at': timezone.now().isoformat(),
+                'corpus_chunks': size,
+                'quantization': options['quantization'],
+                'encoder': options['encoder'],
+                'concurrency': options['concurrency'],
+                'database': connection.vendor,
+                'debug': settings.DEBUG,
+                'python': platform.python_version(),
+                'faiss': getattr(faiss, '__version__', None),
+                'numpy': np.__version__,
+            },
+            'scenarios': {},
+        }
+        if settings.DEBUG:
+            self.log(self.style.WARNING('DEBUG is on; query logging adds overhead to database-bound scenarios'))
+
+        self.user = None
+        self.generation = None
+        try:
+            self.setup(report)
+            # Ingestion changes the index, so it runs last
+            for name in SCENARIOS:
+                if name in scenarios:
+                    self.log(f'Running {name}...')
+                    report['scenarios'][name] = getattr(self, f'scenario_{name}')()
+                    self.log(f"  {self.describe(report['scenarios'][name])}")
+        finally:
+            self.cleanup()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def log(self, message):
+        # Progress goes to stderr unless the report is written to a file
+        (self.stdout if self.verbose else self.stderr).write(message)
+
+    def describe(self, result):
+        if 'p50_ms' not in result:
+            return f"no successful calls ({result.get('first_error')})"
+        return (
+            f"p50 {result['p50_ms']:.2f} ms, p95 {result['p95_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms, "
+            f"{result['throughput_per_s']}/s, {result['errors']} errors, RSS {result['rss_mb']} MB"
+        )
+
+    # Fixtures
+
+    def setup(self, report):
+        options = self.options
+        if options['encoder'] == 'hash':
+            encoder = HashEncoder(options['dimension'], seed=options['seed'])
+            self.generation = create_generation(
+                embedding_model='benchmark/hash-encoder',
+                vector_dimension=options['dimension'],
+                quantization=options['quantization'],
+                status='ready',
+            )
+        else:
+            self.generation = create_generation(quantization=options['quantization'], status='ready')
+            encoder = get_encoder(self.generation.embedding_model)
+        self.pipeline = RAGPipeline(use_snapshot=False, generation=self.generation, encoder=encoder)
+        # Return hits whatever the encoder's score scale, so results are resolved from the database
+        self.pipeline.similarity_threshold = -1.0
+
+        self.log(f'Loading {self.corpus.size} synthetic chunks...')
+        rss_before = current_rss_mb()
+        started = timezone.now()
+        for start in range(0, self.corpus.size, LOAD_BATCH_SIZE):
+            self.load_documents(start, min(start + LOAD_BATCH_SIZE, self.corpus.size))
+        wall = (timezone.now() - started).total_seconds()
+        report['run']['corpus_load'] = {
+            'wall_s': round(wall, 3),
+            'chunks_per_s': round(self.corpus.size / wall, 1) if wall else None,
+            'rss_delta_mb': round(current_rss_mb() - rss_before, 1) if rss_before is not None else None,
+        }
+        self.pipeline.rebuild_index()
+
+        self.user = User.objects.create_user(username=self.run_id)
+
+    def load_documents(self, start, stop):
+        """Store corpus documents with their embeddings, without indexing them"""
+        documents = Document.objects.bulk_create([
+            Document(title=title, content=content, tenant=self.run_id)
+            for title, content in self.corpus.documents(start, stop)
+        ])
+        texts = [self.pipeline.chunk_document(document)[0] for document in documents]
+        vectors = self.pipeline.encode_texts(texts)
+        embeddings = []
+        for document, text, vector in zip(documents, texts, vectors):
+            embedding = DocumentEmbedding(
+                document=document,
+                generation=self.generation,
+                chunk_index=0,
+                chunk_text=text,
+                embedding_model=self.generation.embedding_model,
+                content_hash=self.pipeline.content_hash(text),
+            )
+            embedding.set_embedding(vector, self.generation.quantization)
+            embeddings.append(embedding)
+        DocumentEmbedding.objects.bulk_create(embeddings)
+
+    def cleanup(self):
+        if self.generation is not None:
+            DocumentEmbedding.objects.filter(generation=self.generation).delete()
+            purge_generation(self.generation.id)
+        Document.objects.filter(tenant=self.run_id).delete()
+        ChatSession.objects.filter(session_id__startswith=self.run_id).delete()
+        if self.user is not None:
+            self.user.delete()
+
+    def run(self, operation, iterations=None, concurrency=None):
+        return run_scenario(
+            operation,
+            self.options['iterations'] if iterations is None else iterations,
+            concurrency=self.options['concurrency'] if concurrency is None else concurrency,
+            warmup=self.options['warmup'],
+        )
+
+    # Scenarios
+
+    def scenario_index_build(self):
+        # Builds are slow and memory-bound, so they run one at a time
+        result = run_scenario(lambda i: self.pipeline.rebuild_index(), self.options['build_repeat'])
+        result['vectors'] = self.pipeline.faiss_index.ntotal
+        return result
+
+    def scenario_retrieve(self):
+        queries = self.queries
+        with self.retrieval_cache(0):
+            return self.run(lambda i: self.pipeline.retrieve_relevant_documents(queries[i % len(queries)]))
+
+    def scenario_retrieve_cached(self):
+        # A small set of popular questions, as with FAQ traffic
+        queries = self.queries[:HOT_QUERIES]
+        with self.retrieval_cache(300):
+            return self.run(lambda i: self.pipeline.retrieve_relevant_documents(queries[i % len(queries)]))
+
+    def scenario_chat_history(self):
+        now = timezone.now()
+        sessions = ChatSession.objects.bulk_create([
+            ChatSession(user=self.user, session_id=f'{self.run_id}-history-{i}', created_at=now - timedelta(hours=i))
+            for i in range(self.options['history_sessions'])
+        ])
+        ChatMessage.objects.bulk_create([
+            ChatMessage(session=session, message_type='user' if j % 2 else 'bot', content=f'message {j}')
+            for session in sessions
+            for j in range(self.options['history_messages'])
+        ])
+        token = f'Bearer {tokens_for_user(self.user).access_token}'
+
+        def operation(i):
+            response = Client(HTTP_AUTHORIZATION=token).get('/api/chat-history/')
+            if response.status_code != 200:
+                raise RuntimeError(f'HTTP {response.status_code}')
+
+        with self.test_host():
+            return self.run(operation)
+
+    def scenario_chat(self):
+        options = self.options
+        queries = self.queries
+        server = FakeOllamaServer(
+            latency_ms=options['ollama_latency_ms'],
+            tokens_per_second=options['ollama_tokens_per_second'],
+            tokens=options['ollama_tokens'],
+        )
+
+        def operation(i):
+            response = Client().post('/api/chat/', {
+                'message': queries[i % len(queries)],
+                'session_id': f'{self.run_id}-chat-{i}',
+            }, content_type='application/json')
+            if response.status_code != 200 or not response.json().get('ai_available'):
+                raise RuntimeError(f'HTTP {response.status_code}: {response.content[:200]!r}')
+
+        with server, self.test_host(), override_settings(
+            OLLAMA_BASE_URL=server.url, USE_RAG_PIPELINE=options['chat_rag'],
+            # Every benchmark request comes from the same address
+            RATE_LIMITS=dict(getattr(settings, 'RATE_LIMITS', {}), ENABLED=False),
+        ), self.retrieval_cache(0), mock.patch(
+            # The chat view serves the benchmark corpus instead of the active generation
+            'chatbot_app.rag_pipeline.get_rag_pipeline', return_value=self.pipeline
+        ):
+            result = self.run(operation)
+        result['ollama'] = {
+            'latency_ms': options['ollama_latency_ms'],
+            'tokens_per_second': options['ollama_tokens_per_second'],
+            'tokens': options['ollama_tokens'],
+            'rag': options['chat_rag'],
+        }
+        return result
+
+    def scenario_ingest(self):
+        batch = self.options['ingest_batch']
+        start = self.corpus.size
+        corpus = SyntheticCorpus(
+            start + (self.options['iterations'] + self.options['warmup']) * batch, seed=self.options['seed']
+        )
+
+        def operation(i):
+            documents = Document.objects.bulk_create([
+                Document(title=title, content=content, tenant=self.run_id)
+                for title, content in corpus.documents(start + i * batch, start + (i + 1) * batch)
+            ])
+            self.pipeline.add_documents(documents)
+
+        # Writers would only contend for the database, so batches run one at a time
+        result = self.run(operation, concurrency=1)
+        result['batch_size'] = batch
+        result['documents_per_s'] = round(result['throughput_per_s'] * batch, 1) if result['throughput_per_s'] else None
+        return result
+
+    # Helpers
+
+    def retrieval_cache(self, timeout):
+        rag_settings = dict(getattr(settings, 'RAG_SETTINGS', {}), RETRIEVAL_CACHE_TIMEOUT=timeout)
+        return override_settings(RAG_SETTINGS=rag_settings)
+
+    def test_host(self):
+        # The test client sends requests for "testserver"
+        return override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'])
@@ -0,0 +1,35 @@
+# chatbot_app/management/commands/run_scheduler.py
+from django.core.management.base import BaseCommand
+
+from chatbot_app.scheduler import build_scheduler, run_job
+
+
+class Command(BaseCommand):
+    help = 'Run the maintenance jobs from MAINTENANCE_SCHEDULE with APScheduler (no Celery needed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--run-now',
+            metavar='JOB',
+            help='Run a single job immediately and exit instead of starting the scheduler',
+        )
+
+    def handle(self, *args, **options):
+        scheduler = build_scheduler(blocking=True)
+
+        if options['run_now']:
+            job = scheduler.get_job(options['run_now'])
+            if job is None:
+                names = ', '.join(j.id for j in scheduler.get_jobs())
+                self.stderr.write(self.style.ERROR(f"Unknown job '{options['run_now']}'. Jobs: {names}"))
+                return
+            self.stdout.write(str(run_job(*job.args)))
+            return
+
+        for job in scheduler.get_jobs():
+            self.stdout.write(f'Scheduled {job.id}: {job.trigger}')
+        self.stdout.write(self.style.SUCCESS('Scheduler started'))
+        try:
+            scheduler.start()
+        except (KeyboardInterrupt, SystemExit):
+            self.stdout.write('Scheduler stopped')
@@ -1,6 +1,7 @@
 # chatbot_app/management/commands/setup_rag.py
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from chatbot_app.extraction import text_sha256
 from chatbot_app.models import Document
 from chatbot_app.rag_pipeline import RAGPipeline
 import os
@@ -14,6 +15,11 @@ class Command(BaseCommand):
             action='store_true',
             help='Add sample documents for testing',
         )
+        parser.add_argument(
+            '--reindex',
+            action='store_true',
+            help='Re-embed active documents whose text changed since their last embedding',
+        )
 
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Setting up RAG pipeline...'))
@@ -24,6 +30,9 @@ class Command(BaseCommand):
         if options['sample_docs']:
             self.add_sample_documents(rag_pipeline)
         
+        if options['reindex']:
+            self.reindex(rag_pipeline)
+        
         self.stdout.write(self.style.SUCCESS('RAG pipeline setup completed!'))
 
     def add_sample_documents(self, rag_pipeline):
@@ -66,18 +75,49 @@ class Command(BaseCommand):
             }
         ]
         
+        documents = []
         for doc_data in sample_docs:
-            document, created = Document.objects.get_or_create(
-                title=doc_data['title'],
-                defaults={
-                    'content': doc_data['content'],
-                    'document_type': 'text',
-                    'is_active': True
-                }
-            )
-            
-            if created:
-                rag_pipeline.add_document(document)
+            source_hash = text_sha256(doc_data['content'])
+            document = Document.objects.filter(title=doc_data['title']).first()
+            if document is None:
+                document = Document.objects.create(
+                    title=doc_data['title'],
+                    content=doc_data['content'],
+                    document_type='text',
+                    source_hash=source_hash,
+                    is_active=True
+                )
                 self.stdout.write(f'Added document: {document.title}')
+            elif document.source_hash != source_hash or not document.is_active:
+                document.content = doc_data['content']
+                document.source_hash = source_hash
+                document.is_active = True
+                document.save()
+                self.stdout.write(f'Updated document: {document.title}')
             else:
                 self.stdout.write(f'Document already exists: {document.title}')
+            documents.append(document)
+        
+        # Unchanged documents are skipped by their chunk hashes
+        chunk_count = rag_pipeline.add_documents(documents)
+        self.stdout.write(f'Embedded {chunk_count} chunks')
+
+    def reindex(self, rag_pipeline):
+        """Run every active document through the pipeline, embedding only changed text"""
+        batch_size = getattr(settings, 'RAG_SETTINGS', {}).get('INGEST_BATCH_SIZE', 20)
+        documents = Document.objects.filter(is_active=True).order_by('id')
+        
+        total_documents = total_chunks = 0
+        batch = []
+        for document in documents.iterator(chunk_size=batch_size):
+            batch.append(document)
+            if len(batch) == batch_size:
+                total_chunks += rag_pipeline.add_documents(batch)
+                total_documents += len(batch)
+                batch = []
+        if batch:
+            total_chunks += rag_pipeline.add_documents(batch)
+            total_documents += len(batch)
+        
+        rag_pipeline.save_snapshot()
+        self.stdout.write(f'Reindexed {total_documents} documents ({total_chunks} chunks re-embedded)')
@@ -0,0 +1,25 @@
+# chatbot_app/management/commands/warm_model.py
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot_app.ollama import active_model, ollama_settings, prewarm_model
+
+
+class Command(BaseCommand):
+    help = (
+        'Load the active ChatbotConfig model (or --model) into Ollama and keep it loaded for '
+        'KEEP_ALIVE_MAX seconds, e.g. from a deploy script before traffic arrives'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', help='Model to load (default: the active ChatbotConfig model)')
+
+    def handle(self, *args, **options):
+        model = options['model'] or active_model()
+        try:
+            load_ms = prewarm_model(model)
+        except requests.exceptions.RequestException as e:
+            raise CommandError(f'Could not load {model}: {e}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{model} loaded in {load_ms:.0f} ms, kept for {ollama_settings()["keep_alive_max"]} s'
+        ))
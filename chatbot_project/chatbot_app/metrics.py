@@ -0,0 +1,189 @@
+# chatbot_app/metrics.py
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; from a cache hit to a slow model answer
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class Metric:
+    """A named metric with optional labels, safe to update from any thread"""
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f'{self.name} takes labels {self.label_names}, got {tuple(labels)}')
+        return tuple((name, labels[name]) for name in self.label_names)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self, key, value):
+        return [f'{self.name}_total{_format_labels(key)} {_format_value(value)}']
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def _samples(self, key, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state['buckets']):
+            cumulative += count
+            labels = _format_labels(key + (('le', _format_value(bound)),))
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        lines.append(f'{self.name}_sum{_format_labels(key)} {_format_value(state["sum"])}')
+        lines.append(f'{self.name}_count{_format_labels(key)} {state["count"]}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labels, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labels, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f'{name} is already registered as a {metric.kind}')
+            return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._get_or_create(Counter, name, documentation, labels)
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labels, buckets=buckets)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Metrics live in the process that records them; with several worker
+# processes each one is scraped (or aggregated) separately
+REGISTRY = Registry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    'chatbot_stage_duration_seconds', 'Time spent in each stage of a request', labels=('stage',)
+)
+CHAT_REQUESTS = REGISTRY.counter(
+    'chatbot_chat_requests', 'Chat turns by whether the model answered or the fallback was used', labels=('outcome',)
+)
+LLM_TOKENS = REGISTRY.counter('chatbot_llm_tokens', 'Tokens generated by the language model', labels=('model',))
+LLM_TOKENS_PER_SECOND = REGISTRY.histogram(
+    'chatbot_llm_tokens_per_second', 'Generation speed of the language model', labels=('model',),
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 200, 500),
+)
+LLM_COLD_LOADS = REGISTRY.counter(
+    'chatbot_llm_cold_loads', 'Generations that had to load the model into memory first', labels=('model',)
+)
+LLM_CONTEXT_REUSE = REGISTRY.counter(
+    'chatbot_llm_context_reuse', 'Chat turns continuing from the Ollama context of the previous turn, by result',
+    labels=('result',),
+)
+RETRIEVAL_CACHE = REGISTRY.counter(
+    'chatbot_retrieval_cache_requests', 'Retrieval result cache lookups by result', labels=('result',)
+)
+NEAR_CACHE = REGISTRY.counter(
+    'chatbot_near_cache_requests', 'Shared cache reads by the tier that answered: local, remote or miss',
+    labels=('result',),
+)
+QUERY_BATCH_SIZE = REGISTRY.histogram(
+    'chatbot_rag_query_batch_size', 'Queries encoded and searched together',
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+RAG_ERRORS = REGISTRY.counter('chatbot_rag_errors', 'Errors inside the RAG pipeline', labels=('operation',))
+
+_request_timings = contextvars.ContextVar('chatbot_request_timings', default=None)
+
+
+@contextmanager
+def trace():
+    """Collect the duration of every span inside the block, in milliseconds by stage"""
+    timings = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+@contextmanager
+def span(stage):
+    """Time a stage into STAGE_DURATION and into the surrounding trace, if any"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_DURATION.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0) + elapsed * 1000, 3)
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_app', '0002_chat_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userpreference',
+            name='chat_retention_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
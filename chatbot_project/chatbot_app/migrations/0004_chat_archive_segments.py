@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_app', '0003_userpreference_chat_retention_days'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='archived_message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ChatArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('file_path', models.CharField(max_length=500)),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archive_segments', to='chatbot_app.chatsession')),
+            ],
+            options={
+                'ordering': ['session', 'month'],
+                'indexes': [models.Index(fields=['last_timestamp'], name='chatarchive_last_ts_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='chatarchivesegment',
+            constraint=models.UniqueConstraint(fields=('session', 'month'), name='unique_archive_segment_month'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:47
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chatbot_app', '0004_chat_archive_segments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('document_ids', models.JSONField(blank=True, default=list)),
+                ('source_files', models.JSONField(blank=True, default=list)),
+                ('total_documents', models.PositiveIntegerField(default=0)),
+                ('processed_documents', models.PositiveIntegerField(default=0)),
+                ('total_chunks', models.PositiveIntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='documentembedding',
+            options={'ordering': ['document', 'chunk_index']},
+        ),
+        migrations.AddField(
+            model_name='documentembedding',
+            name='chunk_index',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='documentembedding',
+            name='chunk_text',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='documentembedding',
+            name='document',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='chatbot_app.document'),
+        ),
+        migrations.AddConstraint(
+            model_name='documentembedding',
+            constraint=models.UniqueConstraint(fields=('document', 'embedding_model', 'chunk_index'), name='unique_document_chunk_embedding'),
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='created_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_app', '0005_chunked_embeddings_ingestion_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='file',
+            field=models.FileField(blank=True, upload_to='documents/%Y/%m/'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='source_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='content',
+            field=models.TextField(blank=True),
+        ),
+    ]
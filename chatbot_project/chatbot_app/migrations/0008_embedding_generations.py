@@ -0,0 +1,85 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def assign_generations(apps, schema_editor):
+    """Put existing embeddings into one generation per embedding model"""
+    EmbeddingGeneration = apps.get_model('chatbot_app', 'EmbeddingGeneration')
+    DocumentEmbedding = apps.get_model('chatbot_app', 'DocumentEmbedding')
+    rag_settings = getattr(settings, 'RAG_SETTINGS', {})
+    configured_model = rag_settings.get('EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+
+    model_names = DocumentEmbedding.objects.order_by().values_list('embedding_model', flat=True).distinct()
+    for model_name in list(model_names):
+        embeddings = DocumentEmbedding.objects.filter(embedding_model=model_name)
+        sample = embeddings.first()
+        is_active = model_name == configured_model
+        generation = EmbeddingGeneration.objects.create(
+            embedding_model=model_name,
+            vector_dimension=len(sample.embedding_data) or rag_settings.get('VECTOR_DIMENSION', 384),
+            chunk_size=rag_settings.get('CHUNK_SIZE', 1000),
+            chunk_overlap=rag_settings.get('CHUNK_OVERLAP', 100),
+            status='active' if is_active else 'retired',
+            is_active=is_active,
+            document_count=embeddings.values('document_id').distinct().count(),
+            chunk_count=embeddings.count(),
+        )
+        embeddings.update(generation=generation)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_app', '0007_embedding_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('embedding_model', models.CharField(max_length=100)),
+                ('vector_dimension', models.PositiveIntegerField(default=384)),
+                ('chunk_size', models.PositiveIntegerField(default=1000)),
+                ('chunk_overlap', models.PositiveIntegerField(default=100)),
+                ('status', models.CharField(choices=[('building', 'Building'), ('ready', 'Ready'), ('active', 'Active'), ('retired', 'Retired'), ('failed', 'Failed')], default='building', max_length=20)),
+                ('is_active', models.BooleanField(default=False)),
+                ('document_count', models.PositiveIntegerField(default=0)),
+                ('chunk_count', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('built_at', models.DateTimeField(blank=True, null=True)),
+                ('activated_at', models.DateTimeField(blank=True, null=True)),
+                ('previous', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chatbot_app.embeddinggeneration')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='embeddinggeneration',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('is_active',), name='single_active_embedding_generation'),
+        ),
+        migrations.AddField(
+            model_name='documentembedding',
+            name='generation',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='chatbot_app.embeddinggeneration'),
+        ),
+        migrations.RunPython(assign_generations, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='documentembedding',
+            name='generation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='chatbot_app.embeddinggeneration'),
+        ),
+        migrations.RemoveConstraint(
+            model_name='documentembedding',
+            name='unique_document_chunk_embedding',
+        ),
+        migrations.AddConstraint(
+            model_name='documentembedding',
+            constraint=models.UniqueConstraint(fields=('document', 'generation', 'chunk_index'), name='unique_document_generation_chunk'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_app', '0008_embedding_generations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentembedding',
+            name='vector_data',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='embeddinggeneration',
+            name='quantization',
+            field=models.CharField(choices=[('none', 'Float32'), ('int8', 'Int8 scalar quantization'), ('binary', 'Binary codes with int8 rescoring')], default='none', max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_app', '0010_document_owner_tenant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userpreference',
+            name='llm_tokens_per_hour',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
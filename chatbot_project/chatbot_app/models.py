@@ -1,6 +1,7 @@
 # chatbot_app/models.py - ADD MISSING MODELS
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.utils import timezone
 from datetime import timedelta
 
@@ -11,12 +12,24 @@ class ChatSession(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    # Messages moved out of ChatMessage into ChatArchiveSegment files
+    archived_message_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"Session {self.session_id} - {self.user.username if self.user else 'Anonymous'}"
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # chat_history: active sessions of a user, newest first
+            models.Index(
+                fields=['user', '-updated_at', '-id'],
+                name='chatsession_user_active_idx',
+                condition=models.Q(is_active=True),
+            ),
+            # ChatSessionViewSet: all sessions of a user, newest first
+            models.Index(fields=['user', '-updated_at', '-id'], name='chatsession_user_updated_idx'),
+        ]
 
 class ChatMessage(models.Model):
     """Model to store individual chat messages"""
@@ -37,6 +50,38 @@ class ChatMessage(models.Model):
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Messages of a session in (timestamp, id) order
+            models.Index(fields=['session', 'timestamp', 'id'], name='chatmessage_session_ts_idx'),
+            # Retention scans by age
+            models.Index(fields=['timestamp', 'id'], name='chatmessage_timestamp_idx'),
+        ]
+
+class ChatArchiveSegment(models.Model):
+    """Archived messages of one session for one month, stored as gzipped JSONL"""
+    session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='archive_segments')
+    month = models.DateField()  # First day of the month
+    file_path = models.CharField(max_length=500)  # Relative to MEDIA_ROOT
+    message_count = models.PositiveIntegerField(default=0)
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Archive {self.month:%Y-%m} of {self.session.session_id}"
+
+    class Meta:
+        ordering = ['session', 'month']
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'month'], name='unique_archive_segment_month'),
+        ]
+        indexes = [
+            models.Index(fields=['last_timestamp'], name='chatarchive_last_ts_idx'),
+        ]
+
+# Longest chat history a user can ask to keep, ten years
+MAX_RETENTION_DAYS = 3650
 
 class UserPreference(models.Model):
     """Model to store user preferences for the chatbot"""
@@ -45,6 +90,12 @@ class UserPreference(models.Model):
     theme = models.CharField(max_length=20, default='light')
     chat_history_enabled = models.BooleanField(default=True)
     notifications_enabled = models.BooleanField(default=True)
+    # Days of chat history to keep; falls back to CHAT_RETENTION['DEFAULT_DAYS']
+    chat_retention_days = models.PositiveIntegerField(
+        null=True, blank=True, validators=[MinValueValidator(1), MaxValueValidator(MAX_RETENTION_DAYS)]
+    )
+    # Generated LLM tokens allowed per hour; falls back to RATE_LIMITS['LLM_TOKENS_PER_HOUR']
+    llm_tokens_per_hour = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -73,8 +124,13 @@ class ChatbotConfig(models.Model):
 class Document(models.Model):
     """Model to store documents for RAG pipeline"""
     title = models.CharField(max_length=200)
-    content = models.TextField()
+    content = models.TextField(blank=True)  # Filled in from the file for uploads
     document_type = models.CharField(max_length=50, default='text')
+    file = models.FileField(upload_to='documents/%Y/%m/', blank=True)
+    source_hash = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256 of the upload
+    # Documents without an owner are visible to everyone
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='documents')
+    tenant = models.CharField(max_length=100, blank=True, db_index=True)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
@@ -85,26 +141,134 @@ class Document(models.Model):
     class Meta:
         ordering = ['-created_at']
 
+class EmbeddingGeneration(models.Model):
+    """An embedding model and chunking configuration with its own set of embeddings"""
+    STATUS_CHOICES = [
+        ('building', 'Building'),
+        ('ready', 'Ready'),
+        ('active', 'Active'),
+        ('retired', 'Retired'),
+        ('failed', 'Failed'),
+    ]
+    QUANTIZATION_CHOICES = [
+        ('none', 'Float32'),
+        ('int8', 'Int8 scalar quantization'),
+        ('binary', 'Binary codes with int8 rescoring'),
+    ]
+    
+    embedding_model = models.CharField(max_length=100)
+    vector_dimension = models.PositiveIntegerField(default=384)
+    quantization = models.CharField(max_length=10, choices=QUANTIZATION_CHOICES, default='none')
+    chunk_size = models.PositiveIntegerField(default=1000)
+    chunk_overlap = models.PositiveIntegerField(default=100)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='building')
+    is_active = models.BooleanField(default=False)
+    # Generation that was serving before this one was activated, for rollback
+    previous = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    document_count = models.PositiveIntegerField(default=0)
+    chunk_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    built_at = models.DateTimeField(null=True, blank=True)
+    activated_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['is_active'],
+                condition=models.Q(is_active=True),
+                name='single_active_embedding_generation'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.embedding_model} (generation {self.id})"
+
 class DocumentEmbedding(models.Model):
-    """Model to store document embeddings for vector search"""
-    document = models.OneToOneField(Document, on_delete=models.CASCADE)
+    """Model to store the embedding of one chunk of a document for vector search"""
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='embeddings')
+    generation = models.ForeignKey(EmbeddingGeneration, on_delete=models.CASCADE, related_name='embeddings')
+    chunk_index = models.PositiveIntegerField(default=0)
+    chunk_text = models.TextField(blank=True)  # Empty for whole-document embeddings
     embedding_model = models.CharField(max_length=100)
+    # SHA-256 of the normalized chunk text and model name, see RAGPipeline.content_hash
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
     embedding_data = models.JSONField(default=list)  # Store as JSON array
+    # Int8-quantized vector used instead of embedding_data by quantized generations
+    vector_data = models.BinaryField(null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
     
-    def set_embedding(self, embedding_vector):
-        """Store embedding vector as JSON"""
-        if hasattr(embedding_vector, 'tolist'):
+    class Meta:
+        ordering = ['document', 'chunk_index']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['document', 'generation', 'chunk_index'],
+                name='unique_document_generation_chunk'
+            ),
+        ]
+    
+    def set_embedding(self, embedding_vector, quantization='none'):
+        """Store embedding vector as JSON, or as int8 bytes for quantized generations"""
+        if quantization != 'none':
+            from .quantization import quantize_int8
+            self.vector_data = quantize_int8(embedding_vector)
+            self.embedding_data = []
+        elif hasattr(embedding_vector, 'tolist'):
             self.embedding_data = embedding_vector.tolist()
         else:
             self.embedding_data = list(embedding_vector)
         
     def get_embedding(self):
         """Retrieve embedding vector"""
+        if self.vector_data:
+            from .quantization import dequantize_int8
+            return dequantize_int8(self.vector_data).tolist()
         return self.embedding_data
     
     def __str__(self):
-        return f"Embedding for {self.document.title}"
+        return f"Embedding for {self.document.title} (chunk {self.chunk_index})"
+
+class IngestionJob(models.Model):
+    """Background ingestion of documents into the RAG index"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    document_ids = models.JSONField(default=list, blank=True)
+    source_files = models.JSONField(default=list, blank=True)  # Paths relative to MEDIA_ROOT
+    total_documents = models.PositiveIntegerField(default=0)
+    processed_documents = models.PositiveIntegerField(default=0)
+    total_chunks = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    def duration_seconds(self):
+        if not self.started_at:
+            return 0.0
+        end = self.finished_at or timezone.now()
+        return max((end - self.started_at).total_seconds(), 0.0)
+    
+    def documents_per_second(self):
+        duration = self.duration_seconds()
+        return self.processed_documents / duration if duration else 0.0
+    
+    def chunks_per_second(self):
+        duration = self.duration_seconds()
+        return self.total_chunks / duration if duration else 0.0
+    
+    def __str__(self):
+        return f"Ingestion job {self.id} ({self.status})"
+    
+    class Meta:
+        ordering = ['-created_at']
 
 class EmailVerification(models.Model):
     """Model to store email verification tokens"""
@@ -0,0 +1,159 @@
+# chatbot_app/ollama.py
+import hashlib
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from .metrics import LLM_CONTEXT_REUSE
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_CACHE_PREFIX = 'chatbot:ollama:context:'
+# keep_alive covers the longest recent gap between a model's requests by this much
+GAP_MARGIN = 1.5
+# Request times remembered per model
+MAX_SAMPLES = 256
+
+
+def ollama_settings():
+    ollama = getattr(settings, 'OLLAMA_SETTINGS', {})
+    return {
+        'keep_alive_min': ollama.get('KEEP_ALIVE_MIN', 300),
+        'keep_alive_max': ollama.get('KEEP_ALIVE_MAX', 3600),
+        'traffic_window': ollama.get('TRAFFIC_WINDOW', 3600),
+        'prewarm': ollama.get('PREWARM', False),
+        'prewarm_timeout': ollama.get('PREWARM_TIMEOUT', 120),
+        'num_ctx': ollama.get('NUM_CTX', 2048),
+        'conversation_context': ollama.get('CONVERSATION_CONTEXT', False),
+        'context_reserve_tokens': ollama.get('CONTEXT_RESERVE_TOKENS', 1024),
+        'context_timeout': ollama.get('CONTEXT_TIMEOUT', 1800),
+    }
+
+
+def model_options():
+    """
+    Options sent with every request. Ollama reloads a model whose num_ctx
+    changes, so pre-warming and chat must agree on it.
+    """
+    return {'num_ctx': ollama_settings()['num_ctx']}
+
+
+class ModelTraffic:
+    """
+    When each model was asked for lately, in this process, and how long
+    Ollama should keep it loaded as a result. Every request resets Ollama's
+    unload timer, so keep_alive only has to outlast the lulls: it covers the
+    longest gap between a model's requests in the last TRAFFIC_WINDOW
+    seconds, between KEEP_ALIVE_MIN and KEEP_ALIVE_MAX. Bursty traffic keeps
+    its model loaded through the quiet spells; a model nobody uses gets the
+    minimum and frees its memory.
+    """
+
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self._requests = defaultdict(lambda: deque(maxlen=max_samples))
+        self._lock = threading.Lock()
+
+    def keep_alive(self, model, now=None):
+        """Record a request for ``model``; returns the keep_alive in seconds to send with it"""
+        config = ollama_settings()
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            times = self._requests[model]
+            times.append(now)
+            while times and times[0] < now - config['traffic_window']:
+                times.popleft()
+            longest_gap = max((later - earlier for earlier, later in zip(times, list(times)[1:])), default=0)
+        return int(min(config['keep_alive_max'], max(config['keep_alive_min'], longest_gap * GAP_MARGIN)))
+
+
+model_traffic = ModelTraffic()
+
+
+def _context_key(session, model, system_prompt):
+    # The owner is part of the key, so a context is only ever sent back on
+    # behalf of the user whose turns it holds. A new model or system prompt
+    # starts the conversation's context over.
+    digest = hashlib.sha256(f'{model}\0{system_prompt or ""}'.encode('utf-8')).hexdigest()[:16]
+    return f'{CONTEXT_CACHE_PREFIX}{session.user_id or "anonymous"}:{session.session_id}:{digest}'
+
+
+def conversation_context(session, model, system_prompt):
+    """
+    The tokens Ollama returned for the session's last turn, or None to send
+    the system prompt. Only with CONVERSATION_CONTEXT; otherwise every turn
+    stands alone, and Ollama's prompt cache still skips re-evaluating the
+    system prompt the turns share.
+    """
+    if session is None or not ollama_settings()['conversation_context']:
+        return None
+    context = cache.get(_context_key(session, model, system_prompt))
+    LLM_CONTEXT_REUSE.inc(result='hit' if context else 'miss')
+    return context
+
+
+def store_conversation_context(session, model, system_prompt, context):
+    """
+    Keep the ``context`` of a turn for the next one. Once it leaves less
+    than CONTEXT_RESERVE_TOKENS of NUM_CTX for the next prompt and answer
+    it is dropped, so the next turn starts over from the system prompt
+    before Ollama has to truncate it.
+    """
+    if session is None:
+        return
+    config = ollama_settings()
+    if not config['conversation_context']:
+        return
+    key = _context_key(session, model, system_prompt)
+    if not context or len(context) > config['num_ctx'] - config['context_reserve_tokens']:
+        cache.delete(key)
+        return
+    cache.set(key, context, config['context_timeout'])
+
+
+def active_model():
+    """The model of the active ChatbotConfig, else OLLAMA_MODEL"""
+    from .models import ChatbotConfig
+
+    model = ChatbotConfig.objects.filter(is_active=True).values_list('model_name', flat=True).first()
+    return model or getattr(settings, 'OLLAMA_MODEL', 'llama2')
+
+
+def prewarm_model(model=None, base_url=None):
+    """
+    Load a model into Ollama before the first chat needs it, kept for
+    KEEP_ALIVE_MAX seconds until traffic decides otherwise. Returns
+    Ollama's load time in milliseconds.
+    """
+    config = ollama_settings()
+    model = model or active_model()
+    base_url = base_url or getattr(settings, 'OLLAMA_BASE_URL', 'http://localhost:11434')
+    # A generate request without a prompt only loads the model
+    response = requests.post(
+        f'{base_url}/api/generate',
+        json={'model': model, 'keep_alive': config['keep_alive_max'], 'options': model_options()},
+        timeout=config['prewarm_timeout'],
+    )
+    response.raise_for_status()
+    return round(response.json().get('load_duration', 0) / 1e6, 3)
+
+
+def _prewarm():
+    try:
+        model = active_model()
+        load_ms = prewarm_model(model)
+        logger.info("Pre-warmed Ollama model %s in %.0f ms", model, load_ms)
+    except Exception as e:
+        logger.warning("Could not pre-warm the Ollama model: %s", e)
+    finally:
+        close_old_connections()
+
+
+def start_prewarm():
+    """Pre-warm the active model in the background, so startup doesn't wait for Ollama"""
+    threading.Thread(target=_prewarm, name='ollama-prewarm', daemon=True).start()
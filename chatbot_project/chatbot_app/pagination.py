@@ -0,0 +1,151 @@
+# chatbot_app/pagination.py
+import base64
+import heapq
+import json
+from collections import OrderedDict
+from collections.abc import Mapping
+from itertools import islice
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a ``(field, id)`` pair.
+
+    Each page is fetched with a ``WHERE (field, id) > (last_field, last_id)``
+    style filter instead of an OFFSET, so the cost of a page does not depend
+    on how deep into the history the client is.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None, archived=None):
+        """
+        Return one page of ``queryset``.
+
+        ``archived`` optionally supplies rows kept outside the database (see
+        ``archive.iter_archived_messages``), already sorted by ``ordering``;
+        they are merged with the queryset rows into a single sequence.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+
+        field, descending = self._ordering_field()
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            value, last_id = cursor
+            # Written as a range on ``field`` plus a tie-breaker so the
+            # database can seek the (field, id) index instead of scanning
+            before, after = ('lt', 'lte') if descending else ('gt', 'gte')
+            queryset = queryset.filter(
+                Q(**{f'{field}__{after}': value}),
+                Q(**{f'{field}__{before}': value}) | Q(**{f'id__{before}': last_id}),
+            )
+
+        # Fetch one extra row to find out whether there is a next page
+        results = list(queryset[:self.page_size + 1])
+        if archived is not None:
+            older = islice(self._after_cursor(archived, cursor, descending), self.page_size + 1)
+            merged = heapq.merge(older, results, key=self._position, reverse=descending)
+            results = list(islice(merged, self.page_size + 1))
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def _ordering_field(self):
+        field = self.ordering[0]
+        return field.lstrip('-'), field.startswith('-')
+
+    def _position(self, obj):
+        field, _ = self._ordering_field()
+        if isinstance(obj, Mapping):
+            return obj[field], obj['id']
+        return getattr(obj, field), obj.id
+
+    def _after_cursor(self, rows, cursor, descending):
+        for row in rows:
+            if cursor is None:
+                yield row
+            elif descending and self._position(row) < cursor:
+                yield row
+            elif not descending and self._position(row) > cursor:
+                yield row
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, last_id = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            parsed = parse_datetime(value)
+            if parsed is None:
+                raise ValueError(value)
+            return parsed, int(last_id)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj):
+        value, last_id = self._position(obj)
+        payload = json.dumps([value.isoformat(), last_id])
+        return base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+
+    def get_next_cursor(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_next_link(self):
+        cursor = self.get_next_cursor()
+        if cursor is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('next_cursor', self.get_next_cursor()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'next_cursor': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class ChatSessionPagination(KeysetPagination):
+    """Newest-first pagination for chat sessions on (updated_at, id)"""
+    ordering = ('-updated_at', '-id')
+    page_size = 20
+
+
+class ChatMessagePagination(KeysetPagination):
+    """Oldest-first pagination for messages of a session on (timestamp, id)"""
+    ordering = ('timestamp', 'id')
+    page_size = 50
+    max_page_size = 200
@@ -0,0 +1,182 @@
+# chatbot_app/profiling.py
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+FOLDED_PREFIX = 'stacks-'
+REQUESTS_PREFIX = 'requests-'
+# One pair of output files per hour, so a window can be summarized by name
+FILE_HOUR_FORMAT = '%Y%m%d%H'
+
+_write_lock = threading.Lock()
+
+
+def profiling_settings():
+    profiling = getattr(settings, 'REQUEST_PROFILING', {})
+    return {
+        'enabled': profiling.get('ENABLED', False),
+        'sample_rate': profiling.get('SAMPLE_RATE', 0.01),
+        'interval': profiling.get('INTERVAL_MS', 5) / 1000,
+        'path_prefixes': tuple(profiling.get('PATH_PREFIXES', ['/api/'])),
+        'output_dir': profiling.get('OUTPUT_DIR'),
+        'max_concurrent': profiling.get('MAX_CONCURRENT', 2),
+    }
+
+
+def _short_path(filename):
+    """File names without the install prefix, so stacks read and merge across hosts"""
+    marker = 'site-packages' + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    base_dir = str(getattr(settings, 'BASE_DIR', ''))
+    if base_dir and filename.startswith(base_dir):
+        return os.path.relpath(filename, base_dir)
+    return os.path.basename(filename)
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread every ``interval`` seconds from a
+    background thread and counts identical stacks, root first. Frames from
+    ``stop_at`` upwards (the server calling into the request) are left out.
+    """
+
+    def __init__(self, thread_id, interval, stop_at=None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stop_at = stop_at
+        self.stacks = Counter()
+        self._frame_names = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+
+    def _frame_name(self, code):
+        name = self._frame_names.get(code)
+        if name is None:
+            name = self._frame_names[code] = f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})'
+        return name
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame.f_code is not self.stop_at:
+                stack.append(self._frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class QueryRecorder:
+    """Counts and times the SQL queries run through a connection"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def write_profile(output_dir, record, stacks):
+    """
+    Append a request's stacks in the folded format of flamegraph.pl and
+    speedscope (``frame;frame;frame count``) and its summary as JSON lines
+    """
+    hour = timezone.now().strftime(FILE_HOUR_FORMAT)
+    root = f"{record['method']} {record['route']}"
+    folded = ''.join(
+        f"{';'.join((root,) + stack)} {count}\n" for stack, count in stacks.items()
+    )
+    with _write_lock:
+        os.makedirs(output_dir, exist_ok=True)
+        # One write per file keeps concurrent appends from interleaving
+        with open(os.path.join(output_dir, f'{FOLDED_PREFIX}{hour}.folded'), 'a') as folded_file:
+            folded_file.write(folded)
+        with open(os.path.join(output_dir, f'{REQUESTS_PREFIX}{hour}.jsonl'), 'a') as requests_file:
+            requests_file.write(json.dumps(record) + '\n')
+
+
+class ProfilingMiddleware:
+    """
+    Profile a random sample of requests with a statistical stack sampler and
+    record their SQL query count and time.
+
+    Off unless REQUEST_PROFILING['ENABLED'] is set, in which case Django
+    drops the middleware entirely. Unsampled requests only pay for one
+    random() call, and at most MAX_CONCURRENT requests are sampled at once.
+    Summarize the output with ``manage.py profile_summary``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.settings = profiling_settings()
+        if not self.settings['enabled'] or not self.settings['output_dir']:
+            raise MiddlewareNotUsed()
+        self._slots = threading.BoundedSemaphore(self.settings['max_concurrent'])
+
+    def __call__(self, request):
+        if (random.random() >= self.settings['sample_rate']
+                or not request.path.startswith(self.settings['path_prefixes'])
+                or not self._slots.acquire(blocking=False)):
+            return self.get_response(request)
+        try:
+            return self.profile(request)
+        finally:
+            self._slots.release()
+
+    def profile(self, request):
+        sampler = StackSampler(threading.get_ident(), self.settings['interval'], stop_at=self.profile.__code__)
+        queries = QueryRecorder()
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            with connection.execute_wrapper(queries):
+                response = self.get_response(request)
+        finally:
+            sampler.stop()
+        duration = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        record = {
+            'timestamp': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            # The URL pattern groups requests for different ids together
+            'route': f'/{match.route}' if match and match.route else request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'sql_count': queries.count,
+            'sql_ms': round(queries.seconds * 1000, 3),
+            'samples': sum(sampler.stacks.values()),
+            'interval_ms': self.settings['interval'] * 1000,
+        }
+        try:
+            write_profile(self.settings['output_dir'], record, sampler.stacks)
+        except OSError as e:
+            logger.error("Error writing request profile: %s", e)
+        return response
@@ -0,0 +1,94 @@
+# chatbot_app/quantization.py
+import numpy as np
+import faiss
+
+# Below this many vectors the int8 quantizer is trained on the [-1, 1] range
+# of normalized vectors instead of on the data itself
+MIN_TRAINING_VECTORS = 1000
+
+
+def quantize_int8(vector):
+    """
+    Pack a vector as a float32 scale followed by one signed byte per dimension.
+
+    A 384-dim vector takes 388 bytes instead of 1.5KB as float32 (and several
+    KB as a JSON list).
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    scale = float(np.abs(vector).max()) / 127 or 1.0
+    codes = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+    return np.float32(scale).tobytes() + codes.tobytes()
+
+
+def dequantize_int8(data):
+    """Inverse of ``quantize_int8``"""
+    data = bytes(data)
+    scale = np.frombuffer(data[:4], dtype=np.float32)[0]
+    return np.frombuffer(data[4:], dtype=np.int8).astype(np.float32) * scale
+
+
+def stored_vector(embedding_data, vector_data):
+    """Float32 vector of a DocumentEmbedding row, whichever way it is stored"""
+    if vector_data:
+        return dequantize_int8(vector_data)
+    return np.array(embedding_data, dtype=np.float32)
+
+
+def binary_codes(vectors):
+    """Sign bits of each vector packed 8 per byte, for Hamming search"""
+    return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+
+def new_index(mode, dimension):
+    if mode == 'int8':
+        return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    if mode == 'binary':
+        return faiss.IndexBinaryFlat(dimension)
+    return faiss.IndexFlatIP(dimension)
+
+
+def add_to_index(index, mode, vectors):
+    """Add L2-normalized float32 vectors, training the int8 quantizer first if needed"""
+    if not len(vectors):
+        return
+    if mode == 'binary':
+        index.add(binary_codes(vectors))
+        return
+    if not index.is_trained:
+        if len(vectors) >= MIN_TRAINING_VECTORS:
+            index.train(vectors)
+        else:
+            bounds = np.array([[-1.0], [1.0]], dtype=np.float32).repeat(index.d, axis=1)
+            index.train(bounds)
+    index.add(vectors)
+
+
+def search_index(index, mode, queries, k, params=None):
+    """
+    Search normalized query vectors. Scores are inner products, except in
+    binary mode where they are Hamming distances (lower is closer).
+    ``params`` optionally restricts the search with an ID selector.
+    """
+    if mode == 'binary':
+        return index.search(binary_codes(queries), k, params=params)
+    return index.search(queries, k, params=params)
+
+
+def write_index(index, mode, path):
+    if mode == 'binary':
+        faiss.write_index_binary(index, path)
+    else:
+        faiss.write_index(index, path)
+
+
+def read_index(mode, path):
+    if mode == 'binary':
+        return faiss.read_index_binary(path)
+    return faiss.read_index(path)
+
+
+def index_bytes(index, mode):
+    """Serialized size of an index, a close estimate of its memory use"""
+    if mode == 'binary':
+        return len(faiss.serialize_index_binary(index))
+    return len(faiss.serialize_index(index))
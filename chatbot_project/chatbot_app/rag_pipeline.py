@@ -1,147 +1,487 @@
 import os
 import json
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import defaultdict
 import numpy as np
 from typing import List, Dict, Any, Optional
-from sentence_transformers import SentenceTransformer
 import faiss
 from django.conf import settings
-from .models import Document, DocumentEmbedding
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from .batching import MicroBatcher
+from .encoders import get_encoder
+from .generations import (
+    active_generation_id, bump_index_version, get_active_generation, index_version, snapshot_directory
+)
+from .index_metadata import PositionMetadata, document_filter_q, filter_key, normalize_filters
+from .metrics import QUERY_BATCH_SIZE, RAG_ERRORS, RETRIEVAL_CACHE, span
+from .models import Document, DocumentEmbedding, EmbeddingGeneration
+from .quantization import add_to_index, new_index, read_index, search_index, stored_vector, write_index
+from .retrieval_cache import invalidate_retrieval_cache, retrieval_cache_key, retrieval_cache_timeout
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_INDEX_FILE = 'index.faiss'
+SNAPSHOT_META_FILE = 'index.json'
+SNAPSHOT_POSITIONS_FILE = 'positions.npz'
+# Embeddings read from the database and added to the index at a time
+INDEX_BUILD_BATCH_SIZE = 10000
+# Keeps ``content_hash__in`` lookups under SQLite's bound parameter limit
+HASH_LOOKUP_BATCH_SIZE = 500
+
+
+def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 100) -> List[str]:
+    """Split text into overlapping chunks of at most chunk_size characters, on word boundaries"""
+    text = text.strip()
+    if len(text) <= chunk_size:
+        return [text] if text else []
+    
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # Prefer to cut at the last whitespace inside the window
+            cut = text.rfind(' ', start + overlap + 1, end)
+            if cut != -1:
+                end = cut
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return [chunk for chunk in chunks if chunk]
+
 
 class RAGPipeline:
     """Retrieval-Augmented Generation Pipeline"""
     
-    def __init__(self):
-        self.embedding_model_name = getattr(settings, 'RAG_SETTINGS', {}).get(
-            'EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2'
-        )
-        self.vector_dimension = getattr(settings, 'RAG_SETTINGS', {}).get(
-            'VECTOR_DIMENSION', 384
-        )
+    def __init__(self, use_snapshot=True, generation=None, encoder=None):
+        # The embedding model and chunking come from the embedding generation,
+        # the serving one unless a generation is being built
+        self.generation = generation or get_active_generation()
+        self.embedding_model_name = self.generation.embedding_model
+        self.vector_dimension = self.generation.vector_dimension
+        self.chunk_size = self.generation.chunk_size
+        self.chunk_overlap = self.generation.chunk_overlap
+        self.quantization = self.generation.quantization
         self.top_k = getattr(settings, 'RAG_SETTINGS', {}).get(
             'TOP_K_RESULTS', 3
         )
         self.similarity_threshold = getattr(settings, 'RAG_SETTINGS', {}).get(
             'SIMILARITY_THRESHOLD', 0.7
         )
+        self.snapshot_dir = snapshot_directory(self.generation)
+        self.embed_batch_size = getattr(settings, 'RAG_SETTINGS', {}).get(
+            'EMBED_BATCH_SIZE', 32
+        )
+        # Binary search returns this many times top_k candidates for rescoring
+        self.rescore_factor = getattr(settings, 'RAG_SETTINGS', {}).get(
+            'RESCORE_FACTOR', 10
+        )
         
-        self.embedding_model = None
+        # Queries arriving within QUERY_BATCH_WAIT_MS of each other are
+        # encoded and searched together; a wait of 0 disables batching
+        query_batch_wait_ms = getattr(settings, 'RAG_SETTINGS', {}).get(
+            'QUERY_BATCH_WAIT_MS', 5
+        )
+        self.query_batch_timeout = getattr(settings, 'RAG_SETTINGS', {}).get(
+            'QUERY_BATCH_TIMEOUT', 30
+        )
+        self._query_batcher = None
+        if query_batch_wait_ms:
+            self._query_batcher = MicroBatcher(
+                self._search_batch,
+                max_batch_size=getattr(settings, 'RAG_SETTINGS', {}).get('QUERY_BATCH_SIZE', 32),
+                max_wait_ms=query_batch_wait_ms,
+                name=f'rag-query-batcher-{self.generation.id}'
+            )
+        
+        self.embedding_model = encoder
         self.faiss_index = None
-        self.document_mappings = {}
-        self._initialize_components()
+        # Embedding id and document attributes per FAISS position
+        self.positions = PositionMetadata()
+        # Guards the index and positions against concurrent ingestion and search
+        self._index_lock = threading.RLock()
+        # The published index version this process's index reflects; read
+        # before loading, so changes made meanwhile trigger another reload
+        self.index_version = index_version(self.generation.id)
+        self._initialize_components(use_snapshot)
     
-    def _initialize_components(self):
+    def _initialize_components(self, use_snapshot=True):
         """Initialize embedding model and FAISS index"""
         try:
-            # Load embedding model
-            self.embedding_model = SentenceTransformer(self.embedding_model_name)
-            
-            # Initialize FAISS index
-            self.faiss_index = faiss.IndexFlatIP(self.vector_dimension)
+            # Load embedding model with the configured encoder backend,
+            # unless an encoder was passed in
+            if self.embedding_model is None:
+                self.embedding_model = get_encoder(self.embedding_model_name)
             
-            # Load existing embeddings
-            self._load_existing_embeddings()
+            # Start from the on-disk snapshot when it is still current,
+            # otherwise build the FAISS index from the stored embeddings
+            if not (use_snapshot and self.load_snapshot()):
+                self.faiss_index = new_index(self.quantization, self.vector_dimension)
+                self._load_existing_embeddings()
             
-        except Exception as e:
-            print(f"Error initializing RAG components: {e}")
+        except Exception:
+            logger.exception('Error initializing RAG components')
+            RAG_ERRORS.inc(operation='initialize')
     
     def _load_existing_embeddings(self):
         """Load existing document embeddings into FAISS index"""
         try:
-            embeddings = DocumentEmbedding.objects.filter(
-                document__is_active=True,
-                embedding_model=self.embedding_model_name
-            )
-            
-            if embeddings.exists():
-                vectors = []
-                doc_ids = []
-                
-                for embedding in embeddings:
-                    vector = np.array(embedding.get_embedding(), dtype=np.float32)
-                    vectors.append(vector)
-                    doc_ids.append(embedding.document.id)
-                
-                if vectors:
-                    vectors_array = np.array(vectors)
-                    # Normalize vectors for cosine similarity
-                    faiss.normalize_L2(vectors_array)
-                    self.faiss_index.add(vectors_array)
-                    
-                    # Create document mapping
-                    for i, doc_id in enumerate(doc_ids):
-                        self.document_mappings[i] = doc_id
+            index, positions = self._build_index()
+            with self._index_lock:
+                self.faiss_index = index
+                self.positions = positions
+            return True
                         
-        except Exception as e:
-            print(f"Error loading embeddings: {e}")
+        except Exception:
+            logger.exception('Error loading embeddings')
+            RAG_ERRORS.inc(operation='load_embeddings')
+            return False
+    
+    def reload_index(self):
+        """
+        Replace the in-memory index after another process changed it: from
+        the snapshot when it is current, else from the stored embeddings.
+        """
+        version = index_version(self.generation.id)
+        if self.load_snapshot() or self._load_existing_embeddings():
+            self.index_version = version
+            return True
+        return False
+    
+    def publish_index_change(self):
+        """
+        Tell the other processes this generation's index changed. This
+        process's index stays current, unless another process changed the
+        index since it was last loaded.
+        """
+        version = bump_index_version(self.generation.id)
+        with self._index_lock:
+            if self.index_version is not None and self.index_version == version - 1:
+                self.index_version = version
+    
+    def _build_index(self):
+        """Build a new FAISS index and its position metadata from the stored embeddings"""
+        index = new_index(self.quantization, self.vector_dimension)
+        positions = PositionMetadata()
+        
+        rows = self._active_embeddings().values_list(
+            'id', 'document_id', 'embedding_data', 'vector_data', 'document__document_type',
+            'document__owner_id', 'document__tenant', 'document__updated_at'
+        )
+        vectors, metadata = [], []
+        for embedding_id, doc_id, embedding_data, vector_data, *document_fields in rows.iterator(chunk_size=2000):
+            vectors.append(stored_vector(embedding_data, vector_data))
+            metadata.append((embedding_id, doc_id, *document_fields))
+            # Add in batches so only one batch of float vectors is held at once
+            if len(vectors) == INDEX_BUILD_BATCH_SIZE:
+                self._add_vectors(index, vectors)
+                positions.append(metadata)
+                vectors, metadata = [], []
+        self._add_vectors(index, vectors)
+        positions.append(metadata)
+        
+        return index, positions
+    
+    def _add_vectors(self, index, vectors):
+        if not len(vectors):
+            return
+        vectors_array = np.array(vectors, dtype=np.float32).reshape(-1, self.vector_dimension)
+        # Normalize vectors for cosine similarity
+        faiss.normalize_L2(vectors_array)
+        add_to_index(index, self.quantization, vectors_array)
+    
+    def chunk_document(self, document: Document) -> List[str]:
+        """Split a document into the texts that get embedded"""
+        return chunk_text(
+            f"{document.title}\n\n{document.content}",
+            chunk_size=self.chunk_size,
+            overlap=self.chunk_overlap
+        )
+    
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        """Embed texts in batches of EMBED_BATCH_SIZE"""
+        if not texts:
+            return np.zeros((0, self.vector_dimension), dtype=np.float32)
+        vectors = self.embedding_model.encode(texts, batch_size=self.embed_batch_size)
+        return np.asarray(vectors, dtype=np.float32)
     
     def add_document(self, document: Document) -> bool:
         """Add a new document to the RAG pipeline"""
         try:
-            # Generate embedding for the document
-            text_to_embed = f"{document.title}\n\n{document.content}"
-            embedding_vector = self.embedding_model.encode([text_to_embed])[0]
-            
-            # Store embedding in database
-            doc_embedding, created = DocumentEmbedding.objects.get_or_create(
-                document=document,
-                defaults={
-                    'embedding_model': self.embedding_model_name
-                }
-            )
-            doc_embedding.set_embedding(embedding_vector)
-            doc_embedding.save()
-            
-            # Add to FAISS index
-            vector = embedding_vector.astype(np.float32).reshape(1, -1)
-            faiss.normalize_L2(vector)
-            index_position = self.faiss_index.ntotal
-            self.faiss_index.add(vector)
-            self.document_mappings[index_position] = document.id
-            
+            self.add_documents([document])
             return True
             
-        except Exception as e:
-            print(f"Error adding document to RAG: {e}")
+        except Exception:
+            logger.exception('Error adding document %s to RAG', document.id)
+            RAG_ERRORS.inc(operation='add_document')
             return False
     
-    def retrieve_relevant_documents(self, query: str) -> List[Dict[str, Any]]:
-        """Retrieve relevant documents for a given query"""
+    def content_hash(self, text: str) -> str:
+        """Hash of a chunk's normalized text and the model that embeds it"""
+        normalized = ' '.join(unicodedata.normalize('NFC', text).split())
+        return hashlib.sha256(f"{self.embedding_model_name}\n{normalized}".encode('utf-8')).hexdigest()
+    
+    def _stored_hashes(self, document_ids):
+        """Ordered chunk hashes currently stored per document for this model"""
+        stored = defaultdict(list)
+        rows = DocumentEmbedding.objects.filter(
+            document_id__in=document_ids,
+            generation=self.generation
+        ).order_by('document_id', 'chunk_index').values_list('document_id', 'content_hash')
+        for doc_id, content_hash in rows:
+            stored[doc_id].append(content_hash)
+        return stored
+    
+    def _stored_vectors(self, content_hashes):
+        """Vectors already stored for any of ``content_hashes``, keyed by hash"""
+        vectors = {}
+        content_hashes = list(content_hashes)
+        for start in range(0, len(content_hashes), HASH_LOOKUP_BATCH_SIZE):
+            rows = DocumentEmbedding.objects.filter(
+                embedding_model=self.embedding_model_name,
+                generation__quantization=self.quantization,
+                content_hash__in=content_hashes[start:start + HASH_LOOKUP_BATCH_SIZE]
+            ).values_list('content_hash', 'embedding_data', 'vector_data')
+            for content_hash, embedding_data, vector_data in rows:
+                if content_hash not in vectors:
+                    vectors[content_hash] = stored_vector(embedding_data, vector_data)
+        return vectors
+    
+    def add_documents(self, documents: List[Document]) -> int:
+        """
+        Chunk, embed and index a batch of documents, replacing any embeddings
+        they already have for this model. Returns the number of chunks added.
+        
+        Documents whose chunks hash the same as their stored embeddings are
+        skipped, and a chunk whose hash is already stored anywhere reuses that
+        vector, so only new text is sent to the embedding model.
+        """
+        chunks_by_document = {
+            document.id: [(text, self.content_hash(text)) for text in self.chunk_document(document)]
+            for document in documents
+        }
+        stored = self._stored_hashes(list(chunks_by_document))
+        changed = [
+            document for document in documents
+            if [content_hash for _, content_hash in chunks_by_document[document.id]] != stored.get(document.id, [])
+        ]
+        changed_ids = {document.id for document in changed}
+        unchanged = [document for document in documents if document.id not in changed_ids]
+        if not changed:
+            # Their vectors stay, but type, owner or tenant may have changed
+            if unchanged:
+                self.update_document_metadata(unchanged)
+            return 0
+        if unchanged:
+            with self._index_lock:
+                self.positions.update_documents(unchanged)
+        invalidate_retrieval_cache(self.generation.id)
+        
+        chunks = [
+            (document, chunk_index, text, content_hash)
+            for document in changed
+            for chunk_index, (text, content_hash) in enumerate(chunks_by_document[document.id])
+        ]
+        known = self._stored_vectors({content_hash for *_, content_hash in chunks})
+        
+        # Embed each unseen text once, even if several chunks share it
+        missing = {}
+        for _, _, text, content_hash in chunks:
+            if content_hash not in known:
+                missing.setdefault(content_hash, text)
+        if missing:
+            with span('rag.ingest_encode'):
+                known.update(zip(missing, self.encode_texts(list(missing.values()))))
+        
+        # Store embeddings in database
+        document_ids = [document.id for document in changed]
+        with span('rag.ingest_store'), transaction.atomic():
+            DocumentEmbedding.objects.filter(
+                document_id__in=document_ids,
+                generation=self.generation
+            ).delete()
+            now = timezone.now()
+            embeddings = []
+            for document, chunk_index, text, content_hash in chunks:
+                embedding = DocumentEmbedding(
+                    document=document,
+                    generation=self.generation,
+                    chunk_index=chunk_index,
+                    chunk_text=text,
+                    embedding_model=self.embedding_model_name,
+                    content_hash=content_hash,
+                    created_at=now
+                )
+                embedding.set_embedding(known[content_hash], self.quantization)
+                embeddings.append(embedding)
+            embeddings = DocumentEmbedding.objects.bulk_create(embeddings)
+        
+        # Add to FAISS index
+        vectors = [known[content_hash] for *_, content_hash in chunks]
+        with self._index_lock:
+            # Vectors of the previous version stay in the index until the next
+            # rebuild, but are excluded from every search
+            self.positions.unmap_documents(document_ids)
+            self._add_vectors(self.faiss_index, vectors)
+            self.positions.append(
+                (embedding.id, embedding.document_id, embedding.document.document_type,
+                 embedding.document.owner_id, embedding.document.tenant, embedding.document.updated_at)
+                for embedding in embeddings
+            )
+        self.publish_index_change()
+        
+        return len(embeddings)
+    
+    def update_document_metadata(self, documents=(), removed_ids=()):
+        """
+        Apply edits that keep a document's text (``documents``) and
+        deactivations (``removed_ids``) to the indexed positions, without
+        re-embedding, so filtered searches see them at once
+        """
+        with self._index_lock:
+            if documents:
+                self.positions.update_documents(documents)
+            if removed_ids:
+                self.positions.unmap_documents(removed_ids)
+        invalidate_retrieval_cache(self.generation.id)
+        self.publish_index_change()
+    
+    def _search_batch(self, items):
+        """
+        Encode several (query, filters) items with one encoder call and search
+        the index once per distinct set of filters. Returns a (query vector,
+        candidates) pair per item.
+        """
+        QUERY_BATCH_SIZE.observe(len(items))
+        with span('rag.query_encode'):
+            query_vectors = np.ascontiguousarray(self.encode_texts([query for query, _ in items]))
+        faiss.normalize_L2(query_vectors)
+        k = self.top_k * self.rescore_factor if self.quantization == 'binary' else self.top_k
+        
+        groups = defaultdict(list)
+        for i, (_, filters) in enumerate(items):
+            groups[filter_key(filters)].append(i)
+        
+        candidates = [None] * len(items)
+        with span('rag.index_search'), self._index_lock:
+            for rows in groups.values():
+                # Filters are applied inside the search, so each query still
+                # gets k hits as long as k chunks match
+                params = self.positions.search_parameters(items[rows[0]][1])
+                scores, indices = search_index(
+                    self.faiss_index, self.quantization, query_vectors[rows], k, params=params
+                )
+                for i, row_scores, row_indices in zip(rows, scores, indices):
+                    hits = [
+                        (self.positions.embedding_id(idx), float(score))
+                        for score, idx in zip(row_scores, row_indices)
+                    ]
+                    candidates[i] = [hit for hit in hits if hit[0] is not None]
+        return list(zip(query_vectors, candidates))
+    
+    def _rescore(self, query_vector, candidates):
+        """Score binary-search candidates against their stored int8 vectors"""
+        rows = DocumentEmbedding.objects.filter(
+            id__in=[embedding_id for embedding_id, _ in candidates]
+        ).values_list('id', 'embedding_data', 'vector_data')
+        rescored = []
+        for embedding_id, embedding_data, vector_data in rows:
+            vector = stored_vector(embedding_data, vector_data)
+            norm = np.linalg.norm(vector)
+            if norm:
+                rescored.append((embedding_id, float(vector @ query_vector / norm)))
+        rescored.sort(key=lambda hit: hit[1], reverse=True)
+        return rescored[:self.top_k]
+    
+    def _search(self, query, filters):
+        """Return (embedding id, cosine score) pairs of the nearest matching chunks, best first"""
+        if self._query_batcher is not None:
+            # Concurrent requests share one encode and one index search
+            future = self._query_batcher.submit((query, filters))
+            query_vector, candidates = future.result(timeout=self.query_batch_timeout)
+        else:
+            query_vector, candidates = self._search_batch([(query, filters)])[0]
+        
+        # Hamming distances only shortlist candidates
+        if self.quantization == 'binary':
+            with span('rag.rescore'):
+                return self._rescore(query_vector, candidates)
+        return candidates
+    
+    def retrieve_relevant_documents(self, query: str, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Retrieve relevant document chunks for a given query, optionally only
+        from documents matching ``filters`` (see index_metadata.normalize_filters)
+        """
         try:
             if not self.embedding_model or self.faiss_index.ntotal == 0:
                 return []
+            filters = normalize_filters(filters)
             
-            # Generate query embedding
-            query_vector = self.embedding_model.encode([query])[0]
-            query_vector = query_vector.astype(np.float32).reshape(1, -1)
-            faiss.normalize_L2(query_vector)
+            # Repeated questions are answered without touching FAISS or the database
+            cache_timeout = retrieval_cache_timeout()
+            if cache_timeout:
+                cache_key = retrieval_cache_key(
+                    query, self.generation.id, self.top_k, self.similarity_threshold, filter_key(filters),
+                    self.index_version
+                )
+                cached = cache.get(cache_key)
+                RETRIEVAL_CACHE.inc(result='miss' if cached is None else 'hit')
+                if cached is not None:
+                    return cached
             
             # Search in FAISS index
-            scores, indices = self.faiss_index.search(query_vector, self.top_k)
+            with span('rag.search'):
+                hits = [
+                    (embedding_id, score) for embedding_id, score in self._search(query, filters)
+                    if score >= self.similarity_threshold
+                ]
+            
+            # Resolve all hits with one query; the filters are checked again
+            # against the database so stale index metadata never leaks a document
+            with span('rag.resolve'):
+                embeddings = DocumentEmbedding.objects.filter(
+                    document_filter_q(filters, prefix='document__'),
+                    id__in=[embedding_id for embedding_id, _ in hits],
+                    document__is_active=True
+                ).select_related('document').defer('embedding_data', 'vector_data', 'document__content')
+                embeddings = {embedding.id: embedding for embedding in embeddings}
             
+            # Plain values rather than model instances, so cached results stay small
             relevant_docs = []
-            for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-                if score >= self.similarity_threshold and idx in self.document_mappings:
-                    doc_id = self.document_mappings[idx]
-                    try:
-                        document = Document.objects.get(id=doc_id, is_active=True)
-                        relevant_docs.append({
-                            'document': document,
-                            'similarity_score': float(score),
-                            'content': document.content,
-                            'title': document.title
-                        })
-                    except Document.DoesNotExist:
-                        continue
+            for embedding_id, score in hits:
+                embedding = embeddings.get(embedding_id)
+                if embedding is None:
+                    continue
+                document = embedding.document
+                relevant_docs.append({
+                    'document_id': document.id,
+                    'embedding_id': embedding.id,
+                    'similarity_score': score,
+                    # Whole-document embeddings have no chunk_text and load the content on demand
+                    'content': embedding.chunk_text or document.content,
+                    'title': document.title
+                })
             
+            if cache_timeout:
+                cache.set(cache_key, relevant_docs, cache_timeout)
             return relevant_docs
             
-        except Exception as e:
-            print(f"Error retrieving documents: {e}")
+        except Exception:
+            logger.exception('Error retrieving documents')
+            RAG_ERRORS.inc(operation='retrieve')
             return []
     
-    def generate_rag_context(self, query: str) -> str:
+    def generate_rag_context(self, query: str, filters: Optional[Dict[str, Any]] = None) -> str:
         """Generate context from retrieved documents"""
-        relevant_docs = self.retrieve_relevant_documents(query)
+        relevant_docs = self.retrieve_relevant_documents(query, filters)
         
         if not relevant_docs:
             return ""
@@ -155,15 +495,152 @@ class RAGPipeline:
     def rebuild_index(self):
         """Rebuild the entire FAISS index"""
         try:
-            # Clear existing index
-            self.faiss_index = faiss.IndexFlatIP(self.vector_dimension)
-            self.document_mappings = {}
+            version = index_version(self.generation.id)
+            # Build the new index aside so searches keep using the old one
+            index, positions = self._build_index()
+            with self._index_lock:
+                self.faiss_index = index
+                self.positions = positions
+                self.index_version = version
+            invalidate_retrieval_cache(self.generation.id)
             
-            # Reload embeddings
-            self._load_existing_embeddings()
+            return True
             
+        except Exception:
+            logger.exception('Error rebuilding index')
+            RAG_ERRORS.inc(operation='rebuild_index')
+            return False
+    
+    def _active_embeddings(self):
+        return DocumentEmbedding.objects.filter(
+            document__is_active=True,
+            generation=self.generation
+        )
+    
+    def _embedding_state(self):
+        """Cheap fingerprint of the stored embeddings used to validate snapshots"""
+        state = self._active_embeddings().aggregate(
+            count=Count('id'), latest=Max('created_at'), documents_updated=Max('document__updated_at')
+        )
+        latest = state['latest'].isoformat() if state['latest'] else None
+        # Document edits that keep the text still change the filter metadata
+        documents_updated = state['documents_updated'].isoformat() if state['documents_updated'] else None
+        return {
+            'vector_count': state['count'],
+            'latest_embedding_at': latest,
+            'latest_document_update': documents_updated,
+        }
+    
+    def save_snapshot(self):
+        """Write the FAISS index and its position metadata to INDEX_SNAPSHOT_DIR"""
+        if not self.snapshot_dir or self.faiss_index is None:
+            return False
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            index_path = os.path.join(self.snapshot_dir, SNAPSHOT_INDEX_FILE)
+            meta_path = os.path.join(self.snapshot_dir, SNAPSHOT_META_FILE)
+            positions_path = os.path.join(self.snapshot_dir, SNAPSHOT_POSITIONS_FILE)
+            
+            # Write to temporary files and rename so readers never see a partial snapshot
+            with self._index_lock:
+                write_index(self.faiss_index, self.quantization, f"{index_path}.tmp")
+                self.positions.save(f"{positions_path}.tmp")
+            with open(f"{meta_path}.tmp", 'w') as meta_file:
+                json.dump({
+                    'embedding_model': self.embedding_model_name,
+                    'generation': self.generation.id,
+                    'quantization': self.quantization,
+                    'created_at': timezone.now().isoformat(),
+                    **self._embedding_state(),
+                }, meta_file)
+            os.replace(f"{index_path}.tmp", index_path)
+            os.replace(f"{positions_path}.tmp", positions_path)
+            os.replace(f"{meta_path}.tmp", meta_path)
             return True
             
-        except Exception as e:
-            print(f"Error rebuilding index: {e}")
+        except Exception:
+            logger.exception('Error saving index snapshot')
+            RAG_ERRORS.inc(operation='save_snapshot')
+            return False
+    
+    def load_snapshot(self):
+        """Load the snapshot if it matches the current model and embedding count"""
+        if not self.snapshot_dir:
             return False
+        index_path = os.path.join(self.snapshot_dir, SNAPSHOT_INDEX_FILE)
+        meta_path = os.path.join(self.snapshot_dir, SNAPSHOT_META_FILE)
+        positions_path = os.path.join(self.snapshot_dir, SNAPSHOT_POSITIONS_FILE)
+        # Snapshots from before position metadata existed have no positions file
+        if not all(os.path.exists(path) for path in (index_path, meta_path, positions_path)):
+            return False
+        try:
+            with open(meta_path) as meta_file:
+                meta = json.load(meta_file)
+            if meta.get('generation') != self.generation.id or meta.get('quantization') != self.quantization:
+                return False
+            # A snapshot taken before documents were added, changed or removed is stale
+            state = self._embedding_state()
+            if any(meta.get(key) != value for key, value in state.items()):
+                return False
+            
+            index = read_index(self.quantization, index_path)
+            positions = PositionMetadata.load(positions_path)
+            if index.ntotal != meta['vector_count'] or positions.size != index.ntotal:
+                return False
+            with self._index_lock:
+                self.faiss_index = index
+                self.positions = positions
+            return True
+            
+        except Exception:
+            logger.exception('Error loading index snapshot')
+            RAG_ERRORS.inc(operation='load_snapshot')
+            return False
+
+
+_shared_pipeline = None
+_shared_pipeline_lock = threading.Lock()
+
+
+def get_rag_pipeline():
+    """
+    Return the per-process RAGPipeline of the active embedding generation.
+    
+    When another generation is activated the new pipeline is built by one
+    thread while the others keep serving from the previous one. Likewise
+    when another process (an ingestion worker, say) publishes a change to
+    the index, one thread reloads it.
+    """
+    global _shared_pipeline
+    generation_id = active_generation_id()
+    pipeline = _shared_pipeline
+    if pipeline is not None and pipeline.generation.id == generation_id:
+        if pipeline.index_version == index_version(generation_id):
+            return pipeline
+    
+    if not _shared_pipeline_lock.acquire(blocking=pipeline is None):
+        return pipeline
+    try:
+        if _shared_pipeline is None or _shared_pipeline.generation.id != generation_id:
+            generation = EmbeddingGeneration.objects.get(id=generation_id)
+            _shared_pipeline = RAGPipeline(generation=generation)
+        elif _shared_pipeline.index_version != index_version(generation_id):
+            _shared_pipeline.reload_index()
+        return _shared_pipeline
+    finally:
+        _shared_pipeline_lock.release()
+
+
+def documents_changed(documents=(), removed_ids=()):
+    """
+    Bring the serving index in line with document metadata edits and
+    deactivations. This process's index is patched if it is loaded; other
+    processes reload theirs.
+    """
+    generation_id = active_generation_id()
+    pipeline = _shared_pipeline
+    if pipeline is not None and pipeline.generation.id == generation_id:
+        pipeline.update_document_metadata(documents, removed_ids)
+    else:
+        invalidate_retrieval_cache(generation_id)
+        bump_index_version(generation_id)
@@ -0,0 +1,57 @@
+# chatbot_app/retrieval_cache.py
+import hashlib
+import unicodedata
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+RETRIEVAL_CACHE_PREFIX = 'chatbot:rag:retrieval'
+
+
+def retrieval_cache_timeout():
+    """Seconds a retrieval result is cached; 0 disables the cache"""
+    return getattr(settings, 'RAG_SETTINGS', {}).get('RETRIEVAL_CACHE_TIMEOUT', 300)
+
+
+def _revision_key(generation_id):
+    return f'{RETRIEVAL_CACHE_PREFIX}:revision:{generation_id}'
+
+
+def index_revision(generation_id):
+    """
+    Token identifying the current contents of a generation's index.
+
+    A random token rather than a counter, so an evicted revision can never
+    come back with a value that matches entries cached before it.
+    """
+    key = _revision_key(generation_id)
+    revision = cache.get(key)
+    if revision is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        revision = cache.get(key)
+    return revision
+
+
+def invalidate_retrieval_cache(generation_id):
+    """Orphan every cached result of a generation after its documents changed"""
+    cache.set(_revision_key(generation_id), uuid.uuid4().hex, None)
+
+
+def normalize_query(query):
+    return ' '.join(unicodedata.normalize('NFC', query).split())
+
+
+def retrieval_cache_key(query, generation_id, top_k, threshold, filters, index_version=None):
+    """
+    Cache key of a retrieval: the normalized query text, result size and
+    threshold, filters (as returned by index_metadata.filter_key), the
+    generation with its current revision, and the version of the in-memory
+    index searched, so a process still on an old index can't cache results
+    for the processes that have reloaded
+    """
+    revision = index_revision(generation_id)
+    digest = hashlib.sha256(
+        repr((normalize_query(query), top_k, threshold, filters)).encode('utf-8')
+    ).hexdigest()
+    return f'{RETRIEVAL_CACHE_PREFIX}:{generation_id}:{revision}:{index_version}:{digest}'
@@ -0,0 +1,58 @@
+# chatbot_app/scheduler.py
+import logging
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def run_job(task_path):
+    """Run a maintenance task in-process, outside any request"""
+    close_old_connections()
+    try:
+        result = import_string(task_path)()
+        logger.info("%s: %s", task_path, result)
+        return result
+    finally:
+        close_old_connections()
+
+
+def build_scheduler(blocking=False):
+    """
+    Create an APScheduler scheduler with the jobs from MAINTENANCE_SCHEDULE.
+
+    This is the fallback for deployments without Celery beat. Every task is
+    wrapped in a job lock (see locks.single_instance), so running a scheduler
+    on several nodes still executes each job once.
+    """
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.schedulers.blocking import BlockingScheduler
+    from apscheduler.triggers.cron import CronTrigger
+
+    scheduler_class = BlockingScheduler if blocking else BackgroundScheduler
+    scheduler = scheduler_class(timezone=settings.TIME_ZONE)
+    for name, job in getattr(settings, 'MAINTENANCE_SCHEDULE', {}).items():
+        scheduler.add_job(
+            run_job,
+            CronTrigger(**job['schedule']),
+            args=[job['task']],
+            id=name,
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True,
+        )
+    return scheduler
+
+
+_scheduler = None
+
+
+def start_background_scheduler():
+    """Start the in-process scheduler once per process"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = build_scheduler()
+        _scheduler.start()
+    return _scheduler
@@ -1,11 +1,16 @@
 # chatbot_app/serializers.py - COMPLETE VERSION with all missing serializers
 
+import os
+from itertools import chain
+from django.conf import settings
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
+from .archive import iter_archived_messages
+from .extraction import detect_document_type
 from .models import (
     ChatSession, ChatMessage, UserPreference,
-    ChatbotConfig, Document, EmailVerification
+    ChatbotConfig, Document, EmailVerification, IngestionJob
 )
 
 # Try to import optional models (they might not exist yet)
@@ -69,7 +74,7 @@ class ChatMessageSerializer(serializers.ModelSerializer):
 
 
 class ChatSessionSerializer(serializers.ModelSerializer):
-    messages = ChatMessageSerializer(many=True, read_only=True)
+    messages = serializers.SerializerMethodField()
     message_count = serializers.SerializerMethodField()
 
     class Meta:
@@ -77,8 +82,27 @@ class ChatSessionSerializer(serializers.ModelSerializer):
         fields = ['id', 'session_id', 'created_at', 'updated_at', 'is_active', 'messages', 'message_count']
         read_only_fields = ['id', 'created_at', 'updated_at']
 
+    def get_messages(self, obj):
+        # Archived messages are older than every hot one, so they come first
+        messages = chain(iter_archived_messages(obj), obj.messages.all())
+        return ChatMessageSerializer(messages, many=True).data
+
     def get_message_count(self, obj):
-        return obj.messages.count()
+        # Prefer the annotated count to avoid one COUNT query per session
+        count = getattr(obj, 'message_count', None)
+        if count is None:
+            count = obj.messages.count() + obj.archived_message_count
+        return count
+
+
+class ChatSessionListSerializer(serializers.ModelSerializer):
+    """Lightweight session listing without message bodies"""
+    message_count = serializers.IntegerField(read_only=True, default=0)
+
+    class Meta:
+        model = ChatSession
+        fields = ['id', 'session_id', 'created_at', 'updated_at', 'is_active', 'message_count']
+        read_only_fields = fields
 
 
 # MISSING SERIALIZER - This was causing the error
@@ -86,8 +110,10 @@ class UserPreferenceSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserPreference
         fields = ['preferred_language', 'theme', 'chat_history_enabled', 
-                 'notifications_enabled', 'created_at', 'updated_at']
-        read_only_fields = ['created_at', 'updated_at']
+                 'notifications_enabled', 'chat_retention_days', 'llm_tokens_per_hour',
+                 'created_at', 'updated_at']
+        # The token quota is set by staff, not by the user
+        read_only_fields = ['llm_tokens_per_hour', 'created_at', 'updated_at']
 
 
 class ChatRequestSerializer(serializers.Serializer):
@@ -104,12 +130,64 @@ class ChatbotConfigSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
+class IngestionJobSerializer(serializers.ModelSerializer):
+    document_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    duration_seconds = serializers.FloatField(read_only=True)
+    documents_per_second = serializers.FloatField(read_only=True)
+    chunks_per_second = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = IngestionJob
+        fields = ['id', 'status', 'document_ids', 'total_documents', 'processed_documents',
+                 'total_chunks', 'errors', 'duration_seconds', 'documents_per_second',
+                 'chunks_per_second', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = ['id', 'status', 'total_documents', 'processed_documents',
+                           'total_chunks', 'errors', 'created_at', 'started_at', 'finished_at']
+
+    def validate_document_ids(self, value):
+        found = set(Document.objects.filter(id__in=value).values_list('id', flat=True))
+        missing = sorted(set(value) - found)
+        if missing:
+            raise serializers.ValidationError(f"Unknown document ids: {missing}")
+        return value
+
+
 # Optional serializers (only if models exist)
 if DOCUMENT_MODEL_AVAILABLE:
     class DocumentSerializer(serializers.ModelSerializer):
+        file = serializers.FileField(write_only=True, required=False)
+        title = serializers.CharField(max_length=200, required=False)
+
         class Meta:
             model = Document
-            fields = ['id', 'title', 'content', 'document_type', 'created_at', 'is_active']
+            fields = ['id', 'title', 'content', 'document_type', 'file', 'source_hash', 'owner',
+                     'tenant', 'created_at', 'updated_at', 'is_active']
+            read_only_fields = ['id', 'source_hash', 'created_at', 'updated_at', 'is_active']
+
+        def validate(self, data):
+            upload = data.get('file')
+            if self.instance is None and not upload and not data.get('content'):
+                raise serializers.ValidationError('Provide either a file or content')
+            if upload:
+                max_bytes = getattr(settings, 'DOCUMENT_UPLOADS', {}).get('MAX_UPLOAD_BYTES', 50 * 1024 * 1024)
+                if upload.size > max_bytes:
+                    raise serializers.ValidationError({'file': f'File exceeds {max_bytes} bytes'})
+                document_type = detect_document_type(upload.name, upload.content_type)
+                if document_type is None:
+                    raise serializers.ValidationError({'file': 'Unsupported file type'})
+                data['document_type'] = document_type
+                data['content'] = ''
+                data.setdefault('title', os.path.splitext(os.path.basename(upload.name))[0][:200])
+            elif self.instance is None and not data.get('title'):
+                raise serializers.ValidationError({'title': 'This field is required.'})
+            return data
+
+    class DocumentListSerializer(serializers.ModelSerializer):
+        """Document listing without the (possibly large) content"""
+        class Meta:
+            model = Document
+            fields = ['id', 'title', 'document_type', 'source_hash', 'owner', 'tenant', 'created_at',
+                      'updated_at', 'is_active']
     
     class EmailVerificationSerializer(serializers.ModelSerializer):
         class Meta:
@@ -124,4 +202,6 @@ else:
         content = serializers.CharField()
         document_type = serializers.CharField(max_length=50, default='text')
         created_at = serializers.DateTimeField(read_only=True)
-        is_active = serializers.BooleanField(default=True)
\ No newline at end of file
+        is_active = serializers.BooleanField(default=True)
+
+    DocumentListSerializer = DocumentSerializer
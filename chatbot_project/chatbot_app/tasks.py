@@ -2,15 +2,33 @@
 # chatbot_app/tasks.py
 import os
 import smtplib
+import threading
+import time
 from datetime import datetime, timedelta
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from celery import shared_task
+try:
+    from celery import shared_task
+except ImportError:
+    # Celery is optional: without it run_scheduler calls the tasks directly
+    def shared_task(func=None, **options):
+        if func is None:
+            return lambda f: f
+        return func
 from django.utils import timezone
 from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Exists, OuterRef
 from django.core.mail import send_mail
 from django.contrib.auth.models import User
-from .models import ChatSession, ChatMessage, EmailVerification
+from .archive import archive_messages_before, expire_segments
+from .extraction import ExtractionError, detect_document_type, extract_text
+from .locks import single_instance
+from .models import (
+    ChatArchiveSegment, ChatSession, ChatMessage, Document, DocumentEmbedding,
+    EmailVerification, EmbeddingGeneration, IngestionJob, UserPreference, MAX_RETENTION_DAYS
+)
 
 @shared_task
 def send_verification_email(user_id, token):
@@ -47,31 +65,160 @@ def send_verification_email(user_id, token):
     except Exception as e:
         return f"Failed to send verification email: {str(e)}"
 
+RETENTION_PROGRESS_KEY = 'chatbot:retention:progress'
+
+
+def _retention_settings():
+    retention = getattr(settings, 'CHAT_RETENTION', {})
+    return {
+        'default_days': retention.get('DEFAULT_DAYS', 30),
+        'batch_size': retention.get('BATCH_SIZE', 1000),
+        'pause': retention.get('BATCH_PAUSE_SECONDS', 0.05),
+        'max_runtime': retention.get('MAX_RUNTIME_SECONDS', 600),
+    }
+
+
+def _retention_policies(default_days):
+    """
+    Yield (label, days, user lookup) for the default and each per-user
+    retention period. Periods saved before they were validated are clamped
+    to 1..MAX_RETENTION_DAYS, so none can overflow the cutoff date.
+    """
+    yield 'default', default_days, {'user__userpreference__chat_retention_days__isnull': True}
+    custom_days = UserPreference.objects.filter(
+        chat_retention_days__isnull=False
+    ).order_by().values_list('chat_retention_days', flat=True).distinct()
+    for days in custom_days:
+        kept = min(max(days, 1), MAX_RETENTION_DAYS)
+        yield f'{kept}d', kept, {'user__userpreference__chat_retention_days': days}
+
+
+def _delete_in_batches(queryset, ordering, batch_size, pause, deadline, on_batch=None):
+    """
+    Delete the rows matched by ``queryset`` in bounded batches.
+
+    Each batch is a single ``DELETE ... WHERE id IN (SELECT id ... LIMIT n)``
+    statement in its own short transaction, so neither Django's cascade
+    collector nor one long-running transaction is involved. Only use this for
+    rows nothing else references. Returns ``(deleted, finished)``.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    table = connection.ops.quote_name(model._meta.db_table)
+    pk_column = connection.ops.quote_name(model._meta.pk.column)
+    batch = queryset.order_by(*ordering).values('pk')[:batch_size]
+    batch_sql, params = batch.query.sql_with_params()
+    delete_sql = f'DELETE FROM {table} WHERE {pk_column} IN ({batch_sql})'
+
+    deleted = 0
+    while True:
+        with transaction.atomic(using=queryset.db):
+            with connection.cursor() as cursor:
+                cursor.execute(delete_sql, params)
+                count = cursor.rowcount
+        deleted += count
+        if on_batch:
+            on_batch(count)
+        if count < batch_size:
+            return deleted, True
+        if time.monotonic() >= deadline:
+            return deleted, False
+        # Give concurrent chat writes a chance to grab the table
+        time.sleep(pause)
+
+
 @shared_task
+@single_instance()
 def cleanup_old_chat_history():
-    """Delete chat history older than 30 days - REQUIRED BY TASK"""
+    """Delete chat history past its retention period - REQUIRED BY TASK
+
+    Messages are deleted oldest first in small batches, honouring each user's
+    ``UserPreference.chat_retention_days``. Progress is kept in the cache so a
+    run that hits MAX_RUNTIME_SECONDS is continued by the next run.
+    """
     try:
-        cutoff_date = timezone.now() - timedelta(days=30)
-        
-        # Delete old messages
-        old_messages = ChatMessage.objects.filter(timestamp__lt=cutoff_date)
-        message_count = old_messages.count()
-        old_messages.delete()
-        
-        # Delete empty sessions
-        empty_sessions = ChatSession.objects.filter(
-            messages__isnull=True,
-            created_at__lt=cutoff_date
-        )
-        session_count = empty_sessions.count()
-        empty_sessions.delete()
-        
-        return f"Cleaned up {message_count} messages and {session_count} empty sessions"
+        options = _retention_settings()
+        now = timezone.now()
+        deadline = time.monotonic() + options['max_runtime']
+
+        progress = cache.get(RETENTION_PROGRESS_KEY)
+        if not progress or progress.get('finished'):
+            progress = {'started_at': now.isoformat(), 'messages': 0, 'sessions': 0, 'finished': False}
+
+        def record(kind):
+            def on_batch(count):
+                progress[kind] += count
+                cache.set(RETENTION_PROGRESS_KEY, progress, timeout=None)
+            return on_batch
+
+        finished = True
+        for label, days, user_lookup in _retention_policies(options['default_days']):
+            cutoff = now - timedelta(days=days)
+
+            # Delete old messages
+            old_messages = ChatMessage.objects.filter(
+                timestamp__lt=cutoff,
+                **{f'session__{key}': value for key, value in user_lookup.items()}
+            )
+            _, done = _delete_in_batches(
+                old_messages, ('timestamp', 'id'), options['batch_size'],
+                options['pause'], deadline, record('messages')
+            )
+            if not done:
+                finished = False
+                break
+
+            # Drop archived months that are past retention as well
+            progress['messages'] += expire_segments(ChatArchiveSegment.objects.filter(
+                last_timestamp__lt=cutoff,
+                **{f'session__{key}': value for key, value in user_lookup.items()}
+            ))
+
+            # Delete sessions left without messages
+            empty_sessions = ChatSession.objects.filter(
+                ~Exists(ChatMessage.objects.filter(session=OuterRef('pk'))),
+                archived_message_count=0,
+                updated_at__lt=cutoff,
+                **user_lookup
+            )
+            _, done = _delete_in_batches(
+                empty_sessions, ('updated_at', 'id'), options['batch_size'],
+                options['pause'], deadline, record('sessions')
+            )
+            if not done:
+                finished = False
+                break
+
+        progress['finished'] = finished
+        cache.set(RETENTION_PROGRESS_KEY, progress, timeout=None)
+
+        summary = f"Cleaned up {progress['messages']} messages and {progress['sessions']} empty sessions"
+        if not finished:
+            return f"{summary} so far; cleanup will resume on the next run"
+        return summary
         
     except Exception as e:
         return f"Cleanup failed: {str(e)}"
 
 @shared_task
+@single_instance()
+def archive_old_chat_messages():
+    """Move messages older than CHAT_ARCHIVE['ARCHIVE_AFTER_DAYS'] to cold storage"""
+    try:
+        archive_settings = getattr(settings, 'CHAT_ARCHIVE', {})
+        if not archive_settings.get('ENABLED', False):
+            return "Chat archiving is disabled"
+
+        cutoff = timezone.now() - timedelta(days=archive_settings.get('ARCHIVE_AFTER_DAYS', 14))
+        message_count, session_count = archive_messages_before(cutoff)
+
+        return f"Archived {message_count} messages from {session_count} sessions"
+
+    except Exception as e:
+        return f"Archiving failed: {str(e)}"
+
+@shared_task
+@single_instance()
 def cleanup_expired_tokens():
     """Clean up expired email verification tokens"""
     try:
@@ -86,3 +233,230 @@ def cleanup_expired_tokens():
         
     except Exception as e:
         return f"Token cleanup failed: {str(e)}"
+
+@shared_task
+@single_instance()
+def compact_rag_index():
+    """
+    Rebuild the FAISS index without stale vectors and write a fresh
+    snapshot, which the other processes then reload (or, without
+    snapshots, rebuild from the stored embeddings)
+    """
+    try:
+        from .rag_pipeline import get_rag_pipeline
+        
+        pipeline = get_rag_pipeline()
+        if not pipeline.rebuild_index():
+            return "Index compaction failed"
+        pipeline.save_snapshot()
+        pipeline.publish_index_change()
+        
+        return f"Compacted RAG index to {pipeline.faiss_index.ntotal} vectors"
+        
+    except Exception as e:
+        return f"Index compaction failed: {str(e)}"
+
+@shared_task
+@single_instance()
+def reembed_stale_documents():
+    """Embed active documents that are new or changed since their embedding"""
+    try:
+        from .rag_pipeline import get_rag_pipeline
+        
+        pipeline = get_rag_pipeline()
+        batch_size = getattr(settings, 'RAG_SETTINGS', {}).get('REEMBED_BATCH_SIZE', 100)
+        current = DocumentEmbedding.objects.filter(
+            document=OuterRef('pk'),
+            generation=pipeline.generation,
+            created_at__gte=OuterRef('updated_at')
+        )
+        stale = Document.objects.filter(is_active=True).exclude(Exists(current))
+        
+        documents = list(stale.order_by('updated_at')[:batch_size])
+        started = timezone.now()
+        chunk_count = pipeline.add_documents(documents)
+        
+        # Documents whose text did not change keep their embeddings; mark
+        # them current so they are not picked up as stale again
+        unchanged = DocumentEmbedding.objects.filter(
+            document__in=documents,
+            generation=pipeline.generation,
+            created_at__lt=started
+        ).update(created_at=timezone.now())
+        
+        return f"Re-embedded {len(documents)} documents ({chunk_count} chunks, {unchanged} unchanged)"
+        
+    except Exception as e:
+        return f"Re-embedding failed: {str(e)}"
+
+@shared_task
+@single_instance(timeout=12 * 3600)
+def build_embedding_generation(generation_id):
+    """
+    Embed every active document into an embedding generation without touching
+    the serving one, leaving it ready to be activated
+    """
+    try:
+        generation = EmbeddingGeneration.objects.get(id=generation_id)
+    except EmbeddingGeneration.DoesNotExist:
+        return f"Embedding generation {generation_id} not found"
+    
+    try:
+        from .rag_pipeline import RAGPipeline
+        
+        started = timezone.now()
+        generation.status = 'building'
+        generation.error = ''
+        generation.document_count = generation.chunk_count = 0
+        generation.save(update_fields=['status', 'error', 'document_count', 'chunk_count'])
+        
+        pipeline = RAGPipeline(use_snapshot=False, generation=generation)
+        batch_size = getattr(settings, 'RAG_SETTINGS', {}).get('INGEST_BATCH_SIZE', 20)
+        documents = Document.objects.filter(is_active=True).order_by('id')
+        
+        def embed(batch):
+            # Documents already embedded by an interrupted build are skipped
+            generation.chunk_count += pipeline.add_documents(batch)
+            generation.document_count += len(batch)
+            generation.save(update_fields=['document_count', 'chunk_count'])
+        
+        batch = []
+        for document in documents.iterator(chunk_size=batch_size):
+            batch.append(document)
+            if len(batch) == batch_size:
+                embed(batch)
+                batch = []
+        if batch:
+            embed(batch)
+        
+        # Catch up with documents edited while the build was running; later
+        # edits are picked up by reembed_stale_documents once it is active
+        edited = list(documents.filter(updated_at__gte=started))
+        for start in range(0, len(edited), batch_size):
+            pipeline.add_documents(edited[start:start + batch_size])
+        
+        generation.chunk_count = generation.embeddings.count()
+        generation.status = 'ready'
+        generation.built_at = timezone.now()
+        generation.save(update_fields=['chunk_count', 'status', 'built_at'])
+        pipeline.save_snapshot()
+        
+        return (
+            f"Built embedding generation {generation.id} ({generation.embedding_model}): "
+            f"{generation.document_count} documents, {generation.chunk_count} chunks"
+        )
+        
+    except Exception as e:
+        generation.status = 'failed'
+        generation.error = str(e)
+        generation.save(update_fields=['status', 'error'])
+        return f"Building embedding generation {generation_id} failed: {str(e)}"
+
+def dispatch_task(task, *args):
+    """Queue a task on Celery, or run it on a background thread without Celery"""
+    if getattr(settings, 'USE_CELERY', False):
+        return task.delay(*args)
+    
+    def run():
+        try:
+            task(*args)
+        finally:
+            connections.close_all()
+    
+    thread = threading.Thread(target=run, name=f'task-{task.__name__}', daemon=True)
+    thread.start()
+    return thread
+
+def start_ingestion(document_ids=None, source_files=None, user=None):
+    """Create an IngestionJob and process it in the background"""
+    job = IngestionJob.objects.create(
+        created_by=user,
+        document_ids=list(document_ids or []),
+        source_files=list(source_files or []),
+        total_documents=len(document_ids or []) + len(source_files or [])
+    )
+    dispatch_task(ingest_documents, job.id)
+    return job
+
+def _documents_from_files(job):
+    """Create a Document for each uploaded file of the job"""
+    document_ids = []
+    for relative_path in job.source_files:
+        try:
+            document_type = detect_document_type(relative_path) or 'text'
+            content = extract_text(os.path.join(settings.MEDIA_ROOT, relative_path), document_type)
+            document = Document.objects.create(
+                title=os.path.splitext(os.path.basename(relative_path))[0],
+                content=content,
+                document_type=document_type
+            )
+            document_ids.append(document.id)
+        except (OSError, ExtractionError) as e:
+            job.errors.append({'file': relative_path, 'error': str(e)})
+    return document_ids
+
+def _extract_pending_content(documents, job):
+    """Fill in the content of uploaded documents that have not been extracted yet"""
+    ready = []
+    for document in documents:
+        if document.file and not document.content:
+            try:
+                document.content = extract_text(document.file.path, document.document_type)
+                document.save(update_fields=['content', 'updated_at'])
+            except (OSError, ExtractionError) as e:
+                job.errors.append({'document': document.id, 'error': str(e)})
+                continue
+        ready.append(document)
+    return ready
+
+@shared_task
+def ingest_documents(job_id):
+    """Chunk, embed and index the documents of an IngestionJob, recording progress"""
+    try:
+        job = IngestionJob.objects.get(id=job_id)
+    except IngestionJob.DoesNotExist:
+        return f"Ingestion job {job_id} not found"
+    
+    try:
+        from .rag_pipeline import get_rag_pipeline
+        
+        job.status = 'running'
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+        
+        document_ids = list(job.document_ids)
+        if job.source_files:
+            document_ids += _documents_from_files(job)
+            job.document_ids = document_ids
+            job.save(update_fields=['document_ids', 'errors'])
+        
+        pipeline = get_rag_pipeline()
+        batch_size = getattr(settings, 'RAG_SETTINGS', {}).get('INGEST_BATCH_SIZE', 20)
+        for start in range(0, len(document_ids), batch_size):
+            batch_ids = document_ids[start:start + batch_size]
+            documents = list(Document.objects.filter(id__in=batch_ids, is_active=True))
+            documents = _extract_pending_content(documents, job)
+            try:
+                chunk_count = pipeline.add_documents(documents)
+            except Exception as e:
+                job.errors.append({'documents': batch_ids, 'error': str(e)})
+                chunk_count = 0
+            job.processed_documents += len(batch_ids)
+            job.total_chunks += chunk_count
+            job.save(update_fields=['processed_documents', 'total_chunks', 'errors'])
+        
+        job.status = 'failed' if job.errors and not job.total_chunks else 'completed'
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'finished_at'])
+        
+        return (
+            f"Ingested {job.processed_documents} documents ({job.total_chunks} chunks) "
+            f"at {job.documents_per_second():.1f} docs/s, {job.chunks_per_second():.1f} chunks/s"
+        )
+        
+    except Exception as e:
+        job.status = 'failed'
+        job.errors.append({'error': str(e)})
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'errors', 'finished_at'])
+        return f"Ingestion failed: {str(e)}"
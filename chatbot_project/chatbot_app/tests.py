@@ -0,0 +1,1616 @@
+# chatbot_app/tests.py
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import runpy
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest import SkipTest, mock, skipUnless
+
+import numpy as np
+import requests
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .archive import archive_messages_before
+from .authentication import revoke_user_tokens, tokens_for_user
+from .batching import MicroBatcher
+from .benchmarking import HashEncoder
+from .db import PrimaryReplicaRouter, read_database
+from .encoders import EncoderError, ONNXEncoder, SentenceTransformerEncoder
+from .extraction import ExtractionError, detect_document_type, extract_text
+from .generations import (
+    GenerationError, activate_generation, active_generation_id, create_generation, get_active_generation,
+    purge_generation, rollback_generation, snapshot_directory,
+)
+from .health import HEALTH_CACHE_KEY
+from .metrics import CHAT_REQUESTS
+from .management.commands.check_encoder_parity import SAMPLE_TEXTS
+from .management.commands.run_benchmarks import SCENARIOS
+from .models import (
+    MAX_RETENTION_DAYS, ChatbotConfig, ChatMessage, ChatSession, Document, DocumentEmbedding, EmbeddingGeneration, IngestionJob,
+    UserPreference,
+)
+from .quantization import dequantize_int8, quantize_int8
+from .rag_pipeline import RAGPipeline, get_rag_pipeline
+from .retrieval_cache import index_revision, invalidate_retrieval_cache, retrieval_cache_key
+from .serializers import DocumentSerializer
+from .tasks import build_embedding_generation, cleanup_old_chat_history, start_ingestion
+from .views import ChatbotService
+from .websocket import CHAT_PATH, CLOSE_NOT_FOUND, CLOSE_UNAUTHORIZED, websocket_application
+from .throttling import LocalBucketStore, RedisBucketStore, charge_llm_tokens, rate_limit_settings, take_tokens
+
+CHAT_TABLES = (ChatSession._meta.db_table, ChatMessage._meta.db_table)
+# The Redis-backed tests run against fakeredis, without a redis-server
+FAKE_REDIS = all(importlib.util.find_spec(name) for name in ('django_redis', 'fakeredis'))
+
+
+def wait_until(condition, timeout=2):
+    """Poll ``condition`` until it holds, for what other threads deliver asynchronously"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class CountingEncoder(HashEncoder):
+    """HashEncoder that remembers every text it was asked to embed"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.encoded = []
+
+    def encode(self, texts, batch_size=32):
+        self.encoded.extend(texts)
+        return super().encode(texts, batch_size)
+
+
+def hash_pipeline(dimension=64, encoder=None, **generation_fields):
+    """A pipeline on a new generation embedded by HashEncoder, returning every hit"""
+    generation = create_generation(
+        embedding_model='benchmark/hash-encoder', vector_dimension=dimension,
+        **dict({'status': 'ready'}, **generation_fields)
+    )
+    pipeline = RAGPipeline(
+        use_snapshot=False, generation=generation, encoder=encoder or HashEncoder(dimension)
+    )
+    pipeline.similarity_threshold = -1.0
+    return pipeline
+
+
+def explain(sql, params):
+    """The query plan of ``sql``, one line per step"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+        # Test tables are tiny, so make the planner show whether an index is
+        # usable at all rather than what is cheapest right now
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute(f'EXPLAIN {sql}', params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def full_scans(plan):
+    """The plan lines that read a whole chat table"""
+    scans = []
+    for line in plan:
+        for table in CHAT_TABLES:
+            # SQLite: "SCAN table" without an index is a full scan, "SEARCH" is a seek
+            if (line.startswith(f'SCAN {table}') and 'INDEX' not in line) or f'Seq Scan on {table}' in line:
+                scans.append(line)
+    return scans
+
+
+@contextmanager
+def captured_selects():
+    queries = []
+
+    def wrapper(execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith('SELECT'):
+            queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield queries
+
+
+# Claims-mode tokens authenticate without a query, so only the endpoint's own queries are counted
+@override_settings(AUTH_SETTINGS={'JWT_USER_MODE': 'claims'})
+class ChatQueryPlanTests(TestCase):
+    """Query counts of the chat history endpoints stay flat and their queries seek the composite indexes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='plan-user')
+        other = User.objects.create_user(username='plan-other')
+        now = timezone.now()
+        sessions = ChatSession.objects.bulk_create([
+            ChatSession(
+                user=cls.user if i % 2 else other,
+                session_id=f'plan-{i}',
+                is_active=i % 5 != 0,
+                created_at=now - timedelta(hours=i),
+            )
+            for i in range(60)
+        ])
+        ChatMessage.objects.bulk_create([
+            ChatMessage(
+                session=session,
+                message_type='user' if j % 2 else 'bot',
+                content=f'message {j}',
+                timestamp=now - timedelta(days=j),
+            )
+            for session in sessions
+            for j in range(20)
+        ])
+        cls.session = ChatSession.objects.filter(user=cls.user).order_by('-updated_at', '-id').first()
+
+    def setUp(self):
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(self.user).access_token}')
+
+    def assert_endpoint(self, url, queries, params=None):
+        """GET ``url`` with exactly ``queries`` queries and no full scan; returns the response data"""
+        with self.assertNumQueries(queries), captured_selects() as selects:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        for sql, sql_params in selects:
+            self.assertEqual(full_scans(explain(sql, sql_params)), [], sql)
+        return response.json()
+
+    def assert_pages(self, url, queries, params=None):
+        """Both the first page and the page after its cursor, which adds the seek predicate"""
+        params = params or {}
+        data = self.assert_endpoint(url, queries, params)
+        self.assertTrue(data['next_cursor'])
+        self.assert_endpoint(url, queries, dict(params, cursor=data['next_cursor']))
+
+    def test_chat_history(self):
+        # The page and total_sessions
+        self.assert_pages('/api/chat-history/', 2, {'page_size': 5})
+        data = self.client.get('/api/chat-history/', {'page_size': 5}).json()
+        self.assertEqual(data['total_sessions'], ChatSession.objects.filter(user=self.user, is_active=True).count())
+
+    def test_sessions_list(self):
+        self.assert_pages('/api/sessions/', 1, {'page_size': 5})
+
+    def test_session_detail(self):
+        self.assert_endpoint(f'/api/sessions/{self.session.pk}/', 2)
+
+    def test_session_messages(self):
+        self.assert_pages(f'/api/sessions/{self.session.pk}/messages/', 2, {'page_size': 5})
+
+    def test_retention_scan_uses_timestamp_index(self):
+        cutoff = timezone.now() - timedelta(days=30)
+        retention = ChatMessage.objects.filter(timestamp__lt=cutoff).order_by('timestamp', 'id').values('id')[:100]
+        plan = explain(*retention.query.sql_with_params())
+        self.assertEqual(full_scans(plan), [])
+        if connection.vendor == 'sqlite':
+            self.assertTrue(any('chatmessage_timestamp_idx' in line for line in plan), plan)
+
+
+class ONNXEncoderParityTests(SimpleTestCase):
+    """
+    The exported ONNX encoder (``manage.py export_onnx_encoder``) must
+    produce the vectors of the sentence-transformers encoder it replaces.
+    Skipped until a model has been exported to ENCODER ONNX_MODEL_DIR.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        rag_settings = getattr(settings, 'RAG_SETTINGS', {})
+        encoder_settings = rag_settings.get('ENCODER', {})
+        model_dir = encoder_settings.get('ONNX_MODEL_DIR')
+        model_file = encoder_settings.get('ONNX_FILE', 'model.onnx')
+        if not model_dir or not os.path.exists(os.path.join(model_dir, model_file)):
+            raise SkipTest(f'No exported ONNX encoder in {model_dir}')
+        cls.model_name = rag_settings.get('EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+        try:
+            cls.encoder = ONNXEncoder(
+                cls.model_name, model_dir, model_file=model_file, threads=encoder_settings.get('THREADS', 1)
+            )
+        except EncoderError as e:
+            raise SkipTest(str(e))
+        # int8 models drift further from the float reference
+        cls.threshold = 0.97 if 'quantized' in model_file else 0.99
+
+    def test_matches_sentence_transformers(self):
+        if importlib.util.find_spec('sentence_transformers') is None:
+            self.skipTest('sentence-transformers is not installed')
+        reference = SentenceTransformerEncoder(self.model_name).encode(SAMPLE_TEXTS)
+        reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+        candidate = self.encoder.encode(SAMPLE_TEXTS)
+        similarities = (reference * candidate).sum(axis=1)
+        for text, similarity in zip(SAMPLE_TEXTS, similarities):
+            self.assertGreaterEqual(similarity, self.threshold, text)
+
+    def test_batching_does_not_change_vectors(self):
+        # Padding a short text to the longest of its batch must not move it
+        batched = self.encoder.encode(SAMPLE_TEXTS)
+        one_by_one = np.concatenate([self.encoder.encode([text]) for text in SAMPLE_TEXTS])
+        np.testing.assert_allclose(batched, one_by_one, atol=1e-5)
+
+
+class BenchmarkTests(TransactionTestCase):
+    """
+    Every ``run_benchmarks`` scenario still runs end to end without errors,
+    at a size small enough for the test suite. Scenarios call the app from
+    worker threads, hence a TransactionTestCase.
+    """
+
+    def test_every_scenario_runs_without_errors(self):
+        # The scenario users reuse ids whose tokens earlier tests revoked
+        cache.clear()
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'report.json')
+            call_command(
+                'run_benchmarks', chunks=200, iterations=5, warmup=1, build_repeat=1,
+                history_sessions=5, history_messages=4, ollama_latency_ms=1, ollama_tokens=5,
+                output=output, stdout=io.StringIO(), stderr=io.StringIO(),
+            )
+            with open(output) as report_file:
+                report = json.load(report_file)
+
+        self.assertEqual(sorted(report['scenarios']), sorted(SCENARIOS))
+        for name, result in report['scenarios'].items():
+            self.assertEqual(result['errors'], 0, name)
+            self.assertGreater(result['throughput_per_s'], 0, name)
+        self.assertEqual(report['scenarios']['index_build']['vectors'], 200)
+        self.assertEqual(report['scenarios']['retrieve']['iterations'], 5)
+
+
+@skipUnless(FAKE_REDIS, 'django-redis and fakeredis are required')
+class NearCacheTests(SimpleTestCase):
+    """
+    Two NearCache objects with a local tier each stand for two processes
+    sharing one (fake) Redis; invalidations travel over its pub/sub.
+    """
+
+    def setUp(self):
+        import fakeredis
+
+        from .cache import LocalTier, NearCache
+
+        location = f'redis://near-cache-test-{uuid.uuid4().hex}/0'
+        params = {
+            'KEY_PREFIX': 'test',
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                'CONNECTION_POOL_KWARGS': {'connection_class': fakeredis.FakeConnection},
+                'NEAR_CACHE_TIMEOUT': 60,
+            },
+        }
+        self.first = NearCache(location, params)
+        self.second = NearCache(location, params)
+        # The registry would hand both the same tier, as they share a process
+        self.second._tier = LocalTier(self.first._tier.channel, 100, 60)
+
+    def cached_locally(self, near_cache, key):
+        from .cache import _MISSING
+        return near_cache._tier.get(near_cache._local_key(key, None)) is not _MISSING
+
+    def subscribe(self, near_cache):
+        near_cache.get('warm-up')
+        self.assertTrue(wait_until(near_cache._tier.listening.is_set))
+
+    def test_reads_are_served_locally(self):
+        self.subscribe(self.first)
+        self.second.set('key', 'value')
+        self.assertEqual(self.first.get('key'), 'value')
+        self.assertTrue(self.cached_locally(self.first, 'key'))
+
+    def test_writes_elsewhere_invalidate_the_local_copy(self):
+        self.subscribe(self.first)
+        self.second.set('key', 'old')
+        self.assertEqual(self.first.get('key'), 'old')
+        self.second.set('key', 'new')
+        self.assertTrue(wait_until(lambda: not self.cached_locally(self.first, 'key')))
+        self.assertEqual(self.first.get('key'), 'new')
+
+        self.second.delete('key')
+        self.assertTrue(wait_until(lambda: self.first.get('key') is None))
+
+    def test_clear_elsewhere_flushes_the_local_tier(self):
+        self.subscribe(self.first)
+        self.first.set_many({'a': 1, 'b': 2})
+        self.first.get_many(['a', 'b'])
+        self.second.clear()
+        self.assertTrue(wait_until(lambda: self.first.get_many(['a', 'b']) == {}))
+
+    def test_value_read_before_an_invalidation_is_not_kept(self):
+        # A reader fetched the old value from Redis, then an invalidation
+        # arrived before it stored the value locally
+        tier = self.first._tier
+        self.subscribe(self.first)
+        generation = tier.generation
+        tier.discard(['key'])
+        tier.fill('key', 'stale', generation)
+        self.assertFalse(self.cached_locally(self.first, 'key'))
+
+    def test_nothing_is_kept_locally_while_unsubscribed(self):
+        from .cache import LocalTier
+
+        tier = LocalTier('unused-channel', 100, 60)
+        tier.fill('key', 'value', tier.generation)
+        self.assertEqual(tier._entries, {})
+
+
+class DatabaseSetupTests(SimpleTestCase):
+    """The connection setup in chatbot_app.db and the environment-driven DATABASES"""
+
+    def sqlite_pragmas(self, *pragmas):
+        """Values of ``pragmas`` on a new connection to a scratch database file"""
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = SQLiteDatabaseWrapper(dict(
+                connection.settings_dict, NAME=os.path.join(directory, 'db.sqlite3'), TEST={}, OPTIONS={}
+            ), alias='pragma-test')
+            try:
+                with wrapper.cursor() as cursor:
+                    values = []
+                    for pragma in pragmas:
+                        cursor.execute(f'PRAGMA {pragma}')
+                        values.append(cursor.fetchone()[0])
+                    return values
+            finally:
+                wrapper.close()
+
+    def test_sqlite_connections_get_the_pragmas(self):
+        self.assertEqual(self.sqlite_pragmas('temp_store', 'cache_size'), [2, -20000])
+
+    @override_settings(SQLITE_WAL=False)
+    def test_sqlite_journal_is_left_alone_by_default(self):
+        self.assertEqual(self.sqlite_pragmas('journal_mode'), ['delete'])
+
+    @override_settings(SQLITE_WAL=True)
+    def test_sqlite_wal_is_opt_in(self):
+        # synchronous=NORMAL is 1
+        self.assertEqual(self.sqlite_pragmas('journal_mode', 'synchronous'), ['wal', 1])
+
+    def load_settings(self, **environ):
+        with mock.patch.dict(os.environ, environ):
+            return runpy.run_module('chatbot_project.settings')
+
+    def test_postgresql_settings(self):
+        config = self.load_settings(DB_ENGINE='postgresql', DB_TEST_NAME='test_chatbot_ci', DB_POOLER='True')
+        database = config['DATABASES']['default']
+        self.assertEqual(database['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(database['CONN_MAX_AGE'], 60)
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        self.assertTrue(database['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertEqual(database['OPTIONS']['keepalives'], 1)
+        self.assertEqual(database['TEST'], {'NAME': 'test_chatbot_ci'})
+        self.assertNotIn('replica', config['DATABASES'])
+
+    def test_postgresql_replica_settings(self):
+        config = self.load_settings(DB_ENGINE='postgresql', DB_REPLICA_HOST='replica.internal')
+        replica = config['DATABASES']['replica']
+        self.assertEqual(replica['HOST'], 'replica.internal')
+        self.assertEqual(replica['NAME'], config['DATABASES']['default']['NAME'])
+        self.assertEqual(replica['TEST'], {'MIRROR': 'default'})
+        self.assertEqual(config['DATABASE_ROUTERS'], ['chatbot_app.db.PrimaryReplicaRouter'])
+
+    def test_read_database(self):
+        self.assertEqual(read_database(), 'default')
+        with override_settings(DATABASES=dict(settings.DATABASES, replica=settings.DATABASES['default'])):
+            self.assertEqual(read_database(), 'replica')
+
+    def test_router_writes_and_migrates_only_the_primary(self):
+        router = PrimaryReplicaRouter()
+        self.assertIsNone(router.db_for_read(ChatSession))
+        self.assertEqual(router.db_for_write(ChatSession), 'default')
+        self.assertTrue(router.allow_migrate('default', 'chatbot_app'))
+        self.assertFalse(router.allow_migrate('replica', 'chatbot_app'))
+
+
+class RetentionTests(TestCase):
+    """chat_retention_days stays within what the cleanup task can turn into a cutoff"""
+
+    def setUp(self):
+        # Revocations of an earlier test's user would apply to a new user with the same id
+        cache.clear()
+        self.user = User.objects.create_user(username='retention-user')
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(self.user).access_token}')
+
+    def test_preferences_reject_out_of_range_days(self):
+        for days in (0, MAX_RETENTION_DAYS + 1, 10 ** 9):
+            response = self.client.post('/api/preferences/', {'chat_retention_days': days}, content_type='application/json')
+            self.assertEqual(response.status_code, 400, days)
+        response = self.client.post(
+            '/api/preferences/', {'chat_retention_days': MAX_RETENTION_DAYS}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_cleanup_clamps_days_saved_before_validation(self):
+        UserPreference.objects.create(user=self.user)
+        UserPreference.objects.filter(user=self.user).update(chat_retention_days=10 ** 9)
+        session = ChatSession.objects.create(user=self.user, session_id='retention-session')
+        ChatMessage.objects.create(
+            session=session, message_type='user', content='old',
+            timestamp=timezone.now() - timedelta(days=MAX_RETENTION_DAYS + 1),
+        )
+        ChatMessage.objects.create(session=session, message_type='user', content='new')
+
+        cleanup_old_chat_history()
+
+        self.assertEqual(list(ChatMessage.objects.filter(session=session).values_list('content', flat=True)), ['new'])
+
+
+@override_settings(AUTH_SETTINGS={'JWT_USER_MODE': 'claims'})
+class ClaimsRevocationTests(TestCase):
+    """Claims-mode tokens carry the user's privileges, so changing them revokes the tokens"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='claims-user', is_staff=True)
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(self.user).access_token}')
+
+    def assertAccepted(self, accepted):
+        self.assertEqual(self.client.get('/api/preferences/').status_code, 200 if accepted else 401)
+
+    def test_demotion_revokes_tokens(self):
+        self.assertAccepted(True)
+        self.user.is_staff = False
+        self.user.save()
+        self.assertAccepted(False)
+
+    def test_promotion_revokes_tokens(self):
+        self.user.is_superuser = True
+        self.user.save(update_fields=['is_superuser'])
+        self.assertAccepted(False)
+
+    def test_other_changes_keep_tokens(self):
+        self.user.first_name = 'Claims'
+        self.user.save()
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        self.assertAccepted(True)
+
+
+class ChatThrottleTests(TestCase):
+    """A request refused for its LLM quota isn't charged to the request bucket"""
+
+    def setUp(self):
+        patcher = mock.patch('chatbot_app.throttling._store', LocalBucketStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_quota_refusal_leaves_request_bucket_full(self):
+        limit = rate_limit_settings()['chat_anon']
+        charge_llm_tokens('ip:127.0.0.1', 10 ** 9)
+        for _ in range(limit['CAPACITY'] + 3):
+            response = self.client.post('/api/chat/', {'message': 'hello'}, content_type='application/json')
+            self.assertEqual(response.status_code, 429)
+        allowed, _ = take_tokens(
+            'chat:ip:127.0.0.1', limit['CAPACITY'], limit['REFILL_PER_MINUTE'] / 60, cost=0, required=limit['CAPACITY']
+        )
+        self.assertTrue(allowed)
+
+    @override_settings(
+        USE_RAG_PIPELINE=False,
+        RATE_LIMITS=dict(settings.RATE_LIMITS, LLM_TOKENS_PER_HOUR=3600),
+    )
+    def test_llm_debt_refuses_the_next_request(self):
+        answer = {'success': True, 'response': 'A long answer', 'model': 'test-model', 'tokens': 3660}
+        clock = mock.Mock(monotonic=mock.Mock(return_value=1000.0))
+        with mock.patch('chatbot_app.views.ChatbotService.generate_response', return_value=answer), \
+                mock.patch('chatbot_app.throttling.time', clock):
+            chat = lambda: self.client.post('/api/chat/', {'message': 'hello'}, content_type='application/json')
+            self.assertEqual(chat().status_code, 200)
+            # 3660 tokens from a bucket of 3600 leave 60 to pay back at one token a second
+            refused = chat()
+            self.assertEqual(refused.status_code, 429)
+            self.assertEqual(refused['Retry-After'], '61')
+            clock.monotonic.return_value = 1060.0
+            self.assertEqual(chat()['Retry-After'], '1')
+            clock.monotonic.return_value = 1061.0
+            self.assertEqual(chat().status_code, 200)
+
+
+class TokenBucketTests(SimpleTestCase):
+    """Buckets allow bursts up to their capacity, then refill at their rate"""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('chatbot_app.throttling.time', mock.Mock(monotonic=lambda: self.now))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = LocalBucketStore(max_buckets=2)
+
+    def take(self, key='bucket', cost=1, required=1):
+        return self.store.take(key, 3, 0.5, cost, required)[0]
+
+    def test_burst_then_refill(self):
+        self.assertEqual([self.take() for _ in range(4)], [True, True, True, False])
+        self.now += 1
+        self.assertFalse(self.take())
+        self.now += 1
+        self.assertTrue(self.take())
+        # A long idle spell refills no more than the capacity
+        self.now += 3600
+        self.assertEqual([self.take() for _ in range(4)], [True, True, True, False])
+
+    def test_debt_delays_refusals_until_paid(self):
+        self.assertTrue(self.take(cost=5, required=-1))
+        self.assertFalse(self.take())
+        self.now += 5.9
+        self.assertFalse(self.take())
+        self.now += 0.1
+        self.assertTrue(self.take())
+
+    def test_evicted_bucket_starts_full(self):
+        self.assertTrue(self.take('first', cost=3))
+        self.take('second')
+        self.take('third')
+        self.assertTrue(self.take('first', cost=3))
+
+    def test_wait_is_the_time_to_refill_what_is_required(self):
+        with mock.patch('chatbot_app.throttling._store', self.store):
+            self.assertEqual(take_tokens('bucket', 3, 0.5, cost=4, required=-1), (True, 0))
+            self.assertEqual(take_tokens('bucket', 3, 0.5), (False, 4.0))
+
+
+@skipUnless(FAKE_REDIS and importlib.util.find_spec('lupa'), 'django-redis, fakeredis and lupa are required')
+class RedisTokenBucketTests(SimpleTestCase):
+    """The Lua script keeps the bucket in Redis, timed by the Redis server"""
+
+    def setUp(self):
+        import fakeredis
+
+        self.redis = fakeredis.FakeStrictRedis()
+        patcher = mock.patch('django_redis.get_redis_connection', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = RedisBucketStore()
+
+    def test_burst_and_debt(self):
+        # A rate this slow refills nothing while the test runs
+        results = [self.store.take('bucket', 3, 0.001, 1, 1)[0] for _ in range(4)]
+        self.assertEqual(results, [True, True, True, False])
+        allowed, tokens = self.store.take('debt', 3, 0.001, 5, -1)
+        self.assertTrue(allowed)
+        self.assertAlmostEqual(tokens, -2, places=2)
+        self.assertFalse(self.store.take('debt', 3, 0.001, 0, 1)[0])
+        # The bucket expires once it would be full again
+        self.assertAlmostEqual(self.redis.ttl('chatbot:bucket:debt'), 5001, delta=2)
+
+    def test_clients_do_not_send_their_clock(self):
+        with mock.patch('chatbot_app.throttling.time') as clock:
+            self.store.take('bucket', 3, 1, 1, 1)
+        clock.time.assert_not_called()
+        updated = float(self.redis.hget('chatbot:bucket:bucket', 'updated'))
+        self.assertAlmostEqual(updated, self.redis.time()[0], delta=2)
+
+
+class ChatArchiveTests(TestCase):
+    """Archived messages read back exactly as they were stored, through every history endpoint"""
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.user = User.objects.create_user(username='archive-user')
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(self.user).access_token}')
+        self.session = ChatSession.objects.create(user=self.user, session_id='archive-session')
+        now = timezone.now()
+        ChatMessage.objects.bulk_create([
+            ChatMessage(
+                session=self.session, message_type='user', content=f'message {days}',
+                timestamp=now - timedelta(days=days, microseconds=days * 1001),
+            )
+            for days in (90, 60, 1)
+        ])
+        self.expected = [
+            (message.id, message.timestamp)
+            for message in ChatMessage.objects.filter(session=self.session).order_by('timestamp', 'id')
+        ]
+        self.assertEqual(archive_messages_before(now - timedelta(days=30)), (2, 1))
+
+    def history(self, messages):
+        return [(message['id'], parse_datetime(message['timestamp'])) for message in messages]
+
+    def test_session_detail_includes_archived_messages(self):
+        data = self.client.get(f'/api/sessions/{self.session.pk}/').json()
+        self.assertEqual(data['message_count'], 3)
+        self.assertEqual(self.history(data['messages']), self.expected)
+
+    def test_failed_archive_run_shows_no_duplicates(self):
+        session = ChatSession.objects.create(user=self.user, session_id='archive-failed')
+        ChatMessage.objects.bulk_create([
+            ChatMessage(session=session, message_type='user', content=f'day {day}',
+                        timestamp=timezone.now().replace(year=2026, month=1, day=day))
+            for day in (10, 20)
+        ])
+        archive_messages_before(timezone.now().replace(year=2026, month=1, day=15))
+        # The second run appends to the file, then fails before deleting the hot row
+        with mock.patch('chatbot_app.archive.ChatArchiveSegment.objects.select_for_update',
+                        side_effect=DatabaseError('lost connection')):
+            with self.assertRaises(DatabaseError):
+                archive_messages_before(timezone.now().replace(year=2026, month=1, day=25))
+        self.assertEqual(ChatMessage.objects.filter(session=session).count(), 1)
+
+        data = self.client.get(f'/api/sessions/{session.pk}/').json()
+        self.assertEqual([message['content'] for message in data['messages']], ['day 10', 'day 20'])
+        data = self.client.get(f'/api/sessions/{session.pk}/messages/').json()
+        self.assertEqual([message['content'] for message in data['results']], ['day 10', 'day 20'])
+
+    def test_session_messages_page_through_archive(self):
+        data = self.client.get(f'/api/sessions/{self.session.pk}/messages/', {'page_size': 2}).json()
+        messages = data['results']
+        data = self.client.get(
+            f'/api/sessions/{self.session.pk}/messages/', {'page_size': 2, 'cursor': data['next_cursor']}
+        ).json()
+        self.assertEqual(self.history(messages + data['results']), self.expected)
+
+
+class DocumentIndexMetadataTests(TestCase):
+    """Document edits that keep the text reach the filters applied inside the index search"""
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='index-owner')
+        self.other = User.objects.create_user(username='index-other')
+        staff = User.objects.create_user(username='index-staff', is_staff=True)
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(staff).access_token}')
+        self.pipeline = hash_pipeline(status='active', is_active=True)
+        patcher = mock.patch('chatbot_app.rag_pipeline._shared_pipeline', self.pipeline)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The best match for the query, and as many weaker ones as top_k
+        self.target = Document.objects.create(title='Target', content='solar panel maintenance', owner=self.owner)
+        others = [
+            Document.objects.create(title=f'Other {i}', content=f'solar notes {i}', owner=self.owner)
+            for i in range(self.pipeline.top_k)
+        ]
+        self.pipeline.add_documents([self.target, *others])
+
+    def retrieve(self, user):
+        return [doc['document_id'] for doc in self.pipeline.retrieve_relevant_documents(
+            'solar panel maintenance', {'user_id': user.id}
+        )]
+
+    def test_owner_change_moves_hits(self):
+        self.assertEqual(self.retrieve(self.owner)[0], self.target.id)
+        response = self.client.patch(
+            f'/api/documents/{self.target.id}/', {'owner': self.other.id}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.retrieve(self.other), [self.target.id])
+        hits = self.retrieve(self.owner)
+        self.assertNotIn(self.target.id, hits)
+        self.assertEqual(len(hits), self.pipeline.top_k)
+
+    def test_deleted_document_leaves_full_top_k(self):
+        self.assertEqual(self.client.delete(f'/api/documents/{self.target.id}/').status_code, 204)
+        hits = self.retrieve(self.owner)
+        self.assertNotIn(self.target.id, hits)
+        self.assertEqual(len(hits), self.pipeline.top_k)
+
+
+class DocumentUploadDedupTests(TestCase):
+    """Uploads are deduplicated per owner and tenant, never across them"""
+
+    def setUp(self):
+        cache.clear()
+        staff = User.objects.create_user(username='upload-staff', is_staff=True)
+        self.owner = User.objects.create_user(username='upload-owner')
+        self.other = User.objects.create_user(username='upload-other')
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(staff).access_token}')
+        patcher = mock.patch('chatbot_app.views.start_ingestion', return_value=mock.Mock(id=1))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, **fields):
+        return self.client.post(
+            '/api/documents/', dict({'title': 'Manual', 'content': 'same text'}, **fields),
+            content_type='application/json'
+        )
+
+    def test_same_owner_gets_the_existing_document(self):
+        first = self.upload(owner=self.owner.id)
+        second = self.upload(owner=self.owner.id)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 200)
+        self.assertTrue(second.json()['duplicate'])
+        self.assertEqual(second.json()['document']['id'], first.json()['document']['id'])
+
+    def test_other_owner_or_tenant_gets_a_new_document(self):
+        self.assertEqual(self.upload(owner=self.owner.id).status_code, 201)
+        for fields in ({'owner': self.other.id}, {}, {'owner': self.owner.id, 'tenant': 'acme'}):
+            response = self.upload(**fields)
+            self.assertEqual(response.status_code, 201, fields)
+            self.assertFalse(response.json()['duplicate'])
+        self.assertEqual(Document.objects.filter(owner=self.other).count(), 1)
+
+
+# A fast hasher keeps the logout and the next login within the same second
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class RevocationTimingTests(TestCase):
+    """Revoking a user's tokens leaves those issued right afterwards valid"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='timing-user', password='timing-pass-123')
+
+    def login(self):
+        response = self.client.post(
+            '/api/token/', {'username': 'timing-user', 'password': 'timing-pass-123'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def get_preferences(self, access):
+        return self.client.get('/api/preferences/', HTTP_AUTHORIZATION=f'Bearer {access}').status_code
+
+    def test_login_right_after_logout_everywhere(self):
+        old = self.login()
+        response = self.client.post('/api/logout/', {'all': True}, HTTP_AUTHORIZATION=f'Bearer {old["access"]}')
+        self.assertEqual(response.status_code, 200)
+        new = self.login()
+
+        self.assertEqual(self.get_preferences(old['access']), 401)
+        self.assertEqual(self.get_preferences(new['access']), 200)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': old['refresh']}).status_code, 401)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': new['refresh']}).status_code, 200)
+
+    def test_tokens_from_before_the_claim_use_iat(self):
+        token = tokens_for_user(self.user).access_token
+        del token['issued_at']
+        revoke_user_tokens(self.user.id)
+        self.assertEqual(self.get_preferences(token), 401)
+
+
+class OllamaContextTests(TestCase):
+    """What a chat turn sends Ollama from the turns before it"""
+
+    def setUp(self):
+        cache.clear()
+        self.session = ChatSession.objects.create(session_id='context-session')
+        patcher = mock.patch('chatbot_app.views.requests.post', side_effect=self.ollama)
+        self.post = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.returned_context = [1, 2, 3]
+
+    def ollama(self, url, json=None, **kwargs):
+        return mock.Mock(status_code=200, json=lambda: {
+            'response': 'answer', 'done': True, 'eval_count': 2, 'context': self.returned_context,
+        })
+
+    def turn(self, message='hello'):
+        result = ChatbotService().generate_response(message, system_prompt='Be brief.', session=self.session)
+        self.assertTrue(result['success'])
+        return self.post.call_args.kwargs['json']
+
+    def test_turns_stand_alone_by_default(self):
+        for _ in range(2):
+            payload = self.turn()
+            self.assertEqual(payload['system'], 'Be brief.')
+            self.assertNotIn('context', payload)
+
+    @override_settings(OLLAMA_SETTINGS={'CONVERSATION_CONTEXT': True, 'NUM_CTX': 2048, 'CONTEXT_RESERVE_TOKENS': 1024})
+    def test_conversation_context_is_opt_in(self):
+        first = self.turn()
+        self.assertEqual(first['system'], 'Be brief.')
+        second = self.turn()
+        self.assertEqual(second['context'], [1, 2, 3])
+        self.assertNotIn('system', second)
+
+        # A context leaving less than CONTEXT_RESERVE_TOKENS starts over from the system prompt
+        self.returned_context = list(range(1500))
+        self.turn()
+        fourth = self.turn()
+        self.assertEqual(fourth['system'], 'Be brief.')
+        self.assertNotIn('context', fourth)
+
+
+class EmbeddingDedupTests(TestCase):
+    """Re-indexing only embeds text that has no stored vector yet"""
+
+    CONTENT = (
+        'alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima '
+        'mike november oscar papa quebec romeo sierra tango uniform victor whiskey'
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.encoder = CountingEncoder(64)
+        self.pipeline = hash_pipeline(encoder=self.encoder, chunk_size=60, chunk_overlap=0)
+        self.document = Document.objects.create(title='Alphabet', content=self.CONTENT)
+        self.chunks = self.pipeline.add_documents([self.document])
+        self.assertGreater(self.chunks, 2)
+        self.encoder.encoded.clear()
+
+    def embeddings(self, document):
+        return list(DocumentEmbedding.objects.filter(
+            document=document, generation=self.pipeline.generation
+        ).order_by('chunk_index').values_list('id', 'content_hash'))
+
+    def test_unchanged_document_is_skipped(self):
+        before = self.embeddings(self.document)
+        self.assertEqual(self.pipeline.add_documents([self.document]), 0)
+        self.assertEqual(self.encoder.encoded, [])
+        self.assertEqual(self.embeddings(self.document), before)
+
+    def test_edit_embeds_only_the_changed_chunk(self):
+        before = [content_hash for _, content_hash in self.embeddings(self.document)]
+        self.document.content = self.CONTENT.replace('whiskey', 'walrus')
+        self.document.save()
+        self.assertEqual(self.pipeline.add_documents([self.document]), self.chunks)
+        self.assertEqual(len(self.encoder.encoded), 1)
+        self.assertIn('walrus', self.encoder.encoded[0])
+
+        after = [content_hash for _, content_hash in self.embeddings(self.document)]
+        self.assertEqual(after[:-1], before[:-1])
+        self.assertNotEqual(after[-1], before[-1])
+        # The replaced vectors are no longer returned
+        hits = self.pipeline.retrieve_relevant_documents('uniform victor whiskey')
+        current = {embedding_id for embedding_id, _ in self.embeddings(self.document)}
+        self.assertTrue(hits)
+        self.assertTrue({hit['embedding_id'] for hit in hits} <= current)
+
+    def test_identical_text_shares_vectors(self):
+        copy = Document.objects.create(title='Alphabet', content=self.CONTENT)
+        self.assertEqual(self.pipeline.add_documents([copy]), self.chunks)
+        self.assertEqual(self.encoder.encoded, [])
+        self.assertEqual(
+            [content_hash for _, content_hash in self.embeddings(copy)],
+            [content_hash for _, content_hash in self.embeddings(self.document)],
+        )
+
+    def test_new_generation_of_the_same_model_reuses_vectors(self):
+        encoder = CountingEncoder(64)
+        pipeline = hash_pipeline(encoder=encoder, chunk_size=60, chunk_overlap=0)
+        self.assertEqual(pipeline.add_documents([self.document]), self.chunks)
+        self.assertEqual(encoder.encoded, [])
+
+
+class GenerationLifecycleTests(TestCase):
+    """Generations are built aside, switched to and back atomically, and purged once retired"""
+
+    def setUp(self):
+        cache.clear()
+        snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_dir.cleanup)
+        self.enterContext(override_settings(
+            RAG_SETTINGS=dict(settings.RAG_SETTINGS, INDEX_SNAPSHOT_DIR=snapshot_dir.name)
+        ))
+        encoder = mock.patch('chatbot_app.rag_pipeline.get_encoder', return_value=HashEncoder(64))
+        encoder.start()
+        self.addCleanup(encoder.stop)
+        shared = mock.patch('chatbot_app.rag_pipeline._shared_pipeline', None)
+        shared.start()
+        self.addCleanup(shared.stop)
+        self.serving = get_active_generation()
+        Document.objects.create(title='Generations', content='blue green switch of embedding generations')
+
+    def build(self):
+        generation = create_generation(embedding_model='benchmark/hash-encoder', vector_dimension=64)
+        build_embedding_generation(generation.id)
+        generation.refresh_from_db()
+        return generation
+
+    def activate(self, generation_id):
+        with self.captureOnCommitCallbacks(execute=True):
+            return activate_generation(generation_id)
+
+    def test_activation_retires_the_previous_generation(self):
+        generation = self.build()
+        self.assertEqual((generation.status, generation.document_count), ('ready', 1))
+        self.assertGreater(generation.chunk_count, 0)
+
+        self.activate(generation.id)
+        generation.refresh_from_db()
+        self.serving.refresh_from_db()
+        self.assertEqual((generation.status, generation.is_active), ('active', True))
+        self.assertEqual(generation.previous_id, self.serving.id)
+        self.assertEqual((self.serving.status, self.serving.is_active), ('retired', False))
+        self.assertEqual(active_generation_id(), generation.id)
+
+    def test_only_built_generations_can_be_activated(self):
+        generation = create_generation(status='building')
+        with self.assertRaises(GenerationError):
+            activate_generation(generation.id)
+        self.serving.refresh_from_db()
+        self.assertTrue(self.serving.is_active)
+
+    def test_rollback_switches_back(self):
+        with self.assertRaises(GenerationError):
+            rollback_generation()
+        generation = self.build()
+        self.activate(generation.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            rollback_generation()
+        self.assertEqual(active_generation_id(), self.serving.id)
+        generation.refresh_from_db()
+        self.assertEqual((generation.status, generation.is_active), ('retired', False))
+
+    def test_purge_deletes_retired_generations_only(self):
+        generation = self.build()
+        directory = snapshot_directory(generation)
+        self.assertTrue(os.path.isdir(directory))
+        with self.assertRaises(GenerationError):
+            purge_generation(self.serving.id)
+
+        purge_generation(generation.id)
+        self.assertFalse(EmbeddingGeneration.objects.filter(id=generation.id).exists())
+        self.assertFalse(DocumentEmbedding.objects.filter(generation_id=generation.id).exists())
+        self.assertFalse(os.path.exists(directory))
+
+    def test_serving_pipeline_follows_the_active_generation(self):
+        self.assertEqual(get_rag_pipeline().generation.id, self.serving.id)
+        generation = self.build()
+        self.activate(generation.id)
+        pipeline = get_rag_pipeline()
+        self.assertEqual(pipeline.generation.id, generation.id)
+        pipeline.similarity_threshold = -1.0
+        hits = pipeline.retrieve_relevant_documents('embedding generations')
+        self.assertEqual([hit['title'] for hit in hits], ['Generations'])
+
+
+@override_settings(RAG_SETTINGS=dict(settings.RAG_SETTINGS, RETRIEVAL_CACHE_TIMEOUT=0))
+class QuantizedSearchTests(TestCase):
+    """Int8 and binary generations find the same documents as float32 ones"""
+
+    TOPICS = {
+        'Kittens': 'kittens purr softly and chase yarn around the warm kitchen',
+        'Volcanoes': 'volcanoes erupt molten lava and ash over the mountain slopes',
+        'Invoices': 'invoices list the amount due payment terms and the billing address',
+        'Sailing': 'sailing boats tack against the wind across the open harbour',
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.documents = [
+            Document.objects.create(title=title, content=content) for title, content in self.TOPICS.items()
+        ]
+
+    def pipeline(self, quantization):
+        pipeline = hash_pipeline(quantization=quantization)
+        pipeline.top_k = 2
+        pipeline.add_documents(self.documents)
+        return pipeline
+
+    def test_int8_round_trip(self):
+        vector = np.random.default_rng(0).standard_normal(64).astype(np.float32)
+        data = quantize_int8(vector)
+        self.assertEqual(len(data), 4 + 64)
+        scale = np.abs(vector).max() / 127
+        self.assertLessEqual(np.abs(dequantize_int8(data) - vector).max(), scale / 2 + 1e-6)
+        self.assertFalse(dequantize_int8(quantize_int8(np.zeros(8))).any())
+
+    def test_quantized_pipelines_find_the_right_document(self):
+        for quantization in ('int8', 'binary'):
+            with self.subTest(quantization=quantization):
+                pipeline = self.pipeline(quantization)
+                embeddings = DocumentEmbedding.objects.filter(generation=pipeline.generation)
+                self.assertFalse(embeddings.filter(vector_data__isnull=True).exists())
+                # Also when the index is rebuilt from the stored int8 vectors
+                rebuilt = RAGPipeline(use_snapshot=False, generation=pipeline.generation, encoder=HashEncoder(64))
+                rebuilt.similarity_threshold = -1.0
+                for searched in (pipeline, rebuilt):
+                    hits = searched.retrieve_relevant_documents('lava and ash from volcanoes')
+                    self.assertEqual(hits[0]['title'], 'Volcanoes')
+
+    def test_binary_hits_are_rescored_by_cosine(self):
+        pipeline = self.pipeline('binary')
+        pipeline.similarity_threshold = -1.0
+        query = 'the kittens chase boats across the harbour'
+        hits = pipeline.retrieve_relevant_documents(query)
+        self.assertEqual(len(hits), pipeline.top_k)
+
+        query_vector = HashEncoder(64).encode([query])[0]
+        query_vector /= np.linalg.norm(query_vector)
+        scores = [hit['similarity_score'] for hit in hits]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        for hit in hits:
+            stored = np.array(DocumentEmbedding.objects.get(id=hit['embedding_id']).get_embedding())
+            self.assertAlmostEqual(hit['similarity_score'], float(stored @ query_vector / np.linalg.norm(stored)), places=5)
+        self.assertEqual({hit['title'] for hit in hits}, {'Kittens', 'Sailing'})
+
+
+class MicroBatcherTests(SimpleTestCase):
+    """Items submitted close together are processed in one call"""
+
+    def batcher(self, process=None, **kwargs):
+        """A batcher recording its batches in ``self.batches``, multiplying by 10 unless given ``process``"""
+        self.batches = []
+        process = process or (lambda items: [item * 10 for item in items])
+
+        def process_batch(items):
+            self.batches.append(items)
+            return process(items)
+
+        return MicroBatcher(process_batch, **dict({'max_wait_ms': 200}, **kwargs))
+
+    def test_items_submitted_together_share_a_batch(self):
+        batcher = self.batcher()
+        futures = [batcher.submit(item) for item in range(5)]
+        self.assertEqual([future.result(timeout=2) for future in futures], [0, 10, 20, 30, 40])
+        self.assertEqual(self.batches, [[0, 1, 2, 3, 4]])
+
+    def test_batches_are_capped_at_max_batch_size(self):
+        batcher = self.batcher(max_batch_size=2)
+        futures = [batcher.submit(item) for item in range(5)]
+        self.assertEqual([future.result(timeout=2) for future in futures], [0, 10, 20, 30, 40])
+        self.assertEqual(self.batches, [[0, 1], [2, 3], [4]])
+
+    def test_errors_reach_every_caller_of_the_batch(self):
+        def process(items):
+            if 'bad' in items:
+                raise ValueError('bad item')
+            return items
+
+        batcher = self.batcher(process)
+        futures = [batcher.submit(item) for item in ('good', 'bad')]
+        for future in futures:
+            with self.assertRaisesMessage(ValueError, 'bad item'):
+                future.result(timeout=2)
+        # The worker carries on with the next batch
+        self.assertEqual(batcher.submit('next').result(timeout=2), 'next')
+
+    def test_idle_worker_exits_and_restarts(self):
+        batcher = self.batcher(max_wait_ms=1, idle_timeout=0.05)
+        self.assertEqual(batcher.submit(1).result(timeout=2), 10)
+        self.assertTrue(wait_until(lambda: batcher._worker is None))
+        self.assertEqual(batcher.submit(2).result(timeout=2), 20)
+
+
+class RetrievalCacheTests(TestCase):
+    """Repeated retrievals are served from the cache until the index changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.encoder = CountingEncoder(64)
+        self.pipeline = hash_pipeline(encoder=self.encoder)
+        self.pipeline.add_documents([
+            Document.objects.create(title='Tides', content='tides rise and fall with the moon'),
+        ])
+        self.encoder.encoded.clear()
+
+    def titles(self, query):
+        return [hit['title'] for hit in self.pipeline.retrieve_relevant_documents(query)]
+
+    def test_repeated_query_skips_encoding(self):
+        self.assertEqual(self.titles('moon tides'), ['Tides'])
+        self.assertEqual(self.titles('  moon   tides '), ['Tides'])
+        self.assertEqual(self.encoder.encoded, ['moon tides'])
+
+    def test_adding_documents_invalidates(self):
+        self.titles('moon tides')
+        self.pipeline.add_documents([
+            Document.objects.create(title='Moon', content='the moon orbits and pulls the tides'),
+        ])
+        self.encoder.encoded.clear()
+        self.assertEqual(sorted(self.titles('moon tides')), ['Moon', 'Tides'])
+        self.assertEqual(self.encoder.encoded, ['moon tides'])
+
+    def test_revision_is_stable_until_invalidated(self):
+        generation_id = self.pipeline.generation.id
+        revision = index_revision(generation_id)
+        self.assertEqual(index_revision(generation_id), revision)
+        invalidate_retrieval_cache(generation_id)
+        self.assertNotEqual(index_revision(generation_id), revision)
+        # A lost revision is replaced by a new random token, never an old one
+        cache.clear()
+        self.assertNotIn(index_revision(generation_id), (revision, None))
+
+    def test_key_covers_the_searched_index(self):
+        key = retrieval_cache_key('moon tides', 1, 3, 0.7, (), index_version=1)
+        self.assertEqual(retrieval_cache_key(' moon  tides', 1, 3, 0.7, (), index_version=1), key)
+        for changed in (
+            retrieval_cache_key('moon tides', 1, 3, 0.7, (), index_version=2),
+            retrieval_cache_key('moon tides', 2, 3, 0.7, (), index_version=1),
+            retrieval_cache_key('moon tides', 1, 5, 0.7, (), index_version=1),
+            retrieval_cache_key('moon tides', 1, 3, 0.7, (('tenant', 'acme'),), index_version=1),
+        ):
+            self.assertNotEqual(changed, key)
+
+
+class EagerIngestionTestCase(TestCase):
+    """
+    Runs ingestion jobs inline instead of on a background thread, into an
+    active generation embedded by HashEncoder
+    """
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_dir.cleanup)
+        self.enterContext(override_settings(
+            MEDIA_ROOT=media_root.name,
+            RAG_SETTINGS=dict(settings.RAG_SETTINGS, INDEX_SNAPSHOT_DIR=snapshot_dir.name),
+        ))
+        for patcher in (
+            mock.patch('chatbot_app.tasks.dispatch_task', side_effect=lambda task, *args: task(*args)),
+            mock.patch('chatbot_app.rag_pipeline.get_encoder', return_value=HashEncoder(64)),
+            mock.patch('chatbot_app.rag_pipeline._shared_pipeline', None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        create_generation(
+            embedding_model='benchmark/hash-encoder', vector_dimension=64,
+            status='active', is_active=True, activated_at=timezone.now()
+        )
+
+    def retrieve(self, query):
+        pipeline = get_rag_pipeline()
+        pipeline.similarity_threshold = -1.0
+        return [hit['title'] for hit in pipeline.retrieve_relevant_documents(query)]
+
+
+class IngestionJobTests(EagerIngestionTestCase):
+    """Ingestion jobs embed their documents and record progress, throughput and errors"""
+
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user(username='ingest-staff', is_staff=True)
+        self.documents = [
+            Document.objects.create(title=f'Guide {i}', content=f'guide number {i} explains topic {i}')
+            for i in range(3)
+        ]
+
+    def test_job_records_progress_and_throughput(self):
+        job = start_ingestion(document_ids=[document.id for document in self.documents], user=self.staff)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual((job.total_documents, job.processed_documents), (3, 3))
+        self.assertEqual(job.total_chunks, DocumentEmbedding.objects.count())
+        self.assertGreater(job.total_chunks, 0)
+        self.assertEqual(job.errors, [])
+        self.assertLessEqual(job.started_at, job.finished_at)
+        self.assertGreater(job.documents_per_second(), 0)
+        self.assertIn('Guide 2', self.retrieve('topic 2'))
+
+    def test_failed_batch_is_recorded_and_the_rest_ingested(self):
+        add_documents = RAGPipeline.add_documents
+
+        def fail_first_batch(pipeline, documents):
+            if self.documents[0] in documents:
+                raise RuntimeError('encoder crashed')
+            return add_documents(pipeline, documents)
+
+        with mock.patch.object(RAGPipeline, 'add_documents', fail_first_batch), \
+                override_settings(RAG_SETTINGS=dict(settings.RAG_SETTINGS, INGEST_BATCH_SIZE=2)):
+            job = start_ingestion(document_ids=[document.id for document in self.documents])
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.processed_documents, 3)
+        self.assertEqual(job.errors, [
+            {'documents': [self.documents[0].id, self.documents[1].id], 'error': 'encoder crashed'}
+        ])
+        self.assertEqual(set(DocumentEmbedding.objects.values_list('document_id', flat=True)), {self.documents[2].id})
+
+    def test_job_fails_when_nothing_was_ingested(self):
+        job = start_ingestion(source_files=['uploads/missing.txt', 'uploads/tool.exe'])
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual([error['file'] for error in job.errors], ['uploads/missing.txt', 'uploads/tool.exe'])
+        self.assertIsNotNone(job.finished_at)
+
+    def test_source_files_become_documents(self):
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'uploads'))
+        with open(os.path.join(settings.MEDIA_ROOT, 'uploads', 'faq.md'), 'w') as source:
+            source.write('# Refunds\n\nRefunds are paid **within ten days**.\n')
+        job = start_ingestion(source_files=['uploads/faq.md'])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed_documents), ('completed', 1))
+        document = Document.objects.get(id=job.document_ids[0])
+        self.assertEqual((document.title, document.document_type), ('faq', 'markdown'))
+        self.assertEqual(document.content, 'Refunds\n\nRefunds are paid within ten days.')
+        self.assertIn('faq', self.retrieve('refunds paid'))
+
+    def test_endpoint_reports_jobs_to_their_creator(self):
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(self.staff).access_token}')
+        response = client.post(
+            '/api/ingestion-jobs/', {'document_ids': [self.documents[0].id]}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        job = client.get(f'/api/ingestion-jobs/{response.json()["id"]}/').json()
+        self.assertEqual((job['status'], job['processed_documents']), ('completed', 1))
+        for field in ('duration_seconds', 'documents_per_second', 'chunks_per_second'):
+            self.assertIn(field, job)
+
+        self.assertEqual(client.post(
+            '/api/ingestion-jobs/', {'document_ids': [0]}, content_type='application/json'
+        ).status_code, 400)
+        other = User.objects.create_user(username='ingest-other')
+        other_client = Client(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(other).access_token}')
+        self.assertEqual(other_client.get(f'/api/ingestion-jobs/{job["id"]}/').status_code, 404)
+
+
+def minimal_pdf(*pages):
+    """Bytes of a PDF with one line of Helvetica text per page"""
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for text in pages:
+        stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'.encode('latin-1')
+        objects.append(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream))
+        objects.append(
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+            b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % (len(objects))
+        )
+        kids.append(f'{len(objects)} 0 R'.encode())
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(kids), len(kids))
+
+    pdf = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(pdf)
+    pdf += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    pdf += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    pdf += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return pdf
+
+
+# Tiny reads make every extractor stitch its text across many chunks
+@override_settings(DOCUMENT_UPLOADS=dict(settings.DOCUMENT_UPLOADS, READ_CHUNK_BYTES=7))
+class TextExtractionTests(SimpleTestCase):
+    """Uploaded files are streamed into plain text"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as target:
+            target.write(data.encode('utf-8') if isinstance(data, str) else data)
+        return path
+
+    def test_markdown_keeps_only_text(self):
+        path = self.write('guide.md', (
+            '# Setup\n\n> Read **this** first\n\n- Install [the app](https://example.com)\n'
+            '1. Run `make`\n```bash\nmake\n```\n![diagram](d.png)\n'
+        ))
+        self.assertEqual(
+            extract_text(path, 'markdown'),
+            'Setup\n\nRead this first\n\nInstall the app\nRun make\n\nmake\n\ndiagram'
+        )
+
+    def test_html_skips_scripts_and_styles(self):
+        path = self.write('page.html', (
+            '<html><head><style>p { color: red }</style><script>var secret = 1;</script></head>'
+            '<body><h1>Opening&nbsp;hours</h1><p>Mon&ndash;Fri   9&amp;5</p></body></html>'
+        ))
+        self.assertEqual(extract_text(path, 'html'), 'Opening\xa0hours\nMon\u2013Fri 9&5')
+
+    def test_text_stops_at_max_chars(self):
+        path = self.write('long.txt', 'abcdefghij' * 10)
+        self.assertEqual(extract_text(path, 'text', max_chars=25), 'abcdefghijabcdefghijabcde')
+
+    def test_unknown_types_are_rejected(self):
+        self.assertEqual(detect_document_type('notes.MD'), 'markdown')
+        self.assertEqual(detect_document_type('upload', 'text/html; charset=utf-8'), 'html')
+        self.assertIsNone(detect_document_type('tool.exe', 'application/octet-stream'))
+        with self.assertRaisesMessage(ExtractionError, 'Unsupported document type'):
+            extract_text(self.write('tool.exe', b'MZ'), 'exe')
+
+    def test_pdf_needs_pypdf(self):
+        path = self.write('manual.pdf', minimal_pdf('Hello'))
+        with mock.patch.dict(sys.modules, {'pypdf': None}):
+            with self.assertRaisesMessage(ExtractionError, 'requires the pypdf package'):
+                extract_text(path, 'pdf')
+
+    @skipUnless(importlib.util.find_spec('pypdf'), 'pypdf is not installed')
+    def test_pdf_pages_are_extracted(self):
+        path = self.write('manual.pdf', minimal_pdf('First page text', 'Second page text'))
+        self.assertEqual(extract_text(path, 'pdf'), 'First page text\nSecond page text')
+        with self.assertRaises(ExtractionError):
+            extract_text(self.write('broken.pdf', b'%PDF-1.4 truncated'), 'pdf')
+
+
+@override_settings(DOCUMENT_UPLOADS=dict(settings.DOCUMENT_UPLOADS, MAX_UPLOAD_BYTES=64))
+class DocumentUploadTests(EagerIngestionTestCase):
+    """Uploaded files are checked, stored, deduplicated by content and ingested"""
+
+    def setUp(self):
+        super().setUp()
+        staff = User.objects.create_user(username='uploader', is_staff=True)
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(staff).access_token}')
+
+    def test_serializer_checks_size_and_type(self):
+        cases = [
+            ({'file': SimpleUploadedFile('big.txt', b'x' * 65, 'text/plain')}, 'file'),
+            ({'file': SimpleUploadedFile('tool.exe', b'MZ', 'application/octet-stream')}, 'file'),
+            ({'title': 'Empty'}, 'non_field_errors'),
+            ({'content': 'No title'}, 'title'),
+        ]
+        for data, field in cases:
+            serializer = DocumentSerializer(data=data)
+            self.assertFalse(serializer.is_valid())
+            self.assertIn(field, serializer.errors, data)
+
+        serializer = DocumentSerializer(data={'file': SimpleUploadedFile('Setup Guide.md', b'# Setup', 'text/plain')})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(
+            (serializer.validated_data['title'], serializer.validated_data['document_type']),
+            ('Setup Guide', 'markdown')
+        )
+
+    def test_upload_is_extracted_and_ingested(self):
+        data = b'<p>Parcels ship <b>next day</b>.</p>'
+        response = self.client.post('/api/documents/', {'file': SimpleUploadedFile('shipping.html', data, 'text/html')})
+        self.assertEqual(response.status_code, 201)
+        document = Document.objects.get(id=response.json()['document']['id'])
+        self.assertEqual(document.source_hash, hashlib.sha256(data).hexdigest())
+        self.assertEqual(document.content, 'Parcels ship next day.')
+        job = IngestionJob.objects.get(id=response.json()['ingestion_job'])
+        self.assertEqual((job.status, job.document_ids), ('completed', [document.id]))
+        self.assertIn('shipping', self.retrieve('parcels ship'))
+
+        again = self.client.post('/api/documents/', {'file': SimpleUploadedFile('copy.html', data, 'text/html')})
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json()['document']['id'], document.id)
+
+    def test_rejected_upload_stores_nothing(self):
+        response = self.client.post('/api/documents/', {'file': SimpleUploadedFile('big.txt', b'x' * 65)})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Document.objects.exists())
+        self.assertFalse(os.listdir(settings.MEDIA_ROOT))
+
+
+@override_settings(USE_RAG_PIPELINE=False)
+class ChatWebSocketTests(TransactionTestCase):
+    """
+    The chat socket driven in-process through its ASGI app. Turns run on
+    worker threads with their own database connections, hence a
+    TransactionTestCase.
+    """
+
+    def setUp(self):
+        cache.clear()
+        for patcher in (
+            mock.patch('chatbot_app.throttling._store', LocalBucketStore()),
+            mock.patch('chatbot_app.views.ChatbotService.generate_response', side_effect=self.generate_response),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(username='socket-user', password='secret')
+        self.other = User.objects.create_user(username='socket-other')
+        ChatSession.objects.create(user=self.other, session_id='other-session')
+
+    def generate_response(self, message, on_token=None, **kwargs):
+        for piece in ('Hel', 'lo'):
+            if on_token:
+                on_token(piece)
+        return {'success': True, 'response': 'Hello', 'model': 'test-model', 'tokens': 2}
+
+    async def connect(self, path=CHAT_PATH, query_string=b'', headers=()):
+        communicator = ApplicationCommunicator(websocket_application, {
+            'type': 'websocket', 'path': path, 'query_string': query_string,
+            'headers': [(name.encode(), value.encode()) for name, value in headers],
+            'client': ('127.0.0.1', 50000),
+        })
+        # The test's event loop cancels the app when it ends
+        self.addCleanup(communicator.stop, exceptions=False)
+        await communicator.send_input({'type': 'websocket.connect'})
+        return communicator, await communicator.receive_output(timeout=2)
+
+    async def token_socket(self, user):
+        token = await sync_to_async(lambda: str(tokens_for_user(user).access_token))()
+        communicator, accepted = await self.connect(query_string=f'token={token}'.encode())
+        self.assertEqual(accepted, {'type': 'websocket.accept'})
+        return communicator
+
+    async def chat(self, communicator, **message):
+        """Send a message and collect the frames up to its ``done`` or ``error``"""
+        await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps(message)})
+        frames = []
+        while not frames or frames[-1]['type'] not in ('done', 'error'):
+            frames.append(json.loads((await communicator.receive_output(timeout=2))['text']))
+        return frames
+
+    async def test_answer_streams_in_token_frames(self):
+        communicator = await self.token_socket(self.user)
+        frames = await self.chat(communicator, message='hi', session_id='mine', request_id='r1')
+        self.assertEqual([frame['type'] for frame in frames], ['start', 'token', 'token', 'done'])
+        self.assertEqual({frame['request_id'] for frame in frames}, {'r1'})
+        self.assertEqual(''.join(frame['token'] for frame in frames[1:3]), 'Hello')
+        self.assertEqual((frames[-1]['response'], frames[-1]['tokens_used']), ('Hello', 2))
+        session = await ChatSession.objects.aget(session_id='mine')
+        self.assertEqual(session.user_id, self.user.id)
+
+    async def test_other_users_session_is_not_found(self):
+        communicator = await self.token_socket(self.user)
+        frames = await self.chat(communicator, message='hi', session_id='other-session')
+        self.assertEqual(frames[-1]['error'], 'Chat session not found')
+        self.assertFalse(await ChatMessage.objects.filter(session__session_id='other-session').aexists())
+
+    async def test_revoked_token_closes_the_socket(self):
+        communicator = await self.token_socket(self.user)
+        self.assertEqual((await self.chat(communicator, message='hi'))[-1]['type'], 'done')
+        await sync_to_async(revoke_user_tokens)(self.user.id)
+        frames = await self.chat(communicator, message='again')
+        self.assertEqual(frames, [{'type': 'error', 'error': 'Token expired or revoked'}])
+        self.assertEqual(
+            await communicator.receive_output(timeout=2), {'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED}
+        )
+
+    async def test_invalid_token_or_path_is_refused(self):
+        _, refused = await self.connect(query_string=b'token=not-a-jwt')
+        self.assertEqual(refused, {'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        _, refused = await self.connect(path='/ws/other/')
+        self.assertEqual(refused, {'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+
+    async def test_session_cookie_only_counts_from_our_origin(self):
+        client = Client()
+        await sync_to_async(client.force_login)(self.user)
+        cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        for origin, session_id, owner in (
+            ('http://testserver', 'same-origin', self.user.id),
+            ('https://evil.example', 'cross-site', None),
+        ):
+            communicator, _ = await self.connect(
+                headers=[('host', 'testserver'), ('origin', origin), ('cookie', cookie)]
+            )
+            self.assertEqual((await self.chat(communicator, message='hi', session_id=session_id))[-1]['type'], 'done')
+            session = await ChatSession.objects.aget(session_id=session_id)
+            self.assertEqual(session.user_id, owner)
+
+
+class HealthProbeTests(TestCase):
+    """Liveness does no I/O, readiness only asks the database, the deep check is cached"""
+
+    def setUp(self):
+        cache.clear()
+        for patcher in (
+            mock.patch('chatbot_app.health.start_health_refresher'),
+            mock.patch('chatbot_app.health.requests.get', side_effect=self.ollama_tags),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.ollama_up = True
+        self.ollama_calls = 0
+
+    def ollama_tags(self, url, timeout=None):
+        self.ollama_calls += 1
+        if not self.ollama_up:
+            raise requests.exceptions.ConnectionError('connection refused')
+        return mock.Mock(json=lambda: {'models': [{'name': 'llama2'}]})
+
+    def test_live_does_no_io(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/live')
+        self.assertEqual((response.status_code, response.json()['status']), (200, 'alive'))
+
+    def test_ready_follows_the_database(self):
+        response = self.client.get('/api/ready')
+        self.assertEqual((response.status_code, response.json()['status']), (200, 'ready'))
+        self.assertEqual(self.ollama_calls, 0)
+        with mock.patch('chatbot_app.views.check_database', side_effect=DatabaseError('gone away')):
+            response = self.client.get('/api/ready')
+        self.assertEqual((response.status_code, response.json()['error']), (503, 'gone away'))
+
+    def test_deep_check_is_served_from_the_cache(self):
+        first = self.client.get('/api/health/')
+        self.assertEqual((first.status_code, first.json()['status']), (200, 'healthy'))
+        self.assertEqual(first.json()['ollama']['models'], ['llama2'])
+        self.ollama_up = False
+        second = self.client.get('/api/health/')
+        self.assertEqual(second.json()['checked_at'], first.json()['checked_at'])
+        self.assertEqual(self.ollama_calls, 1)
+
+        # Without Ollama chat falls back to canned answers; without a database nothing works
+        cache.delete(HEALTH_CACHE_KEY)
+        self.assertEqual(self.client.get('/api/health/').json()['status'], 'degraded')
+        cache.delete(HEALTH_CACHE_KEY)
+        with mock.patch('chatbot_app.health.check_database', side_effect=DatabaseError('gone away')):
+            response = self.client.get('/api/health/')
+        self.assertEqual((response.status_code, response.json()['status']), (503, 'unhealthy'))
+
+
+@override_settings(USE_RAG_PIPELINE=False)
+class ChatInstrumentationTests(TestCase):
+    """Every chat turn records its stage and Ollama timings, for /api/metrics and /api/llm-stats/"""
+
+    OLLAMA_RESPONSE = {
+        'response': 'Fifty tokens a second', 'done': True,
+        'total_duration': 1_700_000_000, 'load_duration': 1_200_000_000,
+        'prompt_eval_count': 10, 'prompt_eval_duration': 50_000_000,
+        'eval_count': 20, 'eval_duration': 400_000_000,
+    }
+
+    def setUp(self):
+        cache.clear()
+        for patcher in (
+            mock.patch('chatbot_app.throttling._store', LocalBucketStore()),
+            mock.patch('chatbot_app.views.requests.post', return_value=mock.Mock(
+                status_code=200, json=lambda: dict(self.OLLAMA_RESPONSE)
+            )),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def chat(self, client=None, **fields):
+        response = (client or self.client).post(
+            '/api/chat/', dict({'message': 'how fast?'}, **fields), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return ChatMessage.objects.filter(message_type='bot').latest('timestamp')
+
+    def test_answer_stores_stage_timings(self):
+        timings = self.chat().metadata['timings']
+        for stage in ('chat.session', 'chat.save_user_message', 'ollama.generate', 'total'):
+            self.assertIn(stage, timings)
+            self.assertGreaterEqual(timings[stage], 0)
+        self.assertGreaterEqual(timings['total'], timings['ollama.generate'])
+
+    def test_metrics_endpoint(self):
+        answered = CHAT_REQUESTS.value(outcome='ai')
+        self.chat()
+        self.assertEqual(CHAT_REQUESTS.value(outcome='ai'), answered + 1)
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('# TYPE chatbot_stage_duration_seconds histogram', text)
+        self.assertIn('chatbot_stage_duration_seconds_count{stage="chat.total"}', text)
+        self.assertIn(f'chatbot_chat_requests_total{{outcome="ai"}} {answered + 1}', text)
+
+    @override_settings(METRICS_AUTH_TOKEN='scrape-secret')
+    def test_metrics_token_gate(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret').status_code, 200)
+
+    def test_answer_stores_ollama_breakdown(self):
+        metadata = self.chat().metadata
+        self.assertEqual(metadata['ollama'], {
+            'total_ms': 1700.0, 'load_ms': 1200.0, 'prompt_eval_ms': 50.0, 'eval_ms': 400.0,
+            'prompt_eval_count': 10, 'eval_count': 20, 'tokens_per_second': 50.0, 'cold_load': True,
+        })
+        self.assertEqual(metadata['tokens_used'], 20)
+
+    def test_llm_stats_are_for_admins(self):
+        config = ChatbotConfig.objects.create(name='support', model_name='llama2')
+        user = User.objects.create_user(username='stats-user')
+        staff = User.objects.create_user(username='stats-staff', is_staff=True)
+        staff_client = Client(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(staff).access_token}')
+        for _ in range(2):
+            self.chat(staff_client)
+        session = ChatSession.objects.create(session_id='stats-session')
+        # Neither a fallback answer nor one older than ?days= counts
+        ChatMessage.objects.create(session=session, message_type='bot', content='fallback',
+                                   metadata={'fallback_used': True})
+        ChatMessage.objects.create(session=session, message_type='bot', content='old',
+                                   timestamp=timezone.now() - timedelta(days=30),
+                                   metadata={'model_used': 'llama2', 'ollama': {'eval_count': 999}})
+
+        self.assertEqual(self.client.get('/api/llm-stats/').status_code, 401)
+        user_client = Client(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(user).access_token}')
+        self.assertEqual(user_client.get('/api/llm-stats/').status_code, 403)
+        self.assertEqual(staff_client.get('/api/llm-stats/', {'days': 0}).status_code, 400)
+
+        stats = staff_client.get('/api/llm-stats/').json()
+        expected = {
+            'messages': 2, 'tokens': 40, 'tokens_per_second': 50.0, 'prompt_tokens': 20,
+            'avg_prompt_eval_ms': 50.0, 'prompt_eval_ms_per_token': 5.0, 'avg_total_ms': 1700.0,
+            'avg_load_ms': 1200.0, 'cold_loads': 2, 'cold_load_rate': 1.0,
+        }
+        self.assertEqual(stats['by_model'], [dict(expected, model_used='llama2')])
+        self.assertEqual(stats['by_config'], [dict(expected, config_id=config.id, config_name='support')])
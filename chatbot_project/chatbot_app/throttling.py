@@ -0,0 +1,225 @@
+# chatbot_app/throttling.py
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.throttling import BaseThrottle
+
+from .models import UserPreference
+
+logger = logging.getLogger(__name__)
+
+BUCKET_KEY_PREFIX = 'chatbot:bucket:'
+QUOTA_CACHE_PREFIX = 'chatbot:llm-quota:'
+# Buckets kept by the in-process store; evicting one only resets it to full
+LOCAL_MAX_BUCKETS = 10000
+
+# Refill, then take ``cost`` tokens if at least ``required`` are left, or
+# regardless when ``required`` is negative. The bucket expires once it would
+# be full again, as a missing bucket is full. Time comes from the Redis
+# server, so nodes with skewed clocks can't refill a bucket early.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local required = tonumber(ARGV[4])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if required < 0 or tokens >= required then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+def rate_limit_settings():
+    limits = getattr(settings, 'RATE_LIMITS', {})
+    return {
+        'enabled': limits.get('ENABLED', True),
+        'chat_user': limits.get('CHAT_USER', {'CAPACITY': 10, 'REFILL_PER_MINUTE': 20}),
+        'chat_anon': limits.get('CHAT_ANON', {'CAPACITY': 5, 'REFILL_PER_MINUTE': 6}),
+        'llm_tokens_per_hour': limits.get('LLM_TOKENS_PER_HOUR', 20000),
+    }
+
+
+class LocalBucketStore:
+    """Token buckets in this process only, for a single worker or development"""
+
+    def __init__(self, max_buckets=LOCAL_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost, required):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = required < 0 or tokens >= required
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class RedisBucketStore:
+    """Token buckets shared by every worker and node, updated atomically by a Lua script"""
+
+    def __init__(self):
+        self._script = None
+
+    def take(self, key, capacity, rate, cost, required):
+        from django_redis import get_redis_connection
+
+        if self._script is None:
+            self._script = get_redis_connection('default').register_script(TOKEN_BUCKET_SCRIPT)
+        allowed, tokens = self._script(
+            keys=[f'{BUCKET_KEY_PREFIX}{key}'], args=[capacity, rate, cost, required]
+        )
+        return bool(allowed), float(tokens)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def bucket_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = RedisBucketStore() if getattr(settings, 'USE_REDIS', False) else LocalBucketStore()
+        return _store
+
+
+def take_tokens(key, capacity, rate, cost=1, required=1):
+    """
+    Take ``cost`` tokens from the bucket ``key`` if at least ``required``
+    are left (always, if ``required`` is negative), refilling at ``rate``
+    tokens per second up to ``capacity``. Returns ``(allowed, seconds until
+    allowed)``. If Redis is unreachable the request is allowed: losing the
+    limit beats losing the chat.
+    """
+    try:
+        allowed, tokens = bucket_store().take(key, capacity, rate, cost, required)
+    except Exception as e:
+        logger.warning("Rate limit bucket %s unavailable: %s", key, e)
+        return True, 0
+    return allowed, 0 if allowed else (required - tokens) / rate
+
+
+def client_ident(request):
+    """The bucket owner of a request: the user, or the client address for anonymous callers"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    # Honours REST_FRAMEWORK's NUM_PROXIES for X-Forwarded-For
+    return f'ip:{BaseThrottle().get_ident(request)}'
+
+
+def llm_tokens_per_hour(user_id):
+    """The user's hourly LLM token quota: their UserPreference override or RATE_LIMITS' default"""
+    default = rate_limit_settings()['llm_tokens_per_hour']
+    if user_id is None:
+        return default
+    key = f'{QUOTA_CACHE_PREFIX}{user_id}'
+    override = cache.get(key)
+    if override is None:
+        override = UserPreference.objects.filter(user_id=user_id).values_list(
+            'llm_tokens_per_hour', flat=True
+        ).first()
+        # 0 stands for "no override", so users without one are cached too
+        cache.set(key, override or 0, 300)
+    return override or default
+
+
+def _llm_bucket(ident):
+    user_id = int(ident.split(':', 1)[1]) if ident.startswith('user:') else None
+    per_hour = llm_tokens_per_hour(user_id)
+    # The bucket holds an hour's worth of tokens
+    return f'llm:{ident}', per_hour, per_hour / 3600
+
+
+def charge_llm_tokens(ident, tokens):
+    """Charge generated tokens to a bucket owner; a long answer may leave the bucket in debt"""
+    if not tokens or not rate_limit_settings()['enabled']:
+        return
+    key, capacity, rate = _llm_bucket(ident)
+    take_tokens(key, capacity, rate, cost=tokens, required=-1)
+
+
+class ChatRateThrottle(BaseThrottle):
+    """
+    Token-bucket limit on chat requests per user, or per client address for
+    anonymous callers: bursts of CAPACITY, then REFILL_PER_MINUTE.
+    """
+    scope = 'chat'
+
+    def allow_request(self, request, view):
+        config = rate_limit_settings()
+        if not config['enabled']:
+            return True
+        ident = client_ident(request)
+        limit = config['chat_user'] if ident.startswith('user:') else config['chat_anon']
+        allowed, self._wait = take_tokens(
+            f'{self.scope}:{ident}',
+            limit['CAPACITY'], limit['REFILL_PER_MINUTE'] / 60,
+        )
+        return allowed
+
+    def wait(self):
+        return math.ceil(self._wait)
+
+
+class LLMTokenQuotaThrottle(BaseThrottle):
+    """
+    Refuse chat requests while the caller's LLM token bucket is empty. The
+    tokens are charged after the answer with ``charge_llm_tokens``, as the
+    cost is only known once the model has finished.
+    """
+
+    def allow_request(self, request, view):
+        if not rate_limit_settings()['enabled']:
+            return True
+        key, capacity, rate = _llm_bucket(client_ident(request))
+        allowed, self._wait = take_tokens(key, capacity, rate, cost=0, required=1)
+        return allowed
+
+    def wait(self):
+        return math.ceil(self._wait)
+
+
+# Checked in order, stopping at the first refusal: the quota check takes
+# nothing, so a request refused for its LLM quota isn't charged to its
+# request bucket as well
+CHAT_THROTTLES = (LLMTokenQuotaThrottle, ChatRateThrottle)
+
+
+def chat_throttle_wait(request, view=None):
+    """Seconds to wait if a chat throttle refuses the request, else None"""
+    for throttle_class in CHAT_THROTTLES:
+        throttle = throttle_class()
+        if not throttle.allow_request(request, view):
+            return throttle.wait()
+    return None
+
+
+@receiver(post_save, sender=UserPreference)
+@receiver(post_delete, sender=UserPreference)
+def user_preference_changed(sender, instance, **kwargs):
+    cache.delete(f'{QUOTA_CACHE_PREFIX}{instance.user_id}')
@@ -11,6 +11,7 @@ from . import views
 router = DefaultRouter()
 router.register(r'sessions', views.ChatSessionViewSet, basename='chatsession')
 router.register(r'documents', views.DocumentViewSet, basename='document')
+router.register(r'ingestion-jobs', views.IngestionJobViewSet, basename='ingestionjob')
 
 urlpatterns = [
     # Home page
@@ -19,6 +20,7 @@ urlpatterns = [
     # Authentication endpoints - REQUIRED BY TASK
     path('signup/', views.SignUpAPIView.as_view(), name='signup'),
     path('login/', views.LoginAPIView.as_view(), name='login'),
+    path('logout/', views.LogoutAPIView.as_view(), name='logout'),
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     
@@ -30,7 +32,12 @@ urlpatterns = [
     # Other endpoints
     path('preferences/', views.user_preferences, name='user-preferences'),
     path('health/', views.health_check, name='health-check'),
+    path('live', views.live, name='live'),
+    path('ready', views.ready, name='ready'),
+    path('llm-stats/', views.llm_stats, name='llm-stats'),
+    # No trailing slash: /api/metrics is where Prometheus is pointed
+    path('metrics', views.metrics, name='metrics'),
     
-    # Router URLs (sessions/, documents/)
+    # Router URLs (sessions/, documents/, ingestion-jobs/)
     path('', include(router.urls)),
 ]
\ No newline at end of file
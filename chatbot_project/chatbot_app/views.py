@@ -1,35 +1,57 @@
 # chatbot_app/views.py - Fixed imports section
 
 import json
+import logging
+import time
 import uuid
 import requests
 from datetime import datetime, timedelta
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
 from django.conf import settings
 from django.contrib.auth.models import User
-from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from django.db.models import Avg, Count, F, FloatField, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast, Coalesce
+from rest_framework import mixins, viewsets, status
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.exceptions import NotFound
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
 
 # Import your models
 from .models import (
-    ChatSession, ChatMessage, UserPreference, ChatbotConfig
+    ChatSession, ChatMessage, UserPreference, ChatbotConfig, Document, IngestionJob
 )
+from .archive import iter_archived_messages
+from .authentication import password_check_slot, revoke_token, revoke_user_tokens, tokens_for_user
+from .db import read_database
+from .extraction import text_sha256, upload_sha256
+from .metrics import CHAT_REQUESTS, LLM_COLD_LOADS, LLM_TOKENS, LLM_TOKENS_PER_SECOND, REGISTRY, span, trace
+from .ollama import conversation_context, model_options, model_traffic, store_conversation_context
+from .health import cached_health, check_database
+from .pagination import ChatMessagePagination, ChatSessionPagination, KeysetPagination
+from .permissions import IsStaffOrReadOnly
+from .tasks import start_ingestion
+from .throttling import CHAT_THROTTLES, charge_llm_tokens, chat_throttle_wait, client_ident
+
+logger = logging.getLogger(__name__)
 
 # Import serializers with error handling
 try:
     from .serializers import (
         UserRegistrationSerializer, UserLoginSerializer,
-        ChatSessionSerializer, ChatMessageSerializer,
+        ChatSessionSerializer, ChatSessionListSerializer, ChatMessageSerializer,
         UserPreferenceSerializer, ChatRequestSerializer,
-        UserSerializer, DocumentSerializer
+        UserSerializer, DocumentSerializer, DocumentListSerializer,
+        IngestionJobSerializer
     )
     SERIALIZERS_AVAILABLE = True
 except ImportError as e:
@@ -61,12 +83,13 @@ class SignUpAPIView(APIView):
         
         serializer = UserRegistrationSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.save()
+            with password_check_slot():
+                user = serializer.save()
             # Create user preferences
             UserPreference.objects.get_or_create(user=user)
             
             # Generate JWT tokens
-            refresh = RefreshToken.for_user(user)
+            refresh = tokens_for_user(user)
             return Response({
                 'message': 'User created successfully.',
                 'user': UserSerializer(user).data,
@@ -88,10 +111,13 @@ class LoginAPIView(APIView):
                           status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
         serializer = UserLoginSerializer(data=request.data)
-        if serializer.is_valid():
+        # Checking the password is the expensive part of a login
+        with password_check_slot():
+            valid = serializer.is_valid()
+        if valid:
             user = serializer.validated_data['user']
             # Generate JWT tokens
-            refresh = RefreshToken.for_user(user)
+            refresh = tokens_for_user(user)
             return Response({
                 'message': 'Login successful',
                 'user': UserSerializer(user).data,
@@ -103,6 +129,52 @@ class LoginAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class LogoutAPIView(APIView):
+    """Revoke the access token of this request and, if given, a refresh token
+
+    With ``"all": true`` every token issued to the user so far is revoked,
+    logging out all of their devices.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if request.data.get('all'):
+            revoke_user_tokens(request.user.pk)
+            return Response({'message': 'Logged out everywhere'})
+
+        if request.auth is not None:
+            revoke_token(request.auth)
+        if request.data.get('refresh'):
+            try:
+                refresh = RefreshToken(request.data['refresh'])
+            except TokenError:
+                return Response({'error': 'Invalid refresh token'}, status=status.HTTP_400_BAD_REQUEST)
+            if str(refresh.get('user_id')) != str(request.user.pk):
+                return Response({'error': 'Invalid refresh token'}, status=status.HTTP_400_BAD_REQUEST)
+            revoke_token(refresh)
+        return Response({'message': 'Logged out'})
+
+
+# Ollama reports durations in nanoseconds
+OLLAMA_DURATION_FIELDS = ('total_duration', 'load_duration', 'prompt_eval_duration', 'eval_duration')
+# A load_duration above this means the model had to be loaded into memory first
+COLD_LOAD_THRESHOLD_MS = 1000
+
+
+def ollama_timings(data):
+    """Token counts and timings of an Ollama /api/generate response, durations in milliseconds"""
+    timings = {
+        name.replace('_duration', '_ms'): round(data[name] / 1e6, 3)
+        for name in OLLAMA_DURATION_FIELDS if data.get(name) is not None
+    }
+    timings['prompt_eval_count'] = data.get('prompt_eval_count', 0)
+    timings['eval_count'] = data.get('eval_count', 0)
+    if timings['eval_count'] and timings.get('eval_ms'):
+        timings['tokens_per_second'] = round(timings['eval_count'] / (timings['eval_ms'] / 1000), 2)
+    timings['cold_load'] = timings.get('load_ms', 0) > COLD_LOAD_THRESHOLD_MS
+    return timings
+
+
 class ChatbotService:
     """Simplified chatbot service"""
     
@@ -110,31 +182,61 @@ class ChatbotService:
         self.base_url = getattr(settings, 'OLLAMA_BASE_URL', 'http://localhost:11434')
         self.default_model = getattr(settings, 'OLLAMA_MODEL', 'llama2')
     
-    def generate_response(self, message, model_name=None, system_prompt=None):
-        """Generate response from Ollama or fallback"""
+    def generate_response(self, message, model_name=None, system_prompt=None, context=None, on_token=None,
+                          session=None):
+        """Generate response from Ollama or fallback
+
+        With ``on_token`` the answer is streamed and every piece of text is
+        passed to it as soon as Ollama produces it. With a ChatSession and
+        OLLAMA_SETTINGS['CONVERSATION_CONTEXT'] the turn continues from the
+        context Ollama returned for the session's previous one.
+        """
         try:
             model = model_name or self.default_model
+            prompt = message
+            if context:
+                prompt = (
+                    f"Use the following documents to answer the question.\n\n{context}"
+                    f"\n\nQuestion: {message}"
+                )
             payload = {
                 "model": model,
-                "prompt": message,
-                "stream": False
+                "prompt": prompt,
+                "stream": on_token is not None,
+                "keep_alive": model_traffic.keep_alive(model),
+                "options": model_options()
             }
-            if system_prompt:
+            ollama_context = conversation_context(session, model, system_prompt)
+            if ollama_context:
+                # The system prompt is already part of the context
+                payload["context"] = ollama_context
+            elif system_prompt:
                 payload["system"] = system_prompt
             
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                json=payload,
-                timeout=10
-            )
+            with span('ollama.generate'):
+                response = requests.post(
+                    f"{self.base_url}/api/generate",
+                    json=payload,
+                    timeout=10,
+                    stream=on_token is not None
+                )
+                if response.status_code == 200:
+                    data = self.read_stream(response, on_token) if on_token else response.json()
             
             if response.status_code == 200:
-                data = response.json()
+                timings = ollama_timings(data)
+                LLM_TOKENS.inc(timings['eval_count'], model=model)
+                if 'tokens_per_second' in timings:
+                    LLM_TOKENS_PER_SECOND.observe(timings['tokens_per_second'], model=model)
+                if timings['cold_load']:
+                    LLM_COLD_LOADS.inc(model=model)
+                store_conversation_context(session, model, system_prompt, data.get('context'))
                 return {
                     'success': True,
                     'response': data.get('response', ''),
                     'model': model,
-                    'tokens': data.get('eval_count', 0)
+                    'tokens': data.get('eval_count', 0),
+                    'ollama': timings
                 }
             else:
                 return {
@@ -152,6 +254,23 @@ class ChatbotService:
                 'error': f'Unexpected error: {str(e)}'
             }
     
+    def read_stream(self, response, on_token):
+        """Pass each piece of a streamed answer to ``on_token``; returns the final chunk with the full text"""
+        parts = []
+        data = {}
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get('error'):
+                raise requests.exceptions.RequestException(chunk['error'])
+            if chunk.get('response'):
+                parts.append(chunk['response'])
+                on_token(chunk['response'])
+            if chunk.get('done'):
+                data = chunk
+        return dict(data, response=''.join(parts))
+    
     def get_fallback_response(self, message):
         """Intelligent fallback responses when AI is not available"""
         message_lower = message.lower()
@@ -173,11 +292,25 @@ class ChatbotService:
 class ChatAPIView(APIView):
     """Chat API endpoint"""
     permission_classes = [AllowAny]
+    throttle_classes = CHAT_THROTTLES
     
     def __init__(self):
         super().__init__()
         self.chatbot_service = ChatbotService()
     
+    def check_throttles(self, request):
+        # Unlike DRF's default, stop at the first refusal (see CHAT_THROTTLES)
+        wait = chat_throttle_wait(request, self)
+        if wait is not None:
+            self.throttled(request, wait)
+    
+    def retrieval_filters(self, request):
+        """
+        Document filters for RAG retrieval: the optional ``filters`` of the
+        request, always limited to public documents and the user's own
+        """
+        return chat_retrieval_filters(request.data.get('filters'), request.user)
+    
     def post(self, request):
         # Basic validation without serializer if needed
         data = request.data
@@ -189,71 +322,33 @@ class ChatAPIView(APIView):
         if len(message) > 2000:
             return Response({'error': 'Message too long'}, status=status.HTTP_400_BAD_REQUEST)
         
+        try:
+            filters = self.retrieval_filters(request)
+        except (TypeError, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        with trace() as timings, span('chat.total'):
+            return self.chat_turn(request, message, filters, timings)
+    
+    def chat_turn(self, request, message, filters, timings):
+        """Store the user's message, answer it and store the answer with its stage timings"""
+        data = request.data
         session_id = data.get('session_id') or str(uuid.uuid4())
+        started = time.perf_counter()
         
         # Get or create chat session
-        session, created = ChatSession.objects.get_or_create(
-            session_id=session_id,
-            defaults={
-                'user': request.user if request.user.is_authenticated else None,
-                'is_active': True
-            }
-        )
-        
-        # Save user message
-        user_message = ChatMessage.objects.create(
-            session=session,
-            message_type='user',
-            content=message
-        )
-        
-        # Get chatbot configuration
-        try:
-            config = ChatbotConfig.objects.filter(is_active=True).first()
-            system_prompt = config.system_prompt if config else None
-            model_to_use = config.model_name if config else None
-        except:
-            config = None
-            system_prompt = None
-            model_to_use = None
+        with span('chat.session'):
+            session = chat_session(session_id, request.user)
         
-        # Generate response
-        result = self.chatbot_service.generate_response(
-            message=message,
-            model_name=model_to_use,
-            system_prompt=system_prompt
+        use_rag = str(data.get('use_rag', True)).lower() not in ('false', '0')
+        bot_message, metadata = answer_in_session(
+            self.chatbot_service, session, message, filters, client_ident(request),
+            use_rag=use_rag, timings=timings, started=started,
         )
         
-        if result['success']:
-            bot_response = result['response']
-            metadata = {
-                'model_used': result['model'],
-                'tokens_used': result.get('tokens', 0),
-                'ai_available': True
-            }
-        else:
-            bot_response = self.chatbot_service.get_fallback_response(message)
-            metadata = {
-                'error': result['error'],
-                'fallback_used': True,
-                'ai_available': False
-            }
-        
-        # Save bot message
-        bot_message = ChatMessage.objects.create(
-            session=session,
-            message_type='bot',
-            content=bot_response,
-            metadata=metadata
-        )
-        
-        # Update session timestamp
-        session.updated_at = timezone.now()
-        session.save()
-        
         # Prepare response
         response_data = {
-            'response': bot_response,
+            'response': bot_message.content,
             'session_id': session_id,
             'timestamp': bot_message.timestamp.isoformat(),
             'model_used': metadata.get('model_used', 'fallback'),
@@ -266,38 +361,187 @@ class ChatAPIView(APIView):
         return Response(response_data, status=status.HTTP_200_OK)
 
 
+def chat_session(session_id, user):
+    """
+    The ChatSession ``session_id`` of ``user``, created on first use. A
+    session belongs to whoever created it, a user or anonymous callers;
+    anyone else gets NotFound rather than that conversation.
+    """
+    owner = user if user.is_authenticated else None
+    session, created = ChatSession.objects.get_or_create(
+        session_id=session_id,
+        defaults={
+            'user': owner,
+            'is_active': True
+        }
+    )
+    if session.user_id != (owner.pk if owner else None):
+        raise NotFound('Chat session not found')
+    return session
+
+
+def chat_retrieval_filters(filters, user):
+    """
+    Document filters for RAG retrieval: the caller's ``filters``, always
+    limited to public documents and the user's own
+    """
+    from .index_metadata import normalize_filters
+
+    filters = dict(filters or {})
+    # Owner 0 matches no user, leaving anonymous users the public documents
+    filters['user_id'] = user.id if user.is_authenticated else 0
+    return normalize_filters(filters)
+
+
+def answer_in_session(chatbot_service, session, message, filters, ident, use_rag=True,
+                      timings=None, started=None, on_token=None):
+    """
+    One chat turn in an existing session: store the user's message, answer
+    it and store the answer with its stage timings. Returns the bot's
+    ChatMessage and its metadata. ``on_token`` streams the answer as it is
+    generated; ``ident`` is charged for the generated tokens.
+    """
+    timings = {} if timings is None else timings
+    started = time.perf_counter() if started is None else started
+    
+    # Save user message
+    with span('chat.save_user_message'):
+        ChatMessage.objects.create(
+            session=session,
+            message_type='user',
+            content=message
+        )
+    
+    # Get chatbot configuration
+    try:
+        with span('chat.config'):
+            config = ChatbotConfig.objects.filter(is_active=True).first()
+        system_prompt = config.system_prompt if config else None
+        model_to_use = config.model_name if config else None
+    except:
+        config = None
+        system_prompt = None
+        model_to_use = None
+    
+    # Retrieve document context when the RAG pipeline is enabled
+    context = ''
+    if getattr(settings, 'USE_RAG_PIPELINE', False) and use_rag:
+        try:
+            from .rag_pipeline import get_rag_pipeline
+            with span('rag.retrieve'):
+                context = get_rag_pipeline().generate_rag_context(message, filters)
+        except Exception:
+            logger.exception('Error retrieving RAG context')
+    
+    # Generate response
+    result = chatbot_service.generate_response(
+        message=message,
+        model_name=model_to_use,
+        system_prompt=system_prompt,
+        context=context,
+        on_token=on_token,
+        session=session
+    )
+    
+    if result['success']:
+        charge_llm_tokens(ident, result.get('tokens'))
+        bot_response = result['response']
+        metadata = {
+            'model_used': result['model'],
+            'tokens_used': result.get('tokens', 0),
+            'ai_available': True,
+            'rag_used': bool(context),
+            'ollama': result.get('ollama', {})
+        }
+        if config:
+            metadata['config_id'] = config.id
+    else:
+        bot_response = chatbot_service.get_fallback_response(message)
+        metadata = {
+            'error': result['error'],
+            'fallback_used': True,
+            'ai_available': False
+        }
+    CHAT_REQUESTS.inc(outcome='ai' if result['success'] else 'fallback')
+    # Milliseconds per stage so far; the final two writes only reach the histograms
+    metadata['timings'] = dict(timings, total=round((time.perf_counter() - started) * 1000, 3))
+    
+    # Save bot message
+    with span('chat.save_bot_message'):
+        bot_message = ChatMessage.objects.create(
+            session=session,
+            message_type='bot',
+            content=bot_response,
+            metadata=metadata
+        )
+    
+    # Update session timestamp; a single-column UPDATE leaves fields such as
+    # archived_message_count to whoever else is changing them
+    with span('chat.session_update'):
+        session.updated_at = timezone.now()
+        ChatSession.objects.filter(pk=session.pk).update(updated_at=session.updated_at)
+    
+    return bot_message, metadata
+
+
+def with_message_count(sessions):
+    """Annotate sessions with their message count as a correlated subquery
+
+    A subquery keeps the session ordering index usable, unlike a JOIN with
+    GROUP BY which forces a sort of every matching session.
+    """
+    counts = ChatMessage.objects.filter(
+        session=OuterRef('pk')
+    ).order_by().values('session').annotate(total=Count('id')).values('total')
+    return sessions.annotate(
+        message_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+        + F('archived_message_count')
+    )
+
+
 # CHAT HISTORY ENDPOINT
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def chat_history(request):
-    """Get chat history for authenticated user"""
+    """Get a page of chat sessions for the authenticated user
+
+    Sessions are returned newest first without message bodies; pass the
+    returned ``next_cursor`` as ``?cursor=`` to fetch the following page and
+    use ``/api/sessions/<id>/messages/`` to page through a session's messages.
+    """
     try:
-        sessions = ChatSession.objects.filter(
+        sessions = ChatSession.objects.using(read_database()).filter(
             user=request.user,
             is_active=True
-        ).prefetch_related('messages').order_by('-updated_at')[:20]
-        
+        )
+        # Counted from the composite index, without the message counts
+        total_sessions = sessions.count()
+        sessions = with_message_count(sessions)
+
+        paginator = ChatSessionPagination()
+        page = paginator.paginate_queryset(sessions, request)
+
         if SERIALIZERS_AVAILABLE:
-            serializer = ChatSessionSerializer(sessions, many=True)
-            return Response({
-                'sessions': serializer.data,
-                'total_sessions': sessions.count()
-            })
+            sessions_data = ChatSessionListSerializer(page, many=True).data
         else:
             # Fallback without serializer
             sessions_data = []
-            for session in sessions:
+            for session in page:
                 sessions_data.append({
                     'id': session.id,
                     'session_id': session.session_id,
                     'created_at': session.created_at.isoformat(),
                     'updated_at': session.updated_at.isoformat(),
-                    'message_count': session.messages.count()
+                    'message_count': session.message_count
                 })
-            return Response({
-                'sessions': sessions_data,
-                'total_sessions': sessions.count()
-            })
+        return Response({
+            'sessions': sessions_data,
+            'total_sessions': total_sessions,
+            'next': paginator.get_next_link(),
+            'next_cursor': paginator.get_next_cursor()
+        })
+    except NotFound:
+        raise
     except Exception as e:
         return Response(
             {'error': f'Failed to retrieve chat history: {str(e)}'},
@@ -308,12 +552,21 @@ def chat_history(request):
 class ChatSessionViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for viewing chat sessions"""
     permission_classes = [IsAuthenticated]
-    
+    pagination_class = ChatSessionPagination
+
     def get_queryset(self):
-        return ChatSession.objects.filter(user=self.request.user).order_by('-updated_at')
-    
+        # Read-only, so it can be served from the replica
+        queryset = ChatSession.objects.using(read_database()).filter(user=self.request.user)
+        if self.action in ('list', 'retrieve'):
+            queryset = with_message_count(queryset)
+        return queryset.order_by('-updated_at', '-id')
+
     def get_serializer_class(self):
         if SERIALIZERS_AVAILABLE:
+            if self.action == 'list':
+                return ChatSessionListSerializer
+            if self.action == 'messages':
+                return ChatMessageSerializer
             return ChatSessionSerializer
         else:
             # Return a basic serializer
@@ -324,19 +577,48 @@ class ChatSessionViewSet(viewsets.ReadOnlyModelViewSet):
                     fields = '__all__'
             return BasicChatSessionSerializer
 
+    @action(detail=True, methods=['get'])
+    def messages(self, request, pk=None):
+        """Page through the messages of one session, oldest first
 
-# Add missing DocumentViewSet
-class DocumentViewSet(viewsets.ReadOnlyModelViewSet):
-    """ViewSet for documents (placeholder)"""
-    permission_classes = [IsAuthenticated]
+        Messages already moved to cold storage are read back from the archive
+        and merged in, so clients see one continuous history.
+        """
+        session = self.get_object()
+        paginator = ChatMessagePagination()
+        archived = None
+        if session.archived_message_count:
+            cursor = paginator.decode_cursor(request)
+            archived = iter_archived_messages(session, since=cursor[0] if cursor else None)
+        page = paginator.paginate_queryset(
+            ChatMessage.objects.filter(session=session), request, view=self, archived=archived
+        )
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class DocumentViewSet(viewsets.ModelViewSet):
+    """Upload and manage documents for the RAG pipeline
+
+    Files (PDF, Markdown, HTML, plain text) are stored under MEDIA_ROOT and
+    deduplicated by SHA-256; text extraction and embedding happen in a
+    background IngestionJob.
+    """
+    permission_classes = [IsAuthenticated, IsStaffOrReadOnly]
+    parser_classes = [MultiPartParser, FormParser, JSONParser]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
-        # Return empty queryset for now since Document model might not exist
-        from django.db import models
-        return models.QuerySet().none()
+        documents = Document.objects.filter(is_active=True)
+        if not self.request.user.is_staff:
+            # Owned documents are private to their owner
+            documents = documents.filter(Q(owner__isnull=True) | Q(owner=self.request.user))
+        return documents.order_by('-created_at', '-id')
     
     def get_serializer_class(self):
         if SERIALIZERS_AVAILABLE:
+            if self.action == 'list':
+                return DocumentListSerializer
             return DocumentSerializer
         else:
             from rest_framework import serializers
@@ -344,6 +626,77 @@ class DocumentViewSet(viewsets.ReadOnlyModelViewSet):
                 id = serializers.IntegerField()
                 title = serializers.CharField()
             return PlaceholderSerializer
+    
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        upload = serializer.validated_data.get('file')
+        if upload:
+            source_hash = upload_sha256(upload)
+        else:
+            source_hash = text_sha256(serializer.validated_data['content'])
+        
+        # Duplicates only within the owner and tenant the document is saved for,
+        # as neither may see the other's documents
+        existing = Document.objects.filter(
+            source_hash=source_hash,
+            owner=serializer.validated_data.get('owner'),
+            tenant=serializer.validated_data.get('tenant', ''),
+            is_active=True
+        ).first()
+        if existing:
+            return Response({
+                'document': self.get_serializer(existing).data,
+                'duplicate': True
+            }, status=status.HTTP_200_OK)
+        
+        document = serializer.save(source_hash=source_hash)
+        job = start_ingestion(document_ids=[document.id], user=request.user)
+        return Response({
+            'document': serializer.data,
+            'duplicate': False,
+            'ingestion_job': job.id
+        }, status=status.HTTP_201_CREATED)
+    
+    def perform_update(self, serializer):
+        changed = 'file' in serializer.validated_data or 'content' in serializer.validated_data
+        if 'file' in serializer.validated_data:
+            serializer.validated_data['source_hash'] = upload_sha256(serializer.validated_data['file'])
+        elif 'content' in serializer.validated_data:
+            serializer.validated_data['source_hash'] = text_sha256(serializer.validated_data['content'])
+        document = serializer.save()
+        if changed:
+            start_ingestion(document_ids=[document.id], user=self.request.user)
+        else:
+            from .rag_pipeline import documents_changed
+            # Owner, tenant or type may have changed what retrieval may return
+            documents_changed(documents=[document])
+    
+    def perform_destroy(self, instance):
+        from .rag_pipeline import documents_changed
+        # Soft delete: inactive documents drop out of retrieval and the next index rebuild
+        instance.is_active = False
+        instance.save(update_fields=['is_active', 'updated_at'])
+        documents_changed(removed_ids=[instance.id])
+
+
+class IngestionJobViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """Start background document ingestion and watch its progress"""
+    permission_classes = [IsAuthenticated]
+    serializer_class = IngestionJobSerializer if SERIALIZERS_AVAILABLE else None
+    
+    def get_queryset(self):
+        jobs = IngestionJob.objects.all()
+        if not self.request.user.is_staff:
+            jobs = jobs.filter(created_by=self.request.user)
+        return jobs.order_by('-created_at')
+    
+    def perform_create(self, serializer):
+        serializer.instance = start_ingestion(
+            document_ids=serializer.validated_data['document_ids'],
+            user=self.request.user
+        )
 
 
 @api_view(['GET', 'POST'])
@@ -393,40 +746,117 @@ def user_preferences(request):
             return Response({'message': 'Preferences updated'})
 
 
+def _ollama_number(field):
+    return Cast(KT(f'metadata__ollama__{field}'), FloatField())
+
+
+def llm_usage(messages, group_field):
+    """
+    Aggregate the Ollama timings of bot messages per value of a metadata
+    field: message and token counts, generation speed, prompt evaluation
+    cost and how often the model had to be loaded first
+    """
+    rows = messages.annotate(group=KT(f'metadata__{group_field}')).values('group').annotate(
+        messages=Count('id'),
+        tokens=Sum(_ollama_number('eval_count')),
+        eval_ms=Sum(_ollama_number('eval_ms')),
+        prompt_tokens=Sum(_ollama_number('prompt_eval_count')),
+        prompt_eval_ms=Sum(_ollama_number('prompt_eval_ms')),
+        avg_total_ms=Avg(_ollama_number('total_ms')),
+        avg_load_ms=Avg(_ollama_number('load_ms')),
+        cold_loads=Count('id', filter=Q(metadata__ollama__cold_load=True)),
+    ).order_by('group')
+
+    stats = []
+    for row in rows:
+        tokens, prompt_tokens = row['tokens'] or 0, row['prompt_tokens'] or 0
+        stats.append({
+            group_field: row['group'],
+            'messages': row['messages'],
+            'tokens': int(tokens),
+            'tokens_per_second': round(tokens / (row['eval_ms'] / 1000), 2) if row['eval_ms'] else None,
+            'prompt_tokens': int(prompt_tokens),
+            'avg_prompt_eval_ms': round((row['prompt_eval_ms'] or 0) / row['messages'], 3),
+            'prompt_eval_ms_per_token': round(row['prompt_eval_ms'] / prompt_tokens, 3) if prompt_tokens else None,
+            'avg_total_ms': round(row['avg_total_ms'], 3) if row['avg_total_ms'] is not None else None,
+            'avg_load_ms': round(row['avg_load_ms'], 3) if row['avg_load_ms'] is not None else None,
+            'cold_loads': row['cold_loads'],
+            'cold_load_rate': round(row['cold_loads'] / row['messages'], 4),
+        })
+    return stats
+
+
 @api_view(['GET'])
-@permission_classes([AllowAny])
-def health_check(request):
-    """Health check endpoint"""
+@permission_classes([IsAdminUser])
+def llm_stats(request):
+    """Ollama usage and timing statistics by model and by ChatbotConfig
+
+    Covers bot messages of the last ``?days=`` days (default 7) that have
+    Ollama timings; archived messages are not included.
+    """
     try:
-        session_count = ChatSession.objects.count()
-        
-        # Test Ollama connection
-        chatbot_service = ChatbotService()
-        try:
-            ollama_status = requests.get(f"{chatbot_service.base_url}/api/tags", timeout=3)
-            ollama_available = ollama_status.status_code == 200
-            ollama_models = ollama_status.json() if ollama_available else []
-        except:
-            ollama_available = False
-            ollama_models = []
-        
-        return Response({
-            'status': 'healthy',
-            'database': 'connected',
-            'total_sessions': session_count,
-            'ollama': {
-                'available': ollama_available,
-                'models': ollama_models
-            },
-            'serializers_available': SERIALIZERS_AVAILABLE,
-            'timestamp': timezone.now()
-        })
+        days = int(request.query_params.get('days', 7))
+    except ValueError:
+        return Response({'error': 'days must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    if not 1 <= days <= 365:
+        return Response({'error': 'days must be between 1 and 365'}, status=status.HTTP_400_BAD_REQUEST)
+
+    since = timezone.now() - timedelta(days=days)
+    messages = ChatMessage.objects.filter(
+        timestamp__gte=since, message_type='bot', metadata__has_key='ollama'
+    )
+    by_config = llm_usage(messages, 'config_id')
+    configs = ChatbotConfig.objects.in_bulk(
+        [int(row['config_id']) for row in by_config if row['config_id'] is not None]
+    )
+    for row in by_config:
+        config = configs.get(int(row['config_id'])) if row['config_id'] is not None else None
+        row['config_id'] = config.id if config else None
+        row['config_name'] = config.name if config else None
+    return Response({
+        'since': since,
+        'by_model': llm_usage(messages, 'model_used'),
+        'by_config': by_config,
+    })
+
+
+@require_http_methods(['GET'])
+def metrics(request):
+    """Prometheus metrics of this process, in the text exposition format"""
+    token = getattr(settings, 'METRICS_AUTH_TOKEN', '')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=401)
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def live(request):
+    """Liveness probe: the process is up and serving requests; no I/O"""
+    return JsonResponse({'status': 'alive'})
+
+
+def ready(request):
+    """Readiness probe: the database answers, so requests can be served"""
+    try:
+        database = check_database()
     except Exception as e:
-        return Response({
-            'status': 'unhealthy',
-            'error': str(e),
-            'timestamp': timezone.now()
-        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return JsonResponse({'status': 'not ready', 'error': str(e)}, status=503)
+    return JsonResponse({'status': 'ready', 'database_latency_ms': database['latency_ms']})
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def health_check(request):
+    """Deep health check: database and Ollama latency, RAG index and ingestion queue
+
+    Results come from the cache, refreshed in the background every
+    HEALTH_CHECK['INTERVAL'] seconds by one process of the fleet, so probes
+    don't cost a database count or an Ollama call each.
+    """
+    result = cached_health()
+    return Response(
+        dict(result, serializers_available=SERIALIZERS_AVAILABLE, timestamp=timezone.now()),
+        status=status.HTTP_503_SERVICE_UNAVAILABLE if result['status'] == 'unhealthy' else status.HTTP_200_OK
+    )
 
 
 @csrf_exempt
@@ -440,10 +870,16 @@ def simple_chat(request):
         if not message:
             return JsonResponse({'error': 'Message is required'}, status=400)
         
+        wait = chat_throttle_wait(request)
+        if wait is not None:
+            return JsonResponse({'error': 'Rate limit exceeded', 'retry_after': wait},
+                                status=429, headers={'Retry-After': str(wait)})
+        
         chatbot_service = ChatbotService()
         result = chatbot_service.generate_response(message)
         
         if result['success']:
+            charge_llm_tokens(client_ident(request), result.get('tokens'))
             return JsonResponse({
                 'response': result['response'],
                 'status': 'success',
@@ -0,0 +1,302 @@
+# chatbot_app/websocket.py
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.contrib.auth.models import AnonymousUser
+from django.db import close_old_connections
+from rest_framework.exceptions import NotFound
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+
+from .authentication import CachedJWTAuthentication, is_revoked
+from .metrics import span, trace
+from .throttling import chat_throttle_wait, client_ident
+from .views import ChatbotService, answer_in_session, chat_retrieval_filters, chat_session
+
+logger = logging.getLogger(__name__)
+
+CHAT_PATH = '/ws/chat/'
+MAX_MESSAGE_LENGTH = 2000
+# Close codes 4000-4999 are left to applications; these mirror HTTP statuses
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_NOT_FOUND = 4404
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def websocket_settings():
+    websocket = getattr(settings, 'WEBSOCKET_CHAT', {})
+    return {
+        'max_concurrent_turns': websocket.get('MAX_CONCURRENT_TURNS', 16),
+        'max_turns_per_connection': websocket.get('MAX_TURNS_PER_CONNECTION', 4),
+        'max_sessions_per_connection': websocket.get('MAX_SESSIONS_PER_CONNECTION', 32),
+    }
+
+
+def turn_executor():
+    """
+    Threads the chat turns of this worker run on. A turn spends most of its
+    time waiting for Ollama, so it gets a thread of its own instead of
+    holding up Django's single thread for sync code.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=websocket_settings()['max_concurrent_turns'], thread_name_prefix='chat-turn'
+            )
+        return _executor
+
+
+def _headers(scope):
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+
+
+def _same_origin(headers):
+    """Whether a browser opened the socket from one of our own pages, as Django's CSRF check decides it"""
+    origin = headers.get('origin')
+    if not origin:
+        return True  # Not a browser
+    return origin in settings.CSRF_TRUSTED_ORIGINS or urlparse(origin).netloc == headers.get('host')
+
+
+def authenticate(scope):
+    """
+    The user of a new connection and the validated JWT access token it
+    came with, from ``?token=``, else the user of the session cookie and
+    None. Returns (None, None) to refuse the connection.
+    """
+    headers = _headers(scope)
+    token = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('token')
+    if token:
+        authentication = CachedJWTAuthentication()
+        try:
+            validated_token = authentication.get_validated_token(token[0])
+            return authentication.get_user(validated_token), validated_token
+        except (AuthenticationFailed, TokenError):
+            return None, None
+
+    # Browsers send cookies with cross-site sockets too
+    session_cookie = SimpleCookie(headers.get('cookie', '')).get(settings.SESSION_COOKIE_NAME)
+    if session_cookie is None or not _same_origin(headers):
+        return AnonymousUser(), None
+    session = import_module(settings.SESSION_ENGINE).SessionStore(session_cookie.value)
+    return get_user(SimpleNamespace(session=session)), None
+
+
+def token_still_valid(token):
+    """Whether a connection's access token has neither expired nor been revoked since it connected"""
+    return token is None or (token['exp'] > time.time() and not is_revoked(token))
+
+
+def _client_meta(scope, headers):
+    """The request.META entries the throttles identify anonymous clients by"""
+    client = scope.get('client') or ('', 0)
+    meta = {'REMOTE_ADDR': client[0]}
+    if 'x-forwarded-for' in headers:
+        meta['HTTP_X_FORWARDED_FOR'] = headers['x-forwarded-for']
+    return meta
+
+
+class ChatConnection:
+    """
+    One chat WebSocket: the user it authenticated as once, the sessions it
+    has resolved, and its turns in flight. Several conversations can share a
+    connection, each message naming its ``session_id``.
+    """
+
+    def __init__(self, send, user, meta, token=None):
+        self._send = send
+        self._send_lock = asyncio.Lock()
+        self.user = user
+        self.token = token
+        self.closed = False
+        # What the throttles read from a request
+        self.request = SimpleNamespace(user=user, META=meta)
+        self.ident = client_ident(self.request)
+        self.settings = websocket_settings()
+        self.service = ChatbotService()
+        self.sessions = OrderedDict()
+        self._sessions_lock = threading.Lock()
+        self.tasks = set()
+
+    async def send_json(self, payload):
+        async with self._send_lock:
+            await self._send({'type': 'websocket.send', 'text': json.dumps(payload)})
+
+    async def receive(self, text):
+        if self.closed:
+            return
+        # A socket outlives its token, so the token is checked again for every message
+        if not await sync_to_async(token_still_valid)(self.token):
+            self.closed = True
+            await self.send_json({'type': 'error', 'error': 'Token expired or revoked'})
+            async with self._send_lock:
+                await self._send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+            return
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            await self.send_json({'type': 'error', 'error': 'Messages must be JSON objects'})
+            return
+        request_id = str(data.get('request_id') or uuid.uuid4())
+        if len(self.tasks) >= self.settings['max_turns_per_connection']:
+            await self.send_json({'type': 'error', 'request_id': request_id, 'error': 'Too many messages in progress'})
+            return
+        task = asyncio.ensure_future(self.turn(request_id, data))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def turn(self, request_id, data):
+        message = str(data.get('message') or '').strip()
+        if not message:
+            await self.send_json({'type': 'error', 'request_id': request_id, 'error': 'Message is required'})
+            return
+        if len(message) > MAX_MESSAGE_LENGTH:
+            await self.send_json({'type': 'error', 'request_id': request_id, 'error': 'Message too long'})
+            return
+        try:
+            filters = chat_retrieval_filters(data.get('filters'), self.user)
+        except (TypeError, ValueError) as e:
+            await self.send_json({'type': 'error', 'request_id': request_id, 'error': str(e)})
+            return
+        session_id = str(data.get('session_id') or uuid.uuid4())
+        use_rag = str(data.get('use_rag', True)).lower() not in ('false', '0')
+
+        loop = asyncio.get_running_loop()
+        tokens = asyncio.Queue()
+
+        def on_token(text):
+            loop.call_soon_threadsafe(tokens.put_nowait, text)
+
+        def run():
+            try:
+                return self.run_turn(request_id, session_id, message, filters, use_rag, on_token)
+            finally:
+                loop.call_soon_threadsafe(tokens.put_nowait, None)
+
+        await self.send_json({'type': 'start', 'request_id': request_id, 'session_id': session_id})
+        result = loop.run_in_executor(turn_executor(), run)
+        while True:
+            text = await tokens.get()
+            if text is None:
+                break
+            await self.send_json({'type': 'token', 'request_id': request_id, 'token': text})
+        try:
+            payload = await result
+        except Exception:
+            logger.exception('Error answering a WebSocket chat message')
+            payload = {'type': 'error', 'request_id': request_id, 'error': 'Internal error'}
+        await self.send_json(payload)
+
+    def run_turn(self, request_id, session_id, message, filters, use_rag, on_token):
+        """A chat turn on a worker thread; returns the message to send when it is done"""
+        try:
+            wait = chat_throttle_wait(self.request)
+            if wait is not None:
+                return {'type': 'error', 'request_id': request_id, 'error': 'Rate limit exceeded', 'retry_after': wait}
+
+            with trace() as timings, span('chat.total'):
+                started = time.perf_counter()
+                with span('chat.session'):
+                    try:
+                        session = self.resolve_session(session_id)
+                    except NotFound as e:
+                        return {'type': 'error', 'request_id': request_id, 'error': str(e.detail)}
+                bot_message, metadata = answer_in_session(
+                    self.service, session, message, filters, self.ident,
+                    use_rag=use_rag, timings=timings, started=started, on_token=on_token,
+                )
+            payload = {
+                'type': 'done',
+                'request_id': request_id,
+                'session_id': session_id,
+                'response': bot_message.content,
+                'timestamp': bot_message.timestamp.isoformat(),
+                'model_used': metadata.get('model_used', 'fallback'),
+                'ai_available': metadata.get('ai_available', False),
+            }
+            if metadata.get('tokens_used'):
+                payload['tokens_used'] = metadata['tokens_used']
+            return payload
+        finally:
+            # What the end of an HTTP request would do for this thread
+            close_old_connections()
+
+    def resolve_session(self, session_id):
+        """
+        The ChatSession for ``session_id``, looked up once per connection;
+        NotFound if it belongs to someone else
+        """
+        with self._sessions_lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                self.sessions.move_to_end(session_id)
+                return session
+        session = chat_session(session_id, self.user)
+        with self._sessions_lock:
+            self.sessions[session_id] = session
+            while len(self.sessions) > self.settings['max_sessions_per_connection']:
+                self.sessions.popitem(last=False)
+        return session
+
+    def close(self):
+        # Turns already on a thread still finish and store their answer
+        for task in self.tasks:
+            task.cancel()
+
+
+async def chat_websocket(scope, receive, send):
+    """
+    ASGI app for ``/ws/chat/``. Clients send ``{"message", "session_id",
+    "request_id"}`` objects and get back ``start``, a ``token`` per piece of
+    the answer, then ``done`` with the stored answer, or ``error``; every
+    reply carries the ``request_id`` it belongs to.
+    """
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+    user, token = await sync_to_async(authenticate)(scope)
+    if user is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        return
+    await send({'type': 'websocket.accept'})
+
+    connection = ChatConnection(send, user, _client_meta(scope, _headers(scope)), token)
+    try:
+        while True:
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                break
+            if event['type'] == 'websocket.receive':
+                text = event.get('text')
+                if text is None:
+                    text = (event.get('bytes') or b'').decode('utf-8', 'replace')
+                await connection.receive(text)
+    finally:
+        connection.close()
+
+
+async def websocket_application(scope, receive, send):
+    """Route WebSocket connections by path; Django's own ASGI handler only serves HTTP"""
+    if scope['path'] == CHAT_PATH:
+        await chat_websocket(scope, receive, send)
+        return
+    event = await receive()
+    if event['type'] == 'websocket.connect':
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
@@ -1,5 +1,8 @@
-# Comment out or remove this line temporarily
-# from .celery import app as celery_app
-# __all__ = ('celery_app',)
+# Load the Celery app when Celery is installed so that @shared_task uses it.
+# Without Celery the maintenance jobs run under APScheduler (run_scheduler).
+try:
+    from chatbot_app.celery import app as celery_app
+except ImportError:
+    celery_app = None
 
-# Keep the file empty for now
\ No newline at end of file
+__all__ = ('celery_app',)
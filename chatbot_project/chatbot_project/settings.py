@@ -39,6 +39,8 @@ LOCAL_APPS = [
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
+    # Removes itself unless REQUEST_PROFILING is enabled
+    'chatbot_app.profiling.ProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -70,12 +72,60 @@ TEMPLATES = [
 WSGI_APPLICATION = 'chatbot_project.wsgi.application'
 
 # Database
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Database: SQLite unless DB_ENGINE=postgresql
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'chatbot'),
+            'USER': os.getenv('DB_USER', 'chatbot'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            # Reuse each worker's connection across requests instead of
+            # reconnecting every time, checking it is still alive first
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            # Set DB_POOLER when connecting through PgBouncer in transaction
+            # mode, where server-side cursors don't survive the transaction
+            'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_POOLER', 'False') == 'True',
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '5')),
+                'application_name': 'chatbot',
+                # Notice dead peers on long-lived connections
+                'keepalives': 1,
+                'keepalives_idle': 30,
+                'keepalives_interval': 10,
+                'keepalives_count': 3,
+            },
+            'TEST': {'NAME': os.getenv('DB_TEST_NAME', 'test_chatbot')},
+        }
+    }
+    # Optional read replica for read-only views such as chat history
+    if os.getenv('DB_REPLICA_HOST'):
+        DATABASES['replica'] = dict(
+            DATABASES['default'],
+            HOST=os.getenv('DB_REPLICA_HOST'),
+            PORT=os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+            TEST={'MIRROR': 'default'},
+        )
+        DATABASE_ROUTERS = ['chatbot_app.db.PrimaryReplicaRouter']
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '0')),
+            # Seconds to wait for the write lock
+            'OPTIONS': {'timeout': 20},
+        }
     }
-}
+
+# WAL journal for SQLite (chatbot_app.db), so chat reads don't wait for writes.
+# It is persisted in the database file, so leave it off for a checked-in database.
+SQLITE_WAL = os.getenv('SQLITE_WAL', 'False') == 'True'
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -112,7 +162,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'chatbot_app.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -134,6 +184,45 @@ SIMPLE_JWT = {
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_OBTAIN_SERIALIZER': 'chatbot_app.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'chatbot_app.authentication.RevocableTokenRefreshSerializer',
+}
+
+# How authenticated requests find their user; revocations are kept in the
+# cache, so they only reach every worker with a shared cache (USE_REDIS)
+AUTH_SETTINGS = {
+    # 'database' (a query per request), 'cached' or 'claims' (trust the signed token)
+    'JWT_USER_MODE': os.getenv('JWT_USER_MODE', 'cached'),
+    'USER_CACHE_TIMEOUT': 60,
+    # Password hashes allowed at once per process; more wait up to PASSWORD_CHECK_WAIT seconds, then get a 429
+    'PASSWORD_CHECK_CONCURRENCY': int(os.getenv('PASSWORD_CHECK_CONCURRENCY', '4')),
+    'PASSWORD_CHECK_WAIT': 2,
+}
+
+# Token-bucket limits on the chat endpoints, per user or per client address
+# for anonymous callers. Buckets are shared through Redis with USE_REDIS and
+# kept per process otherwise.
+RATE_LIMITS = {
+    'ENABLED': os.getenv('RATE_LIMITS_ENABLED', 'True') == 'True',
+    # Bursts of CAPACITY chat requests, then REFILL_PER_MINUTE
+    'CHAT_USER': {'CAPACITY': 10, 'REFILL_PER_MINUTE': 20},
+    'CHAT_ANON': {'CAPACITY': 5, 'REFILL_PER_MINUTE': 6},
+    # Generated tokens; UserPreference.llm_tokens_per_hour overrides it per user
+    'LLM_TOKENS_PER_HOUR': int(os.getenv('LLM_TOKENS_PER_HOUR', '20000')),
+}
+
+# Deep health check at /api/health/, refreshed in the background every INTERVAL seconds
+HEALTH_CHECK = {
+    'INTERVAL': int(os.getenv('HEALTH_CHECK_INTERVAL', '15')),
+    'OLLAMA_TIMEOUT': 2,
+}
+
+# WebSocket chat at /ws/chat/ (chatbot_app.websocket, served by asgi.py)
+WEBSOCKET_CHAT = {
+    # Chat turns answered at once per worker process; each holds a thread while Ollama generates
+    'MAX_CONCURRENT_TURNS': int(os.getenv('WEBSOCKET_MAX_CONCURRENT_TURNS', '16')),
+    'MAX_TURNS_PER_CONNECTION': 4,
+    'MAX_SESSIONS_PER_CONNECTION': 32,
 }
 
 # CORS settings
@@ -153,13 +242,44 @@ CSRF_TRUSTED_ORIGINS = [
     'http://127.0.0.1:8000',
 ]
 
-# Cache (simple in-memory)
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# Cache: per-process memory by default; with USE_REDIS one Redis cache shared
+# by every worker and node, fronted by a short-lived per-process copy
+USE_REDIS = os.getenv('USE_REDIS', 'False') == 'True'
+REDIS_CACHE_URL = os.getenv('REDIS_CACHE_URL', 'redis://localhost:6379/1')
+
+if USE_REDIS:
+    CACHES = {
+        'default': {
+            'BACKEND': 'chatbot_app.cache.NearCache',
+            'LOCATION': REDIS_CACHE_URL,
+            'KEY_PREFIX': 'chatbot',
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                'PICKLE_VERSION': -1,  # Highest protocol: smaller and faster than the default
+                'COMPRESSOR': 'django_redis.compressors.zlib.ZlibCompressor',
+                'CONNECTION_POOL_KWARGS': {
+                    'max_connections': int(os.getenv('REDIS_MAX_CONNECTIONS', '50')),
+                    'health_check_interval': 30,
+                    'retry_on_timeout': True,
+                },
+                'SOCKET_CONNECT_TIMEOUT': 1,
+                'SOCKET_TIMEOUT': 1,
+                # A Redis outage degrades to cache misses instead of errors
+                'IGNORE_EXCEPTIONS': True,
+                'NEAR_CACHE_MAX_ENTRIES': int(os.getenv('NEAR_CACHE_MAX_ENTRIES', '1000')),
+                'NEAR_CACHE_TIMEOUT': int(os.getenv('NEAR_CACHE_TIMEOUT', '5')),
+            },
+        }
+    }
+    # Sessions are read from Redis and only written through to the database
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        }
     }
-}
 
 # Email settings
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -168,7 +288,150 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama2')
 
+# Model residency and prompt reuse (chatbot_app.ollama)
+OLLAMA_SETTINGS = {
+    # Seconds Ollama keeps a model loaded after a request: enough to cover the
+    # longest gap between its requests over the last TRAFFIC_WINDOW seconds
+    'KEEP_ALIVE_MIN': int(os.getenv('OLLAMA_KEEP_ALIVE_MIN', '300')),
+    'KEEP_ALIVE_MAX': int(os.getenv('OLLAMA_KEEP_ALIVE_MAX', '3600')),
+    'TRAFFIC_WINDOW': 3600,
+    # Load the active ChatbotConfig's model when a server process starts
+    'PREWARM': os.getenv('OLLAMA_PREWARM', 'False') == 'True',
+    'PREWARM_TIMEOUT': 120,
+    # Context window sent with every request (Ollama's default is 2048)
+    'NUM_CTX': int(os.getenv('OLLAMA_NUM_CTX', '2048')),
+    # Continue each chat session from the context Ollama returned for its
+    # previous turn, so the model remembers earlier turns and their documents,
+    # while that leaves CONTEXT_RESERVE_TOKENS of NUM_CTX for the next turn.
+    # Off, each turn stands alone and shares only the cached system prompt.
+    'CONVERSATION_CONTEXT': os.getenv('OLLAMA_CONVERSATION_CONTEXT', 'False') == 'True',
+    'CONTEXT_RESERVE_TOKENS': 1024,
+    'CONTEXT_TIMEOUT': 1800,
+}
+
+# Prometheus metrics at /api/metrics; when set, scrapers must send
+# "Authorization: Bearer <token>"
+METRICS_AUTH_TOKEN = os.getenv('METRICS_AUTH_TOKEN', '')
+
+# Sampled request profiling: stacks in folded (flamegraph) format and SQL
+# counts per request under OUTPUT_DIR; summarize with `manage.py profile_summary`
+REQUEST_PROFILING = {
+    'ENABLED': os.getenv('REQUEST_PROFILING', 'False') == 'True',
+    'SAMPLE_RATE': float(os.getenv('REQUEST_PROFILING_SAMPLE_RATE', '0.01')),
+    'INTERVAL_MS': 5,
+    'PATH_PREFIXES': ['/api/'],
+    'OUTPUT_DIR': BASE_DIR / 'profiles',
+    'MAX_CONCURRENT': 2,  # Requests sampled at the same time
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'chatbot_app': {
+            'handlers': ['console'],
+            'level': os.getenv('CHATBOT_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
+# RAG pipeline
+# EMBEDDING_MODEL, VECTOR_DIMENSION and the chunking settings seed the first
+# embedding generation; later changes are rolled out with
+# `manage.py embedding_generations create` and `activate`
+RAG_SETTINGS = {
+    'EMBEDDING_MODEL': os.getenv('RAG_EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2'),
+    'VECTOR_DIMENSION': 384,
+    'TOP_K_RESULTS': 3,
+    'SIMILARITY_THRESHOLD': 0.7,
+    'INDEX_SNAPSHOT_DIR': BASE_DIR / 'rag_index',
+    'REEMBED_BATCH_SIZE': 100,
+    'CHUNK_SIZE': 1000,  # Characters per embedded chunk
+    'CHUNK_OVERLAP': 100,
+    'EMBED_BATCH_SIZE': 32,  # Chunks per encoder call
+    'INGEST_BATCH_SIZE': 20,  # Documents per ingestion step
+    # 'none' (float32), 'int8' (scalar quantization) or 'binary' (Hamming search
+    # with int8 rescoring); applies to new embedding generations
+    'QUANTIZATION': os.getenv('RAG_QUANTIZATION', 'none'),
+    'RESCORE_FACTOR': 10,  # Binary mode shortlists TOP_K_RESULTS * this many candidates
+    # Concurrent queries are collected for up to QUERY_BATCH_WAIT_MS (0 disables
+    # batching) or QUERY_BATCH_SIZE queries, then encoded and searched together
+    'QUERY_BATCH_WAIT_MS': 5,
+    'QUERY_BATCH_SIZE': 32,
+    'QUERY_BATCH_TIMEOUT': 30,  # Seconds a request waits for its batch
+    # Seconds retrieval results are cached per normalized query, filters and
+    # index revision (0 disables); ingestion invalidates them immediately
+    'RETRIEVAL_CACHE_TIMEOUT': 300,
+    # 'sentence-transformers' (PyTorch) or 'onnx' (ONNX Runtime, no torch import);
+    # an ONNX model directory is created with `manage.py export_onnx_encoder`
+    'ENCODER': {
+        'BACKEND': os.getenv('RAG_ENCODER_BACKEND', 'sentence-transformers'),
+        'ONNX_MODEL_DIR': os.getenv('RAG_ONNX_MODEL_DIR', str(BASE_DIR / 'onnx_encoder')),
+        'ONNX_FILE': os.getenv('RAG_ONNX_FILE', 'model.onnx'),  # model_quantized.onnx for int8
+        'THREADS': int(os.getenv('RAG_ENCODER_THREADS', '1')),
+    },
+}
+
+# Document uploads (DocumentViewSet)
+DOCUMENT_UPLOADS = {
+    'MAX_UPLOAD_BYTES': 50 * 1024 * 1024,
+    'MAX_CONTENT_CHARS': 5_000_000,  # Extracted text kept per document
+    'READ_CHUNK_BYTES': 64 * 1024,
+}
+
+# Chat history retention (cleanup_old_chat_history)
+CHAT_RETENTION = {
+    'DEFAULT_DAYS': int(os.getenv('CHAT_RETENTION_DAYS', '30')),
+    'BATCH_SIZE': 1000,
+    'BATCH_PAUSE_SECONDS': 0.05,
+    'MAX_RUNTIME_SECONDS': 600,
+}
+
+# Cold storage for old chat messages (archive_old_chat_messages)
+CHAT_ARCHIVE = {
+    'ENABLED': os.getenv('CHAT_ARCHIVE_ENABLED', 'False') == 'True',
+    'ARCHIVE_AFTER_DAYS': int(os.getenv('CHAT_ARCHIVE_AFTER_DAYS', '14')),
+    'DIRECTORY': 'chat_archive',  # Relative to MEDIA_ROOT
+    'BATCH_SIZE': 1000,
+}
+
+# Celery (run with: celery -A chatbot_project worker -B)
+USE_CELERY = os.getenv('USE_CELERY', 'False') == 'True'
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', CELERY_BROKER_URL)
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', 'False') == 'True'
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Periodic maintenance jobs, scheduled by Celery beat when USE_CELERY is on
+# and otherwise by APScheduler (manage.py run_scheduler, or in-process when
+# SCHEDULER_AUTOSTART is set). Times are crontab fields in TIME_ZONE.
+MAINTENANCE_SCHEDULE = {
+    'archive-old-chat-messages': {
+        'task': 'chatbot_app.tasks.archive_old_chat_messages',
+        'schedule': {'hour': 1, 'minute': 30},
+    },
+    'cleanup-old-chat-history': {
+        'task': 'chatbot_app.tasks.cleanup_old_chat_history',
+        'schedule': {'hour': 2, 'minute': 0},
+    },
+    'cleanup-expired-tokens': {
+        'task': 'chatbot_app.tasks.cleanup_expired_tokens',
+        'schedule': {'hour': 3, 'minute': 0},
+    },
+    'compact-rag-index': {
+        'task': 'chatbot_app.tasks.compact_rag_index',
+        'schedule': {'hour': 4, 'minute': 0},
+    },
+    'reembed-stale-documents': {
+        'task': 'chatbot_app.tasks.reembed_stale_documents',
+        'schedule': {'minute': '*/15'},
+    },
+}
+SCHEDULER_AUTOSTART = os.getenv('SCHEDULER_AUTOSTART', 'False') == 'True'
+
 # Feature flags (disable problematic features for now)
-USE_CELERY = False
-USE_REDIS = False
 USE_RAG_PIPELINE = False
\ No newline at end of file